@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from admin_side.rollups import rebuild
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the dashboard's sales rollup tables from Order/OrderItem "
+        "(backfill after deploy, or repair a date range)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="First day to rebuild (YYYY-MM-DD). Default: first order.")
+        parser.add_argument("--until", help="Last day to rebuild (YYYY-MM-DD). Default: today.")
+        parser.add_argument("--days", type=int, help="Rebuild only the last N days (overrides --since).")
+        parser.add_argument("--chunk-days", type=int, default=31, help="Days rebuilt per transaction.")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        until = self._date(options["until"]) or today
+        if options["days"]:
+            since = today - timedelta(days=options["days"] - 1)
+        else:
+            since = self._date(options["since"])
+            if since is None:
+                first = Order.objects.aggregate(first=Min("created_at"), last=Max("created_at"))["first"]
+                if first is None:
+                    self.stdout.write(self.style.SUCCESS("✅ No orders, nothing to rebuild"))
+                    return
+                since = timezone.localtime(first).date()
+        if since > until:
+            raise CommandError(f"--since {since} is after --until {until}")
+
+        chunk = timedelta(days=max(options["chunk_days"], 1))
+        start, days, product_rows = since, 0, 0
+        while start <= until:
+            end = min(start + chunk - timedelta(days=1), until)
+            product_rows += rebuild(start, end)
+            days += (end - start).days + 1
+            self.stdout.write(f"Rebuilt {start} .. {end}")
+            start = end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Rebuilt {days} day(s) of sales rollups ({product_rows} product-day rows)"
+        ))
+
+    def _date(self, value):
+        if not value:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+        return parsed
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from admin_side.models import SalesExport
+from admin_side.reports import run_sales_export
+
+
+class Command(BaseCommand):
+    help = "Build queued sales report exports (picks up anything left behind by a restart)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stale-minutes", type=int, default=60,
+            help="Re-queue RUNNING exports that started more than this many minutes ago",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options["stale_minutes"])
+        stale = SalesExport.objects.filter(
+            status=SalesExport.Status.RUNNING, started_at__lt=cutoff
+        ).update(status=SalesExport.Status.PENDING, processed_rows=0)
+        if stale:
+            self.stdout.write(self.style.WARNING(f"Re-queued {stale} stale export(s)"))
+
+        pending = list(
+            SalesExport.objects.filter(status=SalesExport.Status.PENDING)
+            .order_by("created_at")
+            .values_list("id", flat=True)
+        )
+        done = 0
+        for export_id in pending:
+            self.stdout.write(f"Building export #{export_id}...")
+            if run_sales_export(export_id):
+                done += 1
+            else:
+                self.stdout.write(self.style.ERROR(f"Export #{export_id} failed or was taken by another worker"))
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Built {done} of {len(pending)} queued export(s)"))
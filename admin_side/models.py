@@ -1,3 +1,139 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class SalesExport(models.Model):
+    """A sales report export generated in the background for large date ranges."""
+
+    class Format(models.TextChoices):
+        XLSX = "xlsx", "Excel"
+        PDF = "pdf", "PDF"
+        CSV = "csv", "CSV"
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        RUNNING = "RUNNING", "Running"
+        DONE = "DONE", "Done"
+        FAILED = "FAILED", "Failed"
+
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sales_exports")
+    format = models.CharField(max_length=4, choices=Format.choices)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"{self.get_format_display()} export #{self.pk} ({self.status})"
+
+    @property
+    def progress_percent(self):
+        if self.status == self.Status.DONE:
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(int(self.processed_rows * 100 / self.total_rows), 99)
+
+
+# ---- Sales rollups (maintained by admin_side.rollups, read by the dashboard) ----
+
+class DailyOrderStats(models.Model):
+    """Orders and their total_amount per creation day and current status."""
+
+    day = models.DateField()
+    status = models.CharField(max_length=25)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["day", "status"], name="unique_daily_order_stats")]
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.orders}"
+
+
+class HourlyOrderStats(models.Model):
+    """Order count per creation hour (local time) and current status."""
+
+    day = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=25)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "hour", "status"], name="unique_hourly_order_stats"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.hour:02d}:00 {self.status}: {self.orders}"
+
+
+class DailyProductSales(models.Model):
+    """
+    Units and line totals sold per product per day (orders in a sale status
+    only), split by the product name the order items were sold under.
+    """
+
+    day = models.DateField()
+    product_id = models.PositiveIntegerField()
+    product_name = models.CharField(max_length=240, blank=True)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "product_id", "product_name"], name="unique_daily_product_sales"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_name}: {self.units}"
+
+
+class DailyCategorySales(models.Model):
+    """Same as DailyProductSales, summed per product category (0 = unknown)."""
+
+    day = models.DateField()
+    category_id = models.PositiveIntegerField()
+    category_name = models.CharField(max_length=255, blank=True)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "category_id"], name="unique_daily_category_sales"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.category_name}: {self.units}"
+
+
+class DailyBrandSales(models.Model):
+    """Same as DailyProductSales, summed per product brand (0 = unknown)."""
+
+    day = models.DateField()
+    brand_id = models.PositiveIntegerField()
+    brand_name = models.CharField(max_length=100, blank=True)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "brand_id"], name="unique_daily_brand_sales"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.brand_name}: {self.units}"
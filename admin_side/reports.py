@@ -0,0 +1,517 @@
+# admin_side/reports.py
+"""
+Sales report filtering and export writers.
+
+Every writer consumes rows from export_rows(), which streams OrderItem rows
+from the database with .iterator(), so memory stays flat however large the
+date range is. Small exports are written straight into the response; large
+ones become a SalesExport, built by run_sales_export() in the job worker
+(`manage.py run_jobs`, task admin_side.build_sales_export).
+"""
+import csv
+import io
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, connections
+from django.db.models import Count, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas
+
+from ecomerce.db import isolated_routing, use_replica
+from ecomerce.exports import EXPORT_CHUNK_SIZE
+from orders.models import OrderItem
+from products.models import Product
+
+STATUS_FILTERS = {
+    "delivered": "DELIVERED",
+    "confirmed": "CONFIRMED",
+    "placed": "PLACED",
+    "cancelled": "CANCELLED",
+    "returned": "RETURNED",
+    "shipped": "SHIPPED",
+}
+
+PRICE_FILTERS = {
+    "700-1500": {"unit_price__gte": 700, "unit_price__lt": 1500},
+    "1500-3000": {"unit_price__gte": 1500, "unit_price__lt": 3000},
+    "3000-5000": {"unit_price__gte": 3000, "unit_price__lt": 5000},
+    "5000-10000": {"unit_price__gte": 5000, "unit_price__lt": 10000},
+    "10000-20000": {"unit_price__gte": 10000, "unit_price__lt": 20000},
+    "20000-60000": {"unit_price__gte": 20000, "unit_price__lte": 60000},
+    "60000+": {"unit_price__gt": 60000},
+}
+
+EXPORT_HEADERS = ["Order ID", "Product", "Customer", "Date", "Amount", "Qty", "Status"]
+
+# Above these row counts an export is queued instead of built in the request
+SYNC_EXPORT_LIMITS = {"xlsx": 20000, "pdf": 2000}
+
+PROGRESS_EVERY = 5000
+
+# A RUNNING export that started longer ago than this is assumed abandoned
+EXPORT_STALE_AFTER = timedelta(minutes=60)
+
+CONTENT_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+    "csv": "text/csv",
+}
+
+
+def export_storage():
+    return FileSystemStorage(location=settings.EXPORTS_ROOT)
+
+
+# ---------------------------
+# FILTERS
+# ---------------------------
+
+def report_params(query, default_days=None):
+    """
+    Pull the report filters out of a QueryDict/dict. With `default_days`
+    a missing start/end falls back to the last N days.
+    """
+    params = {
+        "start": query.get("start") or "",
+        "end": query.get("end") or "",
+        "category": query.get("category") or "all",
+        "status": query.get("status") or "all",
+        "price": query.get("price") or "all",
+    }
+    if default_days is not None:
+        if not params["start"]:
+            params["start"] = (datetime.now() - timedelta(days=default_days)).strftime('%Y-%m-%d')
+        if not params["end"]:
+            params["end"] = datetime.now().strftime('%Y-%m-%d')
+    return params
+
+
+def sales_items(params):
+    """OrderItem queryset for the report filters in `params`."""
+    items = OrderItem.objects.all()
+
+    start = parse_date(params.get("start") or "")
+    end = parse_date(params.get("end") or "")
+    if start:
+        items = items.filter(order__created_at__date__gte=start)
+    if end:
+        items = items.filter(order__created_at__date__lte=end)
+
+    category = params.get("category", "all")
+    if category != "all":
+        # OrderItem keeps a plain product_id, so filter through a subquery
+        items = items.filter(
+            product_id__in=Product.objects.filter(category__name__iexact=category).values("id")
+        )
+
+    status = STATUS_FILTERS.get(params.get("status", "all"))
+    if status:
+        items = items.filter(status=status)
+
+    price = PRICE_FILTERS.get(params.get("price", "all"))
+    if price:
+        items = items.filter(**price)
+
+    return items
+
+
+def sales_summary(items):
+    """Revenue, distinct orders and quantity for the filtered items (one query)."""
+    totals = items.aggregate(
+        revenue=Sum("line_total"),
+        orders=Count("order_id", distinct=True),
+        quantity=Sum("quantity"),
+    )
+    revenue = totals["revenue"] or 0
+    orders = totals["orders"] or 0
+    return {
+        "revenue": revenue,
+        "orders": orders,
+        "quantity": totals["quantity"] or 0,
+        "avg_order_value": revenue / orders if orders else 0,
+    }
+
+
+def sales_by_category(items):
+    """
+    {category name: {"revenue", "quantity"}} in one grouped query, highest
+    revenue first. OrderItem has no FK to Product, so the category name is
+    pulled in through a correlated subquery on product_id.
+    """
+    category_name = Subquery(
+        Product.objects.filter(pk=OuterRef("product_id")).values("category__name")[:1]
+    )
+    rows = (
+        items
+        .annotate(cat=Coalesce(category_name, Value("Uncategorized")))
+        .order_by()
+        .values("cat")
+        .annotate(revenue=Sum("line_total"), quantity=Sum("quantity"))
+        .order_by("-revenue")
+    )
+    return {
+        row["cat"]: {"revenue": float(row["revenue"] or 0), "quantity": row["quantity"] or 0}
+        for row in rows
+    }
+
+
+def monthly_sales(items, months=12, today=None):
+    """
+    Revenue per calendar month for the last `months` months (current month
+    included), as (labels, values) lists oldest first. One grouped query.
+    """
+    today = today or timezone.localdate()
+    year, month = today.year, today.month
+    keys = []
+    for _ in range(months):
+        keys.append((year, month))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    keys.reverse()
+
+    first_year, first_month = keys[0]
+    since = timezone.make_aware(datetime(first_year, first_month, 1))
+    totals = {
+        (row["month"].year, row["month"].month): row["total"] or 0
+        for row in (
+            items
+            .filter(order__created_at__gte=since)
+            .annotate(month=TruncMonth("order__created_at"))
+            .order_by()
+            .values("month")
+            .annotate(total=Sum("line_total"))
+        )
+    }
+    labels = [datetime(y, m, 1).strftime('%b') for y, m in keys]
+    values = [float(totals.get(key, 0)) for key in keys]
+    return labels, values
+
+
+def export_rows(items, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one tuple per item in EXPORT_HEADERS order:
+    (order_number, product_name, customer, created_at, line_total, quantity, status)
+    """
+    rows = (
+        items
+        .order_by("-order__created_at", "-id")
+        .values_list(
+            "order__order_number", "product_name",
+            "order__user__first_name", "order__user__username",
+            "order__created_at", "line_total", "quantity", "status",
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    for order_number, product_name, first_name, username, created_at, line_total, qty, status in rows:
+        customer = first_name or username or "Guest"
+        yield (order_number, product_name, customer, created_at, line_total, qty, status)
+
+
+# ---------------------------
+# WRITERS
+# ---------------------------
+
+def _tick(progress, count):
+    if progress and count % PROGRESS_EVERY == 0:
+        progress(count)
+
+
+def write_xlsx(rows, fileobj, progress=None):
+    """
+    Write rows with openpyxl's write-only mode: rows are flushed to disk as
+    they are appended instead of building the whole sheet in memory.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sales Report")
+    ws.freeze_panes = "A2"
+
+    widths = {'A': 18, 'B': 40, 'C': 18, 'D': 40, 'E': 15, 'F': 12, 'G': 15}
+    for col, width in widths.items():
+        ws.column_dimensions[col].width = width
+
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF", size=11)
+    header_align = Alignment(horizontal="center", vertical="center")
+    thin = Border(
+        left=Side(style='thin'), right=Side(style='thin'),
+        top=Side(style='thin'), bottom=Side(style='thin')
+    )
+    left = Alignment(horizontal="left", vertical="center")
+    right = Alignment(horizontal="right", vertical="center")
+    shade = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
+
+    header = []
+    for title in EXPORT_HEADERS:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_align
+        header.append(cell)
+    ws.append(header)
+
+    count = 0
+    for order_number, product, customer, created_at, amount, qty, status in rows:
+        count += 1
+        values = [
+            order_number,
+            product,
+            customer,
+            # Date as text (prevents ####### in narrow columns)
+            created_at.strftime('%d-%b-%Y %I:%M %p'),
+            float(amount),
+            qty,
+            status,
+        ]
+        cells = []
+        for col, value in enumerate(values, start=1):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.border = thin
+            cell.alignment = right if col == 5 else left
+            if col == 4:
+                cell.number_format = '@'
+            # Shade alternate rows (sheet row = count + 1)
+            if count % 2 == 1:
+                cell.fill = shade
+            cells.append(cell)
+        ws.append(cells)
+        _tick(progress, count)
+
+    wb.save(fileobj)
+    return count
+
+
+def csv_rows(rows):
+    """Export rows as CSV cells (used by write_csv and the streamed download)."""
+    for order_number, product, customer, created_at, amount, qty, status in rows:
+        yield [
+            order_number, product, customer,
+            created_at.strftime('%Y-%m-%d %H:%M'), f"{amount:.2f}", qty, status,
+        ]
+
+
+def write_csv(rows, fileobj, progress=None):
+    """Write rows as CSV to a text file object."""
+    writer = csv.writer(fileobj)
+    writer.writerow(EXPORT_HEADERS)
+    count = 0
+    for row in csv_rows(rows):
+        count += 1
+        writer.writerow(row)
+        _tick(progress, count)
+    return count
+
+
+PDF_BRAND = colors.HexColor('#8b5cf6')
+PDF_COL_WIDTHS = [1.3 * inch, 2.2 * inch, 1.2 * inch, 1 * inch, 1 * inch, 0.6 * inch, 1 * inch]
+PDF_ROW_HEIGHT = 16
+
+
+def write_pdf(rows, fileobj, summary, start, end, progress=None):
+    """
+    Draw the report straight onto a canvas one page at a time, so only the
+    current page's rows are held in Python (no platypus Table for every row).
+    """
+    page_w, page_h = landscape(A4)
+    table_w = sum(PDF_COL_WIDTHS)
+    x0 = (page_w - table_w) / 2
+    bottom = 0.8 * inch
+    generated = datetime.now().strftime('%d %B %Y at %H:%M')
+
+    c = canvas.Canvas(fileobj, pagesize=(page_w, page_h), pageCompression=1)
+    c.setTitle("Sales Report")
+    page = 1
+
+    def col_x(i):
+        return x0 + sum(PDF_COL_WIDTHS[:i])
+
+    def draw_header_row(y):
+        c.setFillColor(PDF_BRAND)
+        c.rect(x0, y - 4, table_w, PDF_ROW_HEIGHT + 4, stroke=0, fill=1)
+        c.setFillColor(colors.whitesmoke)
+        c.setFont("Helvetica-Bold", 10)
+        for i, title in enumerate(EXPORT_HEADERS):
+            c.drawCentredString(col_x(i) + PDF_COL_WIDTHS[i] / 2, y + 2, title)
+        return y - PDF_ROW_HEIGHT - 4
+
+    def draw_footer():
+        c.setFillColor(colors.grey)
+        c.setFont("Helvetica", 9)
+        c.drawCentredString(page_w / 2, 0.4 * inch, f"Generated on {generated} | Audio Aura Sales Report | Page {page}")
+
+    # First page: title, period and summary
+    y = page_h - 0.8 * inch
+    c.setFillColor(PDF_BRAND)
+    c.setFont("Helvetica-Bold", 24)
+    c.drawCentredString(page_w / 2, y, "Sales Report")
+    y -= 0.45 * inch
+    c.setFillColor(colors.grey)
+    c.setFont("Helvetica", 12)
+    c.drawCentredString(page_w / 2, y, f"Period: {start or 'All time'} to {end or 'today'}")
+    y -= 0.6 * inch
+
+    box_w = 2.5 * inch
+    sx = (page_w - 3 * box_w) / 2
+    labels = ['Total Orders', 'Total Revenue', 'Average Order Value']
+    values = [
+        str(summary["orders"]),
+        f"RS{summary['revenue']:,.2f}",
+        f"RS{summary['avg_order_value']:,.2f}",
+    ]
+    for i, (label, value) in enumerate(zip(labels, values)):
+        bx = sx + i * box_w
+        c.setFillColor(PDF_BRAND)
+        c.rect(bx, y, box_w, 22, stroke=1, fill=1)
+        c.setFillColor(colors.HexColor('#f3f4f6'))
+        c.rect(bx, y - 26, box_w, 26, stroke=1, fill=1)
+        c.setFillColor(colors.whitesmoke)
+        c.setFont("Helvetica-Bold", 12)
+        c.drawCentredString(bx + box_w / 2, y + 7, label)
+        c.setFillColor(colors.black)
+        c.setFont("Helvetica", 11)
+        c.drawCentredString(bx + box_w / 2, y - 17, value)
+    y -= 0.9 * inch
+
+    y = draw_header_row(y)
+    count = 0
+    for order_number, product, customer, created_at, amount, qty, status in rows:
+        if y < bottom:
+            draw_footer()
+            c.showPage()
+            page += 1
+            y = draw_header_row(page_h - 0.8 * inch)
+
+        count += 1
+        if count % 2 == 0:
+            c.setFillColor(colors.HexColor('#f9fafb'))
+            c.rect(x0, y - 4, table_w, PDF_ROW_HEIGHT, stroke=0, fill=1)
+        c.setStrokeColor(colors.lightgrey)
+        c.line(x0, y - 4, x0 + table_w, y - 4)
+
+        product = product[:30] + "..." if len(product) > 30 else product
+        cells = [
+            order_number[:15], product, customer[:18],
+            created_at.strftime('%d-%b-%y'), f"RS {amount:,.0f}", str(qty), status.upper(),
+        ]
+        c.setFillColor(colors.black)
+        c.setFont("Helvetica", 8)
+        for i, text in enumerate(cells):
+            if i in (0, 1, 2):
+                c.drawString(col_x(i) + 4, y, text)
+            elif i == 4:
+                c.drawRightString(col_x(i + 1) - 4, y, text)
+            else:
+                c.drawCentredString(col_x(i) + PDF_COL_WIDTHS[i] / 2, y, text)
+        y -= PDF_ROW_HEIGHT
+        _tick(progress, count)
+
+    draw_footer()
+    c.save()
+    return count
+
+
+def write_export(fmt, params, fileobj, progress=None):
+    """Write the filtered report in `fmt` ("xlsx", "pdf" or "csv") to a binary file."""
+    items = sales_items(params)
+    rows = export_rows(items)
+    if fmt == "xlsx":
+        return write_xlsx(rows, fileobj, progress)
+    if fmt == "pdf":
+        return write_pdf(rows, fileobj, sales_summary(items), params.get("start"), params.get("end"), progress)
+    if fmt == "csv":
+        text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="", write_through=True)
+        try:
+            return write_csv(rows, text, progress)
+        finally:
+            text.detach()
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def export_filename(fmt):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"Sales_Report_{timestamp}.{fmt}"
+
+
+# ---------------------------
+# BACKGROUND EXPORTS
+# ---------------------------
+
+def queue_sales_export(user, fmt, params, total_rows=0):
+    """Create a SalesExport and queue the job that builds it (both commit together)."""
+    from jobs.queue import enqueue
+    from .models import SalesExport
+
+    export = SalesExport.objects.create(
+        requested_by=user, format=fmt, params=params, total_rows=total_rows,
+    )
+    enqueue("admin_side.build_sales_export", idem_key=f"sales-export:{export.pk}", export_id=export.pk)
+    return export
+
+
+def run_sales_export(export_id, stale_after=None):
+    """
+    Build one queued export into EXPORTS_ROOT, updating processed_rows as it
+    goes. Run by the job worker and the run_sales_exports command. With
+    `stale_after`, a RUNNING export started before that long ago (its
+    worker died) is taken over as well.
+    """
+    from .models import SalesExport
+
+    close_old_connections()
+    try:
+        claimable = Q(status=SalesExport.Status.PENDING)
+        if stale_after is not None:
+            claimable |= Q(status=SalesExport.Status.RUNNING, started_at__lt=timezone.now() - stale_after)
+        claimed = SalesExport.objects.filter(claimable, pk=export_id).update(
+            status=SalesExport.Status.RUNNING, started_at=timezone.now(), processed_rows=0,
+        )
+        if not claimed:
+            return None
+        export = SalesExport.objects.get(pk=export_id)
+
+        def progress(count):
+            # Kept apart so the export's reads stay on the replica after this write
+            with isolated_routing():
+                SalesExport.objects.filter(pk=export_id).update(processed_rows=count)
+
+        storage = export_storage()
+        name = f"{uuid.uuid4().hex}_{export_filename(export.format)}"
+        os.makedirs(storage.location, exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile(dir=storage.location, suffix=".part", delete=False)
+        try:
+            with tmp, use_replica():
+                count = write_export(export.format, export.params, tmp, progress)
+            os.replace(tmp.name, storage.path(name))
+        except Exception as e:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+            SalesExport.objects.filter(pk=export_id).update(
+                status=SalesExport.Status.FAILED, error=str(e), finished_at=timezone.now(),
+            )
+            return None
+
+        SalesExport.objects.filter(pk=export_id).update(
+            status=SalesExport.Status.DONE,
+            file_name=name,
+            processed_rows=count,
+            total_rows=count,
+            finished_at=timezone.now(),
+        )
+        return name
+    finally:
+        # Exports open their own connections (primary and replica); don't leave them open
+        connections.close_all()
@@ -0,0 +1,391 @@
+# admin_side/rollups.py
+"""
+Pre-aggregated sales facts behind the admin dashboard.
+
+Five tables hold the numbers the dashboard shows, keyed by the day (and
+hour) an order was created, in local time:
+
+    DailyOrderStats     orders + total_amount per day and order status
+    HourlyOrderStats    orders per day, hour and order status
+    DailyProductSales   units + line totals per day and product
+    DailyCategorySales  the same per product category
+    DailyBrandSales     the same per product brand
+
+The product/category/brand tables only count items of orders whose
+status is one of SALE_STATUSES, matching what the dashboard used to
+filter on.
+
+They are kept up to date incrementally. Every change of an order's
+status or total_amount is recorded as a (before, after) transition:
+Order.save()/delete() through the signals in signals.py, and queryset
+updates through update_status(). Either way "before" is read from the
+locked row, not from a possibly stale instance. The transition is applied as +/- deltas
+once the transaction commits. By then the order's items exist even when
+they were bulk_create()d, and a rolled-back checkout never counts.
+
+rebuild() recomputes a date range from Order/OrderItem. The
+rebuild_sales_rollups command uses it to backfill, and to repair drift
+(e.g. a product moved to another category, or an order changed by raw
+SQL). A delta that fails to apply queues a rebuild of its day as a job.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+from .models import (
+    DailyBrandSales,
+    DailyCategorySales,
+    DailyOrderStats,
+    DailyProductSales,
+    HourlyOrderStats,
+)
+
+# Order statuses that count as a sale (dashboard KPIs and top lists)
+SALE_STATUSES = ("PLACED", "CONFIRMED", "SHIPPED", "DELIVERED")
+# Sold but not yet delivered
+OPEN_STATUSES = ("PLACED", "CONFIRMED", "SHIPPED")
+
+FACT_MODELS = (DailyOrderStats, HourlyOrderStats, DailyProductSales, DailyCategorySales, DailyBrandSales)
+
+UNKNOWN_NAME = "Unknown"
+
+# Seconds before a day whose delta failed is rebuilt, so its other commits land first
+REBUILD_DELAY = 60
+
+logger = logging.getLogger(__name__)
+
+
+def _bucket(created_at):
+    local = timezone.localtime(created_at)
+    return local.date(), local.hour
+
+
+def _add(model, key, labels=None, **deltas):
+    """Add `deltas` to the fact row at `key`, creating it if needed (safe under concurrency)."""
+    if not any(deltas.values()):
+        return
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    changes.update(labels or {})
+    if model.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **(labels or {}), **deltas)
+    except IntegrityError:
+        # Someone created the row first
+        model.objects.filter(**key).update(**changes)
+
+
+def _product_dimensions(product_ids):
+    """{product_id: (category_id, category_name, brand_id, brand_name)}; 0/"Unknown" where missing."""
+    from products.models import Product
+
+    dims = {}
+    rows = Product.objects.filter(id__in=product_ids).values_list(
+        "id", "category_id", "category__name", "brand_id", "brand__name"
+    )
+    for pid, cat_id, cat_name, brand_id, brand_name in rows:
+        dims[pid] = (cat_id or 0, cat_name or UNKNOWN_NAME, brand_id or 0, brand_name or UNKNOWN_NAME)
+    return dims
+
+
+def _item_facts(items):
+    """
+    Sum (product_id, product_name, quantity, line_total) rows per product
+    ({(product_id, product_name): [units, revenue]}), and per category and
+    brand ({id: [name, units, revenue]}).
+    """
+    products = defaultdict(lambda: [0, Decimal("0")])
+    for pid, name, qty, line_total in items:
+        row = products[(pid, name or "")]
+        row[0] += qty or 0
+        row[1] += line_total or Decimal("0")
+
+    dims = _product_dimensions({pid for pid, _ in products})
+    categories = defaultdict(lambda: ["", 0, Decimal("0")])
+    brands = defaultdict(lambda: ["", 0, Decimal("0")])
+    for (pid, _), (units, revenue) in products.items():
+        cat_id, cat_name, brand_id, brand_name = dims.get(pid, (0, UNKNOWN_NAME, 0, UNKNOWN_NAME))
+        for acc, key, name in ((categories, cat_id, cat_name), (brands, brand_id, brand_name)):
+            acc[key][0] = name
+            acc[key][1] += units
+            acc[key][2] += revenue
+    return products, categories, brands
+
+
+def _apply(order_id, day, hour, before, after, items=None):
+    from orders.models import OrderItem
+
+    orders = defaultdict(lambda: [0, Decimal("0")])
+    for state, sign in ((before, -1), (after, 1)):
+        if state is not None:
+            status, total = state
+            orders[status][0] += sign
+            orders[status][1] += sign * (total or Decimal("0"))
+
+    was_sale = before is not None and before[0] in SALE_STATUSES
+    is_sale = after is not None and after[0] in SALE_STATUSES
+    sign = int(is_sale) - int(was_sale)
+
+    with transaction.atomic():
+        # Rows are always touched in key order so concurrent transitions can't deadlock
+        for status in sorted(orders):
+            count, revenue = orders[status]
+            _add(DailyOrderStats, {"day": day, "status": status}, orders=count, revenue=revenue)
+            _add(HourlyOrderStats, {"day": day, "hour": hour, "status": status}, orders=count)
+
+        if not sign:
+            return
+        if items is None:
+            items = OrderItem.objects.filter(order_id=order_id).values_list(
+                "product_id", "product_name", "quantity", "line_total"
+            )
+        products, categories, brands = _item_facts(items)
+        for pid, name in sorted(products):
+            units, revenue = products[(pid, name)]
+            _add(
+                DailyProductSales, {"day": day, "product_id": pid, "product_name": name},
+                units=sign * units, revenue=sign * revenue,
+            )
+        for model, facts, id_field, name_field in (
+            (DailyCategorySales, categories, "category_id", "category_name"),
+            (DailyBrandSales, brands, "brand_id", "brand_name"),
+        ):
+            for key in sorted(facts):
+                name, units, revenue = facts[key]
+                _add(
+                    model, {"day": day, id_field: key}, {name_field: name},
+                    units=sign * units, revenue=sign * revenue,
+                )
+
+
+def record_transition(order_id, created_at, before, after, items=None):
+    """
+    Count order `order_id` as `after` instead of `before` once the current
+    transaction commits. Each state is (status, total_amount) or None for
+    "not counted" (new / deleted order). `items` overrides the item rows
+    read at commit time (needed for deleted orders).
+    """
+    if before == after:
+        return
+    day, hour = _bucket(created_at)
+
+    def apply():
+        try:
+            _apply(order_id, day, hour, before, after, items)
+        except Exception:
+            logger.exception(
+                "Sales rollup for order %s failed; rebuilding %s", order_id, day,
+                extra={"order_id": order_id, "rollup_day": day.isoformat()},
+            )
+            schedule_rebuild(day)
+
+    transaction.on_commit(apply)
+
+
+def schedule_rebuild(day):
+    """Queue a rebuild() of `day` through the job queue."""
+    from jobs.queue import enqueue
+
+    try:
+        enqueue("admin_side.rebuild_sales_day", delay=REBUILD_DELAY, day=day.isoformat())
+    except Exception:
+        logger.exception("Could not queue the sales rollup rebuild of %s; run rebuild_sales_rollups", day)
+
+
+def lock_counted_state(order):
+    """
+    Order.save() hook, inside its transaction: lock the order row and take
+    the status and total_amount it holds now as what the rollups count it
+    as, so two stale instances saved one after the other record
+    consecutive transitions instead of both undoing the same old state.
+    """
+    from orders.models import Order
+
+    row = Order.objects.select_for_update().filter(pk=order.pk).values_list("status", "total_amount").first()
+    order._counted_as = row if row is not None else False
+
+
+def order_saved(order, created, update_fields=None):
+    """post_save hook: record what changed from the state lock_counted_state() read."""
+    if update_fields is not None and not {"status", "total_amount"} & set(update_fields):
+        return
+    before = None if created else getattr(order, "_counted_as", False)
+    if before is False:
+        # Row vanished under us: recount its day instead
+        day = _bucket(order.created_at)[0] if order.created_at else None
+        if day is not None:
+            transaction.on_commit(lambda: rebuild(day, day))
+        return
+
+    status, total = order.status, order.total_amount
+    if update_fields is not None and before is not None:
+        status = status if "status" in update_fields else before[0]
+        total = total if "total_amount" in update_fields else before[1]
+    after = (status, total)
+    order._counted_as = after
+    record_transition(order.pk, order.created_at, before, after)
+
+
+def order_deleting(order):
+    """pre_delete hook: items are still there, so capture them for the commit-time delta."""
+    from orders.models import Order, OrderItem
+
+    row = Order.objects.filter(pk=order.pk).values_list("status", "total_amount", "created_at").first()
+    if row is None:
+        return
+    status, total, created_at = row
+    items = None
+    if status in SALE_STATUSES:
+        items = list(
+            OrderItem.objects.filter(order_id=order.pk).values_list(
+                "product_id", "product_name", "quantity", "line_total"
+            )
+        )
+    record_transition(order.pk, created_at, (status, total), None, items=items or [])
+
+
+def update_status(orders, status, **fields):
+    """
+    orders.update(status=status, **fields) for a queryset of orders, with
+    each transition recorded. Returns the number of orders changed.
+    """
+    from orders.models import Order
+
+    with transaction.atomic():
+        rows = list(
+            orders.exclude(status=status)
+            .select_for_update()
+            .values_list("id", "status", "total_amount", "created_at")
+        )
+        if not rows:
+            return 0
+        Order.objects.filter(id__in=[row[0] for row in rows]).update(status=status, **fields)
+        for order_id, old_status, total, created_at in rows:
+            record_transition(order_id, created_at, (old_status, total), (status, total))
+    return len(rows)
+
+
+def rebuild(start, end):
+    """Recompute every fact for the days start..end (inclusive) from Order/OrderItem."""
+    from orders.models import Order, OrderItem
+
+    with transaction.atomic():
+        for model in FACT_MODELS:
+            model.objects.filter(day__range=(start, end)).delete()
+
+        orders = Order.objects.filter(created_at__date__range=(start, end)).order_by()
+        DailyOrderStats.objects.bulk_create([
+            DailyOrderStats(day=row["d"], status=row["status"], orders=row["n"], revenue=row["revenue"] or 0)
+            for row in orders.annotate(d=TruncDate("created_at"))
+            .values("d", "status")
+            .annotate(n=Count("id"), revenue=Sum("total_amount"))
+        ])
+        HourlyOrderStats.objects.bulk_create([
+            HourlyOrderStats(day=row["d"], hour=row["h"], status=row["status"], orders=row["n"])
+            for row in orders.annotate(d=TruncDate("created_at"), h=ExtractHour("created_at"))
+            .values("d", "h", "status")
+            .annotate(n=Count("id"))
+        ])
+
+        product_rows = list(
+            OrderItem.objects.filter(
+                order__created_at__date__range=(start, end),
+                order__status__in=SALE_STATUSES,
+            )
+            .annotate(d=TruncDate("order__created_at"))
+            .values("d", "product_id", "product_name")
+            .annotate(units=Sum("quantity"), revenue=Sum("line_total"))
+            .order_by()
+        )
+        by_day = defaultdict(list)
+        for row in product_rows:
+            by_day[row["d"]].append((row["product_id"], row["product_name"], row["units"], row["revenue"]))
+
+        product_facts, category_facts, brand_facts = [], [], []
+        for day, items in by_day.items():
+            products, categories, brands = _item_facts(items)
+            product_facts += [
+                DailyProductSales(day=day, product_id=pid, product_name=name, units=u, revenue=r)
+                for (pid, name), (u, r) in products.items()
+            ]
+            category_facts += [
+                DailyCategorySales(day=day, category_id=k, category_name=n, units=u, revenue=r)
+                for k, (n, u, r) in categories.items()
+            ]
+            brand_facts += [
+                DailyBrandSales(day=day, brand_id=k, brand_name=n, units=u, revenue=r)
+                for k, (n, u, r) in brands.items()
+            ]
+        DailyProductSales.objects.bulk_create(product_facts, batch_size=1000)
+        DailyCategorySales.objects.bulk_create(category_facts, batch_size=1000)
+        DailyBrandSales.objects.bulk_create(brand_facts, batch_size=1000)
+    return len(product_rows)
+
+
+# ---- Dashboard reads ----
+
+def _in_range(qs, start=None, end=None):
+    if start:
+        qs = qs.filter(day__gte=start)
+    if end:
+        qs = qs.filter(day__lte=end)
+    return qs
+
+
+def order_totals(statuses, start=None, end=None):
+    """(orders, revenue) for orders in `statuses` created start..end."""
+    totals = _in_range(DailyOrderStats.objects.filter(status__in=statuses), start, end).aggregate(
+        n=Sum("orders"), revenue=Sum("revenue")
+    )
+    return totals["n"] or 0, totals["revenue"] or 0
+
+
+def daily_orders(start, end, statuses=SALE_STATUSES):
+    """{day: orders} for start..end."""
+    qs = _in_range(DailyOrderStats.objects.filter(status__in=statuses), start, end)
+    return dict(qs.values("day").annotate(n=Sum("orders")).values_list("day", "n").order_by())
+
+
+def daily_revenue(start, end, statuses=SALE_STATUSES):
+    """{day: revenue} for start..end."""
+    qs = _in_range(DailyOrderStats.objects.filter(status__in=statuses), start, end)
+    return dict(qs.values("day").annotate(r=Sum("revenue")).values_list("day", "r").order_by())
+
+
+def hourly_orders(day, statuses=SALE_STATUSES):
+    """{hour: orders} for one day."""
+    qs = HourlyOrderStats.objects.filter(day=day, status__in=statuses)
+    return dict(qs.values("hour").annotate(n=Sum("orders")).values_list("hour", "n").order_by())
+
+
+def top_sellers(model, start=None, end=None, limit=10):
+    """
+    Top `limit` products (by name sold under), categories or brands by
+    revenue as [{"name", "units", "revenue"}].
+    """
+    group_by, name = {
+        DailyProductSales: ("product_name", F("product_name")),
+        DailyCategorySales: ("category_id", Max("category_name")),
+        DailyBrandSales: ("brand_id", Max("brand_name")),
+    }[model]
+    rows = (
+        _in_range(model.objects.all(), start, end)
+        .values(group_by)
+        .annotate(name=name, units=Sum("units"), revenue=Sum("revenue"))
+        .filter(units__gt=0)
+        .order_by("-revenue")[:limit]
+    )
+    return [{"name": row["name"], "units": row["units"], "revenue": row["revenue"]} for row in rows]
+
+
+def period_start(period, today):
+    """First day of a dashboard period ("daily", "weekly", ...), None for all time."""
+    days = {"daily": 0, "weekly": 7, "monthly": 30, "yearly": 365}.get(period)
+    return None if days is None else today - timedelta(days=days)
@@ -0,0 +1,16 @@
+# admin_side/signals.py
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from orders.models import Order
+from . import rollups
+
+
+@receiver(post_save, sender=Order)
+def count_order_in_rollups(sender, instance, created, update_fields=None, **kwargs):
+    rollups.order_saved(instance, created, update_fields)
+
+
+@receiver(pre_delete, sender=Order)
+def uncount_order_in_rollups(sender, instance, **kwargs):
+    rollups.order_deleting(instance)
@@ -0,0 +1,22 @@
+# admin_side/tasks.py
+from datetime import date
+
+from jobs.queue import task
+
+
+@task("admin_side.rebuild_sales_day")
+def rebuild_sales_day(day):
+    from .rollups import rebuild
+    day = date.fromisoformat(day)
+    rebuild(day, day)
+
+
+@task("admin_side.build_sales_export", max_attempts=10)
+def build_sales_export(export_id):
+    from .models import SalesExport
+    from .reports import EXPORT_STALE_AFTER, run_sales_export
+
+    if run_sales_export(export_id, stale_after=EXPORT_STALE_AFTER) is None:
+        if SalesExport.objects.filter(pk=export_id, status=SalesExport.Status.RUNNING).exists():
+            # Still being built by a worker that may have died: retry until it's done or stale
+            raise RuntimeError(f"Sales export {export_id} is still RUNNING")
@@ -11,6 +11,9 @@ urlpatterns = [
     path('sales-report/', views.sales_report, name='sales_report'),
     path("export/excel/", views.export_sales_excel, name="export_excel"),
     path('adminside/export-sales-pdf/', views.export_sales_pdf, name='export_sales_pdf'),
+    path('export/csv/', views.export_sales_csv, name='export_sales_csv'),
+    path('export/<int:pk>/status/', views.sales_export_status, name='sales_export_status'),
+    path('export/<int:pk>/download/', views.sales_export_download, name='sales_export_download'),
 
 
 
@@ -10,48 +10,42 @@ from django.contrib.auth.decorators import login_required,user_passes_test
 from django.contrib.auth.models import User
 from django.contrib.sessions.models import Session
 from django.views.decorators.cache import never_cache
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, JsonResponse
 from django.core.paginator import Paginator
+from django.urls import reverse
 
 # Django Database & Query
 from django.db.models import (
-    Q, F, Sum, Count, Avg, 
+    Q, Avg, 
     DecimalField, ExpressionWrapper
 )
-from django.db.models.functions import ExtractWeek, TruncMonth
+from django.db.models.functions import ExtractWeek
 
 # Django Utils
 from django.utils import timezone
-from django.utils.dateparse import parse_date
 from django.utils.timezone import localtime, make_naive 
 
 
 # Python Standard Library
 import json
+import tempfile
 from datetime import datetime, timedelta
 from decimal import Decimal
 from collections import defaultdict
 
-# Third-Party Libraries
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
-from django.http import HttpResponse
-from django.utils.dateparse import parse_date
-
 # Local App Imports
 from .forms import AdminLoginForm
+from . import rollups
+from .models import DailyBrandSales, DailyCategorySales, DailyProductSales, SalesExport
+from .reports import (
+    CONTENT_TYPES, EXPORT_HEADERS, SYNC_EXPORT_LIMITS, export_filename, export_rows, export_storage,
+    monthly_sales, queue_sales_export, report_params, sales_by_category, sales_items,
+    sales_summary, csv_rows, write_export,
+)
 from user.models import User
-from orders.models import Order, OrderItem
-from products.models import Product
 from category.models import Category
+from ecomerce.db import use_replica
+from ecomerce.exports import csv_response, wants_gzip
 
 
 # ============================================
@@ -95,33 +89,29 @@ def admin_login(request):
 # ============================================
 # ADMIN DASHBOARD
 # ============================================
-def build_period_filter(period, today):
-    """Build date filter dict based on period."""
-    if period == "daily":
-        return {"created_at__date": today}
-    elif period == "weekly":
-        return {
-            "created_at__date__gte": today - timedelta(days=7),
-            "created_at__date__lte": today,
-        }
-    elif period == "monthly":
-        return {
-            "created_at__date__gte": today - timedelta(days=30),
-            "created_at__date__lte": today,
-        }
-    elif period == "yearly":
-        return {
-            "created_at__date__gte": today - timedelta(days=365),
-            "created_at__date__lte": today,
-        }
-    return {}
+def _clip(start, end, start_dt=None, end_dt=None):
+    """Intersect start..end with the optional global date range (start > end = empty)."""
+    if start_dt is not None:
+        start = max(start, start_dt)
+    if end_dt is not None:
+        end = min(end, end_dt)
+    return start, end
+
+
+def _period_range(period, today, start_dt=None, end_dt=None):
+    """(start, end) days for a dashboard period dropdown combined with the global range."""
+    start = rollups.period_start(period, today)
+    if start is None:
+        return start_dt, end_dt
+    return _clip(start, today, start_dt, end_dt)
 
 
 @user_passes_test(is_admin, login_url="/admin/login")
 @login_required(login_url="/admin/login")
 @never_cache
+@use_replica()
 def admin_dashboard(request):
-    today = timezone.now().date()
+    today = timezone.localdate()
 
     # =========================
     # GLOBAL DATE FILTER (manual range)
@@ -129,17 +119,13 @@ def admin_dashboard(request):
     start_date = request.GET.get("start_date")
     end_date = request.GET.get("end_date")
 
-    global_filter = {}
+    start_dt = end_dt = None
     if start_date and end_date:
         try:
             start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
             end_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
-            global_filter = {
-                "created_at__date__gte": start_dt,
-                "created_at__date__lte": end_dt,
-            }
         except ValueError:
-            pass
+            start_dt = end_dt = None
 
     # =========================
     # INDEPENDENT PERIODS (dropdowns)
@@ -149,34 +135,20 @@ def admin_dashboard(request):
     category_period = request.GET.get("category_period", "monthly")
     brand_period = request.GET.get("brand_period", "monthly")
 
-    # Adapt to your Order model: using status field
-    success_states = ["DELIVERED", "CONFIRMED", "SHIPPED", "PLACED"]
+    # Everything below reads the pre-aggregated tables in admin_side.rollups,
+    # so the cost doesn't grow with the number of orders
 
     # =========================
     # SUMMARY STATS (Global Date Filter)
     # =========================
     total_customers = User.objects.filter(is_active=True).count()
 
-    stats_filter = {"status__in": success_states}
-    stats_filter.update(global_filter)
+    total_orders, total_sales_amt = rollups.order_totals(rollups.SALE_STATUSES, start_dt, end_dt)
+    total_pending, _ = rollups.order_totals(rollups.OPEN_STATUSES, start_dt, end_dt)
 
-    total_orders = Order.objects.filter(**stats_filter).count()
-    total_sales_amt = (
-        Order.objects.filter(**stats_filter).aggregate(total=Sum("total_amount"))["total"]
-        or 0
-    )
-    total_pending = Order.objects.filter(
-        status__in=["PLACED", "CONFIRMED", "SHIPPED"], **global_filter
-    ).count()
-
-    kpi_today_filter = {"created_at__date": today, "status__in": success_states}
-    kpi_today_filter.update(global_filter)
-    kpi_today = (
-        Order.objects.filter(**kpi_today_filter).aggregate(total=Sum("total_amount"))[
-            "total"
-        ]
-        or 0
-    )
+    kpi_today = 0
+    if (start_dt is None or start_dt <= today) and (end_dt is None or today <= end_dt):
+        kpi_today = rollups.order_totals(rollups.SALE_STATUSES, today, today)[1]
 
     # =========================
     # SALES PROGRESS (Global Date Filter)
@@ -197,214 +169,61 @@ def admin_dashboard(request):
         "Dec",
     ]
 
-    sales_filter = {"created_at__year": today.year, "status__in": success_states}
-    sales_filter.update(global_filter)
-
-    sales_qs = (
-        Order.objects.filter(**sales_filter)
-        .values(m=F("created_at__month"))
-        .annotate(revenue=Sum("total_amount"))
-        .order_by("m")
-    )
-
-    for row in sales_qs:
-        idx = row["m"] - 1
-        if 0 <= idx < 12:
-            sales_progress_data[idx] = float(row["revenue"] or 0) / 1000
+    year_start, year_end = _clip(today.replace(month=1, day=1), today.replace(month=12, day=31), start_dt, end_dt)
+    for day, revenue in rollups.daily_revenue(year_start, year_end).items():
+        sales_progress_data[day.month - 1] += float(revenue or 0) / 1000
 
     # =========================
-    # TOP PRODUCTS (Independent Filter + global)
+    # TOP PRODUCTS / CATEGORIES / BRANDS (Independent Filter + global)
     # =========================
-    product_filter = {"status__in": success_states}
-    product_filter.update(global_filter)
-    product_filter.update(build_period_filter(product_period, today))
-
-    product_orders = Order.objects.filter(**product_filter)
-    product_items = OrderItem.objects.filter(
-        order_id__in=product_orders.values_list("id", flat=True)
+    top_products = rollups.top_sellers(
+        DailyProductSales, *_period_range(product_period, today, start_dt, end_dt)
     )
-
-    # OrderItem has product_name and product_id, not product FK
-    top_products = list(
-        product_items.values(name=F("product_name"))
-        .annotate(units=Sum("quantity"), revenue=Sum("line_total"))
-        .order_by("-revenue")[:10]
-    )
-
-    # =========================
-    # TOP CATEGORIES (Independent Filter + global)
-    # =========================
-    # Build mapping from product id -> category name from Product model
-    pid_to_cat = dict(Product.objects.values_list("id", "category__name"))
-
-    cat_filter = {"status__in": success_states}
-    cat_filter.update(global_filter)
-    cat_filter.update(build_period_filter(category_period, today))
-
-    cat_orders = Order.objects.filter(**cat_filter)
-    cat_items = OrderItem.objects.filter(
-        order_id__in=cat_orders.values_list("id", flat=True)
-    )
-
-    cat_raw = list(
-        cat_items.values(pid=F("product_id"))
-        .annotate(units=Sum("quantity"), revenue=Sum("line_total"))
-        .order_by("-revenue")
-    )
-
-    cat_acc = defaultdict(lambda: {"units": 0, "revenue": 0})
-    for r in cat_raw:
-        cat_name = pid_to_cat.get(r["pid"], "Unknown")
-        cat_acc[cat_name]["units"] += r["units"]
-        cat_acc[cat_name]["revenue"] += float(r["revenue"] or 0)
-
-    top_categories = sorted(
-        [{"name": k, **v} for k, v in cat_acc.items()],
-        key=lambda x: x["revenue"],
-        reverse=True,
-    )[:10]
-
-    # =========================
-    # TOP BRANDS (Independent Filter + global)
-    # =========================
-    pid_to_brand = dict(Product.objects.values_list("id", "brand__name"))
-
-    brand_filter = {"status__in": success_states}
-    brand_filter.update(global_filter)
-    brand_filter.update(build_period_filter(brand_period, today))
-
-    brand_orders = Order.objects.filter(**brand_filter)
-    brand_items = OrderItem.objects.filter(
-        order_id__in=brand_orders.values_list("id", flat=True)
+    top_categories = rollups.top_sellers(
+        DailyCategorySales, *_period_range(category_period, today, start_dt, end_dt)
     )
-
-    brand_raw = list(
-        brand_items.values(pid=F("product_id"))
-        .annotate(units=Sum("quantity"), revenue=Sum("line_total"))
-        .order_by("-revenue")
+    top_brands = rollups.top_sellers(
+        DailyBrandSales, *_period_range(brand_period, today, start_dt, end_dt)
     )
 
-    brand_acc = defaultdict(lambda: {"units": 0, "revenue": 0})
-    for r in brand_raw:
-        brand_name = pid_to_brand.get(r["pid"], "Unknown")
-        brand_acc[brand_name]["units"] += r["units"]
-        brand_acc[brand_name]["revenue"] += float(r["revenue"] or 0)
-
-    top_brands = sorted(
-        [{"name": k, **v} for k, v in brand_acc.items()],
-        key=lambda x: x["revenue"],
-        reverse=True,
-    )[:10]
-
     # =========================
     # ACTIVITY CHART (Independent + global)
     # =========================
-    activity_filter = {"status__in": success_states}
-    activity_filter.update(global_filter)
-
     if activity_period == "daily":
         # 24 hours of today
-        arr = [0] * 24
         labels = [f"{i}:00" for i in range(24)]
-
-        activity_day_filter = {**activity_filter, "created_at__date": today}
-        qs = (
-            Order.objects.filter(**activity_day_filter)
-            .annotate(h=F("created_at__hour"))
-            .values(h=F("h"))
-            .annotate(cnt=Count("id"))
-            .order_by("h")
-        )
-
-        for row in qs:
-            idx = row["h"]
-            if 0 <= idx < 24:
-                arr[idx] = row["cnt"]
-
-        activity_categories, activity_data = labels, arr
-
-    elif activity_period == "weekly":
-        # Last 7 days
-        arr = [0] * 7
-        labels = []
-        for i in range(6, -1, -1):
-            date = today - timedelta(days=i)
-            labels.append(date.strftime("%b %d"))
-
-        activity_week_filter = {
-            **activity_filter,
-            "created_at__date__gte": today - timedelta(days=7),
-            "created_at__date__lte": today,
-        }
-        qs = (
-            Order.objects.filter(**activity_week_filter)
-            .values(d=F("created_at__date"))
-            .annotate(cnt=Count("id"))
-            .order_by("d")
-        )
-
-        date_map = {row["d"]: row["cnt"] for row in qs}
-        for i in range(7):
-            date = today - timedelta(days=6 - i)
-            arr[i] = date_map.get(date, 0)
+        arr = [0] * 24
+        day_start, day_end = _clip(today, today, start_dt, end_dt)
+        if day_start <= day_end:
+            for hour, count in rollups.hourly_orders(today).items():
+                if 0 <= hour < 24:
+                    arr[hour] = count
 
         activity_categories, activity_data = labels, arr
 
-    elif activity_period == "monthly":
-        # Last 30 days
-        arr = [0] * 30
-        labels = []
-        for i in range(29, -1, -1):
-            date = today - timedelta(days=i)
-            labels.append(date.strftime("%b %d"))
-
-        activity_month_filter = {
-            **activity_filter,
-            "created_at__date__gte": today - timedelta(days=30),
-            "created_at__date__lte": today,
-        }
-        qs = (
-            Order.objects.filter(**activity_month_filter)
-            .values(d=F("created_at__date"))
-            .annotate(cnt=Count("id"))
-            .order_by("d")
-        )
+    elif activity_period in ("weekly", "monthly"):
+        # Last 7 / 30 days
+        span = 7 if activity_period == "weekly" else 30
+        days = [today - timedelta(days=span - 1 - i) for i in range(span)]
+        labels = [day.strftime("%b %d") for day in days]
 
-        date_map = {row["d"]: row["cnt"] for row in qs}
-        for i in range(30):
-            date = today - timedelta(days=29 - i)
-            arr[i] = date_map.get(date, 0)
+        date_map = rollups.daily_orders(*_clip(today - timedelta(days=span), today, start_dt, end_dt))
+        arr = [date_map.get(day, 0) for day in days]
 
         activity_categories, activity_data = labels, arr
 
     elif activity_period == "yearly":
         # Last 12 "months" buckets (approx by 30 days each)
-        arr = [0] * 12
         labels = []
         for i in range(11, -1, -1):
             date = today - timedelta(days=i * 30)
             labels.append(date.strftime("%b %Y"))
 
-        activity_year_filter = {
-            **activity_filter,
-            "created_at__date__gte": today - timedelta(days=365),
-            "created_at__date__lte": today,
-        }
-        qs = (
-            Order.objects.filter(**activity_year_filter)
-            .annotate(ym=TruncMonth("created_at"))
-            .values(ym=F("ym"))
-            .annotate(cnt=Count("id"))
-            .order_by("ym")
-        )
-
-        month_map = {}
-        for row in qs:
-            if row["ym"]:
-                month_map[row["ym"].strftime("%b %Y")] = row["cnt"]
+        month_map = defaultdict(int)
+        for day, count in rollups.daily_orders(*_clip(today - timedelta(days=365), today, start_dt, end_dt)).items():
+            month_map[day.strftime("%b %Y")] += count
 
-        for i, label in enumerate(labels):
-            arr[i] = month_map.get(label, 0)
+        arr = [month_map.get(label, 0) for label in labels]
 
         activity_categories, activity_data = labels, arr
 
@@ -442,100 +261,25 @@ def admin_dashboard(request):
 @user_passes_test(is_admin, login_url='admin_login')
 @login_required(login_url='admin_login')
 @never_cache
+@use_replica()
 def sales_report(request):
-    start = request.GET.get("start")
-    end = request.GET.get("end")
-    category_filter = request.GET.get("category", "all")
-    status_filter = request.GET.get("status", "all")
-    price_filter = request.GET.get("price", "all")
-    
-    if not start:
-        start = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-    if not end:
-        end = datetime.now().strftime('%Y-%m-%d')
+    params = report_params(request.GET, default_days=30)
+    start, end = params["start"], params["end"]
+    category_filter = params["category"]
+    status_filter = params["status"]
+    price_filter = params["price"]
 
-    items = OrderItem.objects.select_related("order", "order__user").all()
+    items = sales_items(params)
 
-    if start:
-        items = items.filter(order__created_at__date__gte=parse_date(start))
-    if end:
-        items = items.filter(order__created_at__date__lte=parse_date(end))
-    
-    if category_filter != "all":
-        product_ids = Product.objects.filter(
-            category__name__iexact=category_filter
-        ).values_list('id', flat=True)
-        items = items.filter(product_id__in=product_ids)
-    
-    if status_filter != "all":
-        status_map = {
-            "delivered": "DELIVERED",
-            "confirmed": "CONFIRMED",
-            "placed": "PLACED",
-            "cancelled": "CANCELLED",
-            "returned": "RETURNED",
-            "shipped": "SHIPPED"
-        }
-        mapped_status = status_map.get(status_filter)
-        if mapped_status:
-            items = items.filter(status=mapped_status)
-    
-    if price_filter != "all":
-        if price_filter == "700-1500":
-            items = items.filter(unit_price__gte=700, unit_price__lt=1500)
-        elif price_filter == "1500-3000":
-            items = items.filter(unit_price__gte=1500, unit_price__lt=3000)
-        elif price_filter == "3000-5000":
-            items = items.filter(unit_price__gte=3000, unit_price__lt=5000)
-        elif price_filter == "5000-10000":
-            items = items.filter(unit_price__gte=5000, unit_price__lt=10000)
-        elif price_filter == "10000-20000":
-            items = items.filter(unit_price__gte=10000, unit_price__lt=20000)
-        elif price_filter == "20000-60000":
-            items = items.filter(unit_price__gte=20000, unit_price__lte=60000)
-        elif price_filter == "60000+":
-            items = items.filter(unit_price__gt=60000)
-
-    total_revenue = items.aggregate(total=Sum('line_total'))['total'] or 0
-    total_orders = items.values('order_id').distinct().count()
-    total_quantity = items.aggregate(total=Sum('quantity'))['total'] or 0
-    avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
-
-    category_sales = {}
-    product_ids = items.values_list('product_id', flat=True).distinct()
-    products_dict = {
-        p.id: p.category.name if p.category else "Uncategorized"
-        for p in Product.objects.filter(id__in=product_ids).select_related('category')
-    }
-    
-    for item in items:
-        cat_name = products_dict.get(item.product_id, "Uncategorized")
-        if cat_name not in category_sales:
-            category_sales[cat_name] = {"revenue": 0, "quantity": 0}
-        category_sales[cat_name]["revenue"] += float(item.line_total)
-        category_sales[cat_name]["quantity"] += item.quantity
-
-    monthly_revenue = []
-    monthly_labels = []
-    
-    for i in range(11, -1, -1):
-        month_date = datetime.now() - timedelta(days=i*30)
-        month_start = month_date.replace(day=1)
-        
-        if i == 0:
-            month_end = datetime.now()
-        else:
-            next_month = month_start + timedelta(days=32)
-            month_end = next_month.replace(day=1) - timedelta(days=1)
-        
-        month_items = items.filter(
-            order__created_at__date__gte=month_start.date(),
-            order__created_at__date__lte=month_end.date()
-        )
-        
-        month_total = month_items.aggregate(total=Sum('line_total'))['total'] or 0
-        monthly_revenue.append(float(month_total))
-        monthly_labels.append(month_start.strftime('%b'))
+    # One aggregate for the headline numbers, one GROUP BY per breakdown
+    summary = sales_summary(items)
+    total_revenue = summary["revenue"]
+    total_orders = summary["orders"]
+    total_quantity = summary["quantity"]
+    avg_order_value = summary["avg_order_value"]
+
+    category_sales = sales_by_category(items)
+    monthly_labels, monthly_revenue = monthly_sales(items)
 
     ordered_items = items.select_related('order', 'order__user').order_by('-order__created_at')[:500]
     
@@ -587,374 +331,98 @@ def sales_report(request):
         "selected_category": category_filter,
         "selected_status": status_filter,
         "selected_price": price_filter,
+        "exports": SalesExport.objects.filter(requested_by=request.user)[:5],
     }
 
     return render(request, "admin/sales.html", context)
 
 
 # ============================================
-# EXPORT SALES EXCEL 
+# EXPORT SALES (EXCEL / PDF / CSV)
 # ============================================
+def _export_response(request, fmt, default_days=None):
+    """
+    Small exports are built into a spooled temp file and streamed back;
+    larger ones are queued as a SalesExport and the admin is sent back to
+    the report, where its progress is shown.
+    """
+    params = report_params(request.GET, default_days=default_days)
+    total = sales_items(params).count()
+
+    if total > SYNC_EXPORT_LIMITS[fmt]:
+        queue_sales_export(request.user, fmt, params, total_rows=total)
+        messages.info(request, f"{total:,} rows - the {fmt.upper()} export is being prepared. It will appear under Exports when ready.")
+        return redirect(f"{reverse('sales_report')}?{request.GET.urlencode()}")
+
+    tmp = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    write_export(fmt, params, tmp)
+    tmp.seek(0)
+    return FileResponse(tmp, as_attachment=True, filename=export_filename(fmt), content_type=CONTENT_TYPES[fmt])
+
+
 @user_passes_test(is_admin, login_url='admin_login')
 @login_required(login_url='admin_login')
 @never_cache
+@use_replica()
 def export_sales_excel(request):
-    """Export sales report to Excel with correctly formatted date column."""
-    
-    start = request.GET.get("start")
-    end = request.GET.get("end")
-    category_filter = request.GET.get("category", "all")
-    status_filter = request.GET.get("status", "all")
-    price_filter = request.GET.get("price", "all")
-
-    # ---------------------------
-    # BASE QUERY WITH RELATIONS
-    # ---------------------------
-    items = OrderItem.objects.select_related(
-        "order", "order__user", "product", "product__category"
-    ).all()
-
-    # ---------------------------
-    # FILTERS
-    # ---------------------------
-    if start:
-        items = items.filter(order__created_at__date__gte=start)
-
-    if end:
-        items = items.filter(order__created_at__date__lte=end)
-
-    if category_filter != "all":
-        items = items.filter(product__category__name__iexact=category_filter)
-
-    if status_filter != "all":
-        status_map = {
-            "delivered": "DELIVERED", "confirmed": "CONFIRMED",
-            "placed": "PLACED", "cancelled": "CANCELLED",
-            "returned": "RETURNED", "shipped": "SHIPPED"
-        }
-        if status_filter in status_map:
-            items = items.filter(status=status_map[status_filter])
-
-    if price_filter != "all":
-        price_ranges = {
-            "700-1500": (700, 1500),
-            "1500-3000": (1500, 3000),
-            "3000-5000": (3000, 5000),
-            "5000-10000": (5000, 10000),
-            "10000-20000": (10000, 20000),
-            "20000-60000": (20000, 60000)
-        }
-        if price_filter in price_ranges:
-            low, high = price_ranges[price_filter]
-            items = items.filter(unit_price__gte=low, unit_price__lt=high)
-        elif price_filter == "60000+":
-            items = items.filter(unit_price__gt=60000)
-
-    # ---------------------------
-    # EXCEL WORKBOOK
-    # ---------------------------
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Sales Report"
-
-    # ---------------------------
-    # HEADERS
-    # ---------------------------
-    headers = ["Order ID", "Product", "Customer", "Date", "Amount", "Qty", "Status"]
-    ws.append(headers)
-
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=11)
-
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    # ---------------------------
-    # DATA ROWS
-    # ---------------------------
-    for item in items:
-        customer_name = item.order.user.first_name if item.order.user else "Guest"
-
-        # Format date as text (prevent #######)
-        date_str = item.order.created_at.strftime('%d-%b-%Y %I:%M %p')
-
-        ws.append([
-            item.order.order_number,
-            item.product_name,
-            customer_name,
-            date_str,
-            float(item.line_total),
-            item.quantity,
-            item.status
-        ])
-
-        # Force TEXT format to avoid auto-conversion
-        date_cell = ws.cell(row=ws.max_row, column=4)
-        date_cell.number_format = '@'
-
-    # ---------------------------
-    # COLUMN WIDTHS
-    # ---------------------------
-    widths = {
-        'A': 18, 'B': 40, 'C': 18, 'D': 40,
-        'E': 15, 'F': 12, 'G': 15
-    }
-    for col, width in widths.items():
-        ws.column_dimensions[col].width = width
-
-    # ---------------------------
-    # STYLING DATA ROWS
-    # ---------------------------
-    thin = Border(
-        left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin')
-    )
-
-    for row in range(2, ws.max_row + 1):
-        for col in range(1, 8):
-            cell = ws.cell(row=row, column=col)
-            cell.border = thin
-            cell.alignment = Alignment(horizontal="left", vertical="center")
-
-            # Shade alternate rows
-            if row % 2 == 0:
-                cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-
-    # Amount Right Align
-    for row in range(2, ws.max_row + 1):
-        ws.cell(row=row, column=5).alignment = Alignment(horizontal="right")
-
-    ws.freeze_panes = "A2"
-
-    # ---------------------------
-    # RETURN FILE
-    # ---------------------------
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    """Export sales report to Excel (write-only workbook, queued when large)."""
+    return _export_response(request, "xlsx")
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    response["Content-Disposition"] = f'attachment; filename="Sales_Report_{timestamp}.xlsx"'
 
-    wb.save(response)
-    return response
+@user_passes_test(is_admin, login_url='admin_login')
+@login_required(login_url='admin_login')
+@never_cache
+@use_replica()
+def export_sales_pdf(request):
+    """Export sales report as PDF, drawn page by page (queued when large)."""
+    return _export_response(request, "pdf", default_days=30)
 
 
+@user_passes_test(is_admin, login_url='admin_login')
+@login_required(login_url='admin_login')
+@never_cache
+@use_replica()
+def export_sales_csv(request):
+    """Stream the full filtered report as CSV (?gzip=1 for .csv.gz), straight from a DB cursor."""
+    params = report_params(request.GET)
+    rows = csv_rows(export_rows(sales_items(params)))
+    return csv_response(EXPORT_HEADERS, rows, export_filename("csv"), compress=wants_gzip(request))
 
-# ============================================
-# EXPORT SALES PDF
-# ============================================
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
-from django.http import HttpResponse
-from django.utils.dateparse import parse_date
-from orders.models import OrderItem
-from products.models import Product
-from datetime import datetime, timedelta
 
 @user_passes_test(is_admin, login_url='admin_login')
 @login_required(login_url='admin_login')
 @never_cache
-def export_sales_pdf(request):
-    """Export sales report as PDF with proper formatting"""
-    
-    # Get filters from request
-    start = request.GET.get("start")
-    end = request.GET.get("end")
-    category_filter = request.GET.get("category", "all")
-    status_filter = request.GET.get("status", "all")
-    price_filter = request.GET.get("price", "all")
-    
-    # Default to last 30 days if no dates provided
-    if not start:
-        start = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-    if not end:
-        end = datetime.now().strftime('%Y-%m-%d')
-
-    # ✅ FIXED: Only select_related 'order' and 'order__user' (NOT 'product')
-    items = OrderItem.objects.select_related("order", "order__user").all()
-
-    if start:
-        items = items.filter(order__created_at__date__gte=parse_date(start))
-    if end:
-        items = items.filter(order__created_at__date__lte=parse_date(end))
-    
-    if category_filter != "all":
-        product_ids = Product.objects.filter(
-            category__name__iexact=category_filter
-        ).values_list('id', flat=True)
-        items = items.filter(product_id__in=product_ids)
-    
-    if status_filter != "all":
-        status_map = {
-            "delivered": "DELIVERED",
-            "confirmed": "CONFIRMED",
-            "placed": "PLACED",
-            "cancelled": "CANCELLED",
-            "returned": "RETURNED",
-            "shipped": "SHIPPED"
-        }
-        if status_filter in status_map:
-            items = items.filter(status=status_map[status_filter])
-    
-    if price_filter != "all":
-        if price_filter == "700-1500":
-            items = items.filter(unit_price__gte=700, unit_price__lt=1500)
-        elif price_filter == "1500-3000":
-            items = items.filter(unit_price__gte=1500, unit_price__lt=3000)
-        elif price_filter == "3000-5000":
-            items = items.filter(unit_price__gte=3000, unit_price__lt=5000)
-        elif price_filter == "5000-10000":
-            items = items.filter(unit_price__gte=5000, unit_price__lt=10000)
-        elif price_filter == "10000-20000":
-            items = items.filter(unit_price__gte=10000, unit_price__lt=20000)
-        elif price_filter == "20000-60000":
-            items = items.filter(unit_price__gte=20000, unit_price__lte=60000)
-        elif price_filter == "60000+":
-            items = items.filter(unit_price__gt=60000)
-
-    # Limit to 100 orders for PDF
-    items = items.order_by('-order__created_at')[:100]
-
-    # Create PDF response
-    response = HttpResponse(content_type='application/pdf')
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    response['Content-Disposition'] = f'attachment; filename="Sales_Report_{timestamp}.pdf"'
-
-    # Create PDF with landscape orientation
-    doc = SimpleDocTemplate(response, pagesize=landscape(A4))
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#8b5cf6'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    title = Paragraph("📊 Sales Report", title_style)
-    elements.append(title)
-
-    # Date range subtitle
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Normal'],
-        fontSize=12,
-        textColor=colors.grey,
-        spaceAfter=20,
-        alignment=TA_CENTER
-    )
-    subtitle = Paragraph(f"Period: {start} to {end}", subtitle_style)
-    elements.append(subtitle)
-    elements.append(Spacer(1, 0.3*inch))
+def sales_export_status(request, pk):
+    """Progress of a background export (polled by the sales report page)."""
+    export = get_object_or_404(SalesExport, pk=pk, requested_by=request.user)
+    return JsonResponse({
+        "id": export.pk,
+        "status": export.status,
+        "format": export.format,
+        "processed": export.processed_rows,
+        "total": export.total_rows,
+        "percent": export.progress_percent,
+        "error": export.error,
+        "download_url": reverse("sales_export_download", args=[export.pk]) if export.status == SalesExport.Status.DONE else None,
+    })
 
-    # Summary statistics
-    total_revenue = sum(float(item.line_total) for item in items)
-    total_orders = items.count()
-    
-    summary_data = [
-        ['Total Orders', 'Total Revenue', 'Average Order Value'],
-        [
-            str(total_orders),
-            f"RS{total_revenue:,.2f}",
-            f"RS{total_revenue/total_orders:,.2f}" if total_orders > 0 else "₹0"
-        ]
-    ]
-    
-    summary_table = Table(summary_data, colWidths=[2.5*inch, 2.5*inch, 2.5*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8b5cf6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f3f4f6')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('FONTSIZE', (0, 1), (-1, -1), 11),
-        ('TOPPADDING', (0, 1), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 10),
-    ]))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 0.4*inch))
-
-    # Orders table header
-    data = [['Order ID', 'Product', 'Customer', 'Date', 'Amount', 'Qty', 'Status']]
-
-    # Add order rows
-    for item in items:
-        customer_name = "Guest"
-        if item.order.user:
-            customer_name = item.order.user.first_name or item.order.user.username
 
-        # Truncate long product names
-        product_name = item.product_name[:30] + "..." if len(item.product_name) > 30 else item.product_name
-        
-        data.append([
-            item.order.order_number[:15],
-            product_name,
-            customer_name,
-            item.order.created_at.strftime('%d-%b-%y'),
-            f"RS {item.line_total:,.0f}",
-            str(item.quantity),
-            item.status.upper()
-        ])
-
-    # Create table
-    table = Table(data, colWidths=[1.3*inch, 2.2*inch, 1.2*inch, 1*inch, 1*inch, 0.6*inch, 1*inch])
-    
-    # Table styling
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8b5cf6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 1), (1, -1), 'LEFT'),
-        ('ALIGN', (2, 1), (2, -1), 'LEFT'),
-        ('ALIGN', (3, 1), (3, -1), 'CENTER'),
-        ('ALIGN', (4, 1), (4, -1), 'RIGHT'),
-        ('ALIGN', (5, 1), (5, -1), 'CENTER'),
-        ('ALIGN', (6, 1), (6, -1), 'CENTER'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-    ]))
-    
-    elements.append(table)
-
-    # Footer
-    elements.append(Spacer(1, 0.5*inch))
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.grey,
-        alignment=TA_CENTER
+@user_passes_test(is_admin, login_url='admin_login')
+@login_required(login_url='admin_login')
+@never_cache
+def sales_export_download(request, pk):
+    export = get_object_or_404(SalesExport, pk=pk, requested_by=request.user, status=SalesExport.Status.DONE)
+    storage = export_storage()
+    if not export.file_name or not storage.exists(export.file_name):
+        raise Http404("Export file is no longer available.")
+    # Stored as "<uuid>_<Sales_Report_...>"; offer the readable part as the filename
+    download_name = export.file_name.split("_", 1)[-1]
+    return FileResponse(
+        storage.open(export.file_name, "rb"),
+        as_attachment=True,
+        filename=download_name,
+        content_type=CONTENT_TYPES.get(export.format),
     )
-    footer_text = f"Generated on {datetime.now().strftime('%d %B %Y at %H:%M')} | Audio Aura Sales Report"
-    footer = Paragraph(footer_text, footer_style)
-    elements.append(footer)
-
-    # Build PDF
-    doc.build(elements)
-    return response
 
 
 # ============================================
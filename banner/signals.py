@@ -0,0 +1,6 @@
+# banner/signals.py
+from ecomerce.cache import register
+from .models import Banner, DealImage, DealOfMonth, FeaturedProduct
+
+for model in (Banner, DealOfMonth, DealImage, FeaturedProduct):
+    register(model, "banners")
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-16 21:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_cart_addons_total_cart_discount_total_and_more'),
+        ('products', '0025_stockhold'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='cartitem',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='priced_on',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product', 'variant'), name='unique_cart_line', nulls_distinct=False),
+        ),
+    ]
@@ -15,21 +15,48 @@ class Cart(models.Model):
     addons_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     grand_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
 
+    # pricing_stamp() the cached totals were computed under; a mismatch means
+    # prices/offers may have moved since and the totals need recompute_totals()
+    priced_on = models.CharField(max_length=40, blank=True, default='')
+
     updated_at = models.DateTimeField(auto_now=True)
 
+    @staticmethod
+    def pricing_stamp():
+        """
+        Today's date (offers start and end by date) + when a product's price
+        or offers last changed: Product.updated_at, which offer saves touch
+        as well (products.signals). Stock movements don't move it, and it
+        reads the same in every process.
+        """
+        from datetime import date
+        from django.db.models import Max
+        changed = Product.objects.aggregate(at=Max('updated_at'))['at']
+        micros = int(changed.timestamp() * 1_000_000) if changed else 0
+        return f"{date.today().isoformat()}:{micros}"
+
+    @property
+    def totals_are_fresh(self):
+        return self.priced_on == self.pricing_stamp()
+
     def recompute_totals(self, coupon_pct: Decimal = Decimal('0')):
         """
         Recompute cached totals from CartItem rows.
         coupon_pct is a percentage like Decimal('10') for 10%.
         """
+        from products.pricing import apply_prices
+
         subtotal = addons = tax = Decimal('0.00')
 
-        items = self.items.select_related('product')
+        items = list(self.items.select_related('product'))
+        # Offers for every line in two queries instead of two per line
+        apply_prices([ci.product for ci in items])
         for ci in items:
-            ci.reprice(coupon_pct=coupon_pct, save=True)
+            ci.reprice(coupon_pct=coupon_pct)
             subtotal += ci.line_subtotal
             addons += ci.line_addons
             tax += ci.line_tax
+        CartItem.objects.bulk_update(items, CartItem.PRICE_FIELDS)
 
         self.discount_total = Decimal('0.00')  # plug coupon calculation if not pure percent
         self.subtotal = subtotal
@@ -37,7 +64,8 @@ class Cart(models.Model):
         self.tax_total = tax
         self.shipping_total = Decimal('0.00')  # compute later if you add slabs
         self.grand_total = self.subtotal + self.addons_total + self.tax_total + self.shipping_total - self.discount_total
-        self.save(update_fields=['subtotal','addons_total','tax_total','shipping_total','discount_total','grand_total','updated_at'])
+        self.priced_on = self.pricing_stamp()
+        self.save(update_fields=['subtotal','addons_total','tax_total','shipping_total','discount_total','grand_total','priced_on','updated_at'])
         return self
 
 class CartItem(models.Model):
@@ -55,8 +83,17 @@ class CartItem(models.Model):
     line_addons = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     line_tax = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
 
+    PRICE_FIELDS = ['unit_price_at_add', 'line_subtotal', 'line_addons', 'line_tax']
+
     class Meta:
-        unique_together = [("cart", "product", "variant")]
+        constraints = [
+            # variant is NULL for products without variants; still one line each
+            models.UniqueConstraint(
+                fields=["cart", "product", "variant"],
+                nulls_distinct=False,
+                name="unique_cart_line",
+            )
+        ]
 
     # Prefer variant image; fallback to product image
     @property
@@ -69,7 +106,7 @@ class CartItem(models.Model):
         return pimg.image.url if pimg else ""
 
     def effective_unit_price(self, coupon_pct: Decimal = Decimal('0')):
-        # Uses your Product.get_final_price()
+        # Uses your Product.get_final_price() - the same price the guest cart summary shows
         return self.product.get_final_price(coupon_discount_percent=coupon_pct)
 
     def reprice(self, coupon_pct: Decimal = Decimal('0'), save: bool = False):
@@ -80,5 +117,5 @@ class CartItem(models.Model):
         self.line_addons = (self.addon_fee_per_item or Decimal('0.00')) * self.quantity
         self.line_tax = Decimal('0.00')  # plug in GST logic later
         if save:
-            self.save(update_fields=['unit_price_at_add','line_subtotal','line_addons','line_tax'])
+            self.save(update_fields=self.PRICE_FIELDS)
         return self
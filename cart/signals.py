@@ -0,0 +1,12 @@
+# cart/signals.py
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from .store import merge_session_cart
+
+
+@receiver(user_logged_in)
+def merge_guest_cart_on_login(sender, request, user, **kwargs):
+    # The guest cart lives in the session; from now on the user's Cart rows hold it
+    if request is not None:
+        merge_session_cart(request, user)
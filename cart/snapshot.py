@@ -0,0 +1,194 @@
+# cart/snapshot.py
+"""
+Everything the cart endpoints need to know about the lines in a cart,
+loaded in one go.
+
+cart_snapshot() reads the products (with category), variants, first
+images and active offers for every line in a fixed number of queries and
+keeps them on the request, so the helpers one AJAX call runs (validate,
+re-check the coupon, build the summary ...) share a single load. The
+lines themselves are re-read from the session each time because those
+helpers edit the cart as they go; only ids not seen yet in this request
+hit the database.
+"""
+from decimal import Decimal
+
+from django.db.models import Prefetch
+
+from products.models import Product, ProductImage, ProductVariant, ProductVariantImage
+from products.pricing import apply_prices
+
+PLACEHOLDER_IMAGE = '/static/images/placeholder.jpg'
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CartLine:
+    """One (product, variant, qty) line with its loaded rows."""
+
+    def __init__(self, product, variant, qty, variant_id):
+        self.product = product
+        self.variant = variant  # None if missing or not this product's
+        self.qty = qty
+        self.variant_id = variant_id  # as stored in the session
+
+    @property
+    def stock(self):
+        """Same rule as cart.views._available_stock()."""
+        if self.variant_id:
+            return max(0, int(self.variant.stock or 0)) if self.variant is not None else 0
+        return max(0, int(self.product.stock_quantity or 0))
+
+    @property
+    def unit_price(self):
+        """Price coupons are checked against (discount_price or base_price)."""
+        return self.product.discount_price or self.product.base_price
+
+    @property
+    def has_discount(self):
+        return self.product.discount_price is not None
+
+    @property
+    def image(self):
+        if self.variant is not None and self.variant.first_image:
+            return self.variant.first_image[0].image_url
+        if self.product.first_image:
+            return self.product.first_image[0].image_url
+        return PLACEHOLDER_IMAGE
+
+
+class CartSnapshot:
+    """Lines of a cart whose product is still listed, in session order."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self._by_key = {(ln.product.id, str(ln.variant_id)): ln for ln in lines}
+        self._products = {ln.product.id: ln.product for ln in lines}
+
+    def line(self, product_id, variant_id):
+        return self._by_key.get((_to_int(product_id), str(variant_id)))
+
+    def product(self, product_id):
+        return self._products.get(_to_int(product_id))
+
+    @property
+    def total_qty(self):
+        return sum(ln.qty for ln in self.lines)
+
+    @property
+    def subtotal(self):
+        return sum((ln.unit_price * ln.qty for ln in self.lines), Decimal('0'))
+
+    def coupon_totals(self):
+        """(total quantity, subtotal, cart_items) as Coupon.check_cart_eligibility() takes them."""
+        items = [
+            {'id': ln.product.id, 'qty': ln.qty, 'has_discount': ln.has_discount}
+            for ln in self.lines
+        ]
+        return self.total_qty, self.subtotal, items
+
+
+def _catalog(request):
+    catalog = getattr(request, '_cart_catalog', None)
+    if catalog is None:
+        catalog = request._cart_catalog = {'products': {}, 'variants': {}}
+    return catalog
+
+
+def _load(request, product_ids, variant_ids):
+    """Fetch the products/variants this request hasn't loaded yet (None = not listed/gone)."""
+    catalog = _catalog(request)
+    products, variants = catalog['products'], catalog['variants']
+
+    missing = set(product_ids) - products.keys()
+    if missing:
+        found = apply_prices(
+            Product.objects.filter(id__in=missing, is_listed=True)
+            .select_related('category')
+            .prefetch_related(
+                Prefetch(
+                    'images',
+                    queryset=ProductImage.objects.order_by('-featured', 'id')[:1],
+                    to_attr='first_image'
+                )
+            )
+        )
+        products.update({pid: None for pid in missing})
+        products.update({p.id: p for p in found})
+
+    missing = set(variant_ids) - variants.keys()
+    if missing:
+        found = ProductVariant.objects.filter(id__in=missing).prefetch_related(
+            Prefetch(
+                'images',
+                queryset=ProductVariantImage.objects.order_by('-featured', 'id')[:1],
+                to_attr='first_image'
+            )
+        )
+        variants.update({vid: None for vid in missing})
+        variants.update({v.id: v for v in found})
+    return products, variants
+
+
+def _load_lines(request, lines):
+    return _load(
+        request,
+        {pid for pid, _, _ in lines},
+        {v for v in (_to_int(vid) for _, _, vid in lines if vid) if v is not None},
+    )
+
+
+def snapshot_for_lines(request, lines):
+    """CartSnapshot for (product_id, qty, variant_id) tuples."""
+    lines = list(lines)
+    products, variants = _load_lines(request, lines)
+    snapshot = []
+    for pid, qty, vid in lines:
+        product = products.get(pid)
+        if product is None:
+            continue
+        variant = variants.get(_to_int(vid)) if vid else None
+        if variant is not None and variant.product_id != product.id:
+            variant = None
+        snapshot.append(CartLine(product, variant, qty, vid))
+    return CartSnapshot(snapshot)
+
+
+def line_for(request, product_id, variant_id, qty=1):
+    """CartLine for one product/variant (in the cart or not), or None if the product isn't listed."""
+    from cart.views import _get_session_cart, _iter_cart_lines
+
+    pid = _to_int(product_id)
+    if pid is None:
+        return None
+    lines = [(pid, qty, variant_id)]
+    # The caller nearly always needs the rest of the cart next; load it in the same pass
+    _load_lines(request, list(_iter_cart_lines(_get_session_cart(request))) + lines)
+    return snapshot_for_lines(request, lines).line(pid, variant_id)
+
+
+def cart_snapshot(request, cart_map=None):
+    """Snapshot of the session cart (or of `cart_map` if given)."""
+    from cart.views import _get_session_cart, _iter_cart_lines
+
+    if cart_map is None:
+        cart_map = _get_session_cart(request)
+    return snapshot_for_lines(request, _iter_cart_lines(cart_map))
+
+
+def buy_now_snapshot(request):
+    """Snapshot of the single buy-now line (empty if there is none)."""
+    from cart.views import BUY_NOW_SESSION_KEY
+
+    line = request.session.get(BUY_NOW_SESSION_KEY)
+    if not line:
+        return CartSnapshot([])
+    pid = _to_int(line.get('product_id'))
+    if pid is None:
+        return CartSnapshot([])
+    return snapshot_for_lines(request, [(pid, int(line.get('qty') or 1), line.get('variant_id'))])
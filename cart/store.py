@@ -0,0 +1,187 @@
+# cart/store.py
+"""
+Where a cart lives.
+
+Guests keep the cart in the session, as before. Signed-in users get a
+Cart/CartItem row set instead, so the cart follows them across devices
+and a cart change no longer rewrites (and waits on) the session row.
+
+Both are handed to the views in the same shape - the session cart map
+{"<product_id>": [{"qty": n, "variant_id": "<id>" | None}, ...]} - so
+cart.views only goes through _get_session_cart()/_set_session_cart().
+For a DB cart the map is built once per request from the CartItem rows;
+saving it writes only the lines that changed and then sums the cached
+Cart totals from the stored lines, under a lock on the Cart row so two
+tabs editing the same cart can't leave the totals off. Totals priced before
+a price or offer change, or on an earlier day, are recomputed in full
+(Cart.recompute_totals). A guest cart still in the session of a user who
+is already signed in is folded in the first time the DB cart is loaded.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Cart, CartItem
+from .snapshot import _to_int, snapshot_for_lines
+
+
+def uses_db_cart(request):
+    user = getattr(request, "user", None)
+    return bool(user and user.is_authenticated)
+
+
+def _key(pid, vid):
+    return int(pid), (_to_int(vid) if vid else None)
+
+
+def _state(request, user=None):
+    """The user's Cart, its items by (product_id, variant_id) and the map handed out, once per request."""
+    state = getattr(request, "_db_cart", None)
+    if state is None:
+        cart, _ = Cart.objects.get_or_create(user=user or request.user)
+        items = {}
+        cart_map = {}
+        for item in CartItem.objects.filter(cart=cart).order_by("id"):
+            items[(item.product_id, item.variant_id)] = item
+            cart_map.setdefault(str(item.product_id), []).append({
+                "qty": item.quantity,
+                "variant_id": str(item.variant_id) if item.variant_id else None,
+            })
+        state = request._db_cart = {"cart": cart, "items": items, "map": cart_map}
+    return state
+
+
+def load_cart(request, user=None):
+    """The signed-in user's cart as a session-style cart map (same object for the whole request)."""
+    from .views import CART_SESSION_KEY
+
+    if request.session.get(CART_SESSION_KEY):
+        # Signed in before carts moved to the DB: merge what the session still holds
+        merge_session_cart(request, user or request.user)
+    return _state(request, user)["map"]
+
+
+def save_cart(request, cart_map, user=None, _retry=True):
+    """
+    Persist `cart_map` for the signed-in user: delete, update and insert
+    only the lines that differ from what was loaded, then refresh the
+    cached totals. Lines whose product is gone/unlisted or whose
+    variant doesn't belong to the product are dropped.
+    """
+    from .views import _iter_cart_lines
+
+    state = _state(request, user)
+    cart, items = state["cart"], state["items"]
+
+    wanted = {}
+    for pid, qty, vid in _iter_cart_lines(cart_map):
+        if qty > 0:
+            wanted[_key(pid, vid)] = (pid, qty, vid)
+
+    changed = [line for key, line in wanted.items() if key not in items or items[key].quantity != line[1]]
+    snapshot = snapshot_for_lines(request, changed)
+
+    to_delete = [item for key, item in items.items() if key not in wanted]
+    to_update, to_create = [], []
+    for pid, qty, vid in changed:
+        ln = snapshot.line(pid, vid)
+        if ln is None or (vid and ln.variant is None):
+            key = _key(pid, vid)
+            if key in items:
+                to_delete.append(items[key])
+            continue
+        item = items.get(_key(pid, vid))
+        if item is None:
+            item = CartItem(cart=cart, product=ln.product, variant=ln.variant, quantity=qty)
+            to_create.append(item)
+        else:
+            item.product = ln.product  # priced instance from the snapshot
+            item.quantity = qty
+            to_update.append(item)
+        item.reprice()
+
+    if to_delete or to_update or to_create:
+        try:
+            _write(cart, to_delete, to_update, to_create)
+        except IntegrityError:
+            if not _retry:
+                raise
+            # Another tab added the same line meanwhile: reload and apply again
+            request._db_cart = None
+            return save_cart(request, cart_map, user, _retry=False)
+        _count_changed(cart.user_id)
+        for item in to_delete:
+            items.pop((item.product_id, item.variant_id), None)
+        for item in to_create:
+            items[(item.product_id, item.variant_id)] = item
+
+    state["map"] = cart_map
+
+
+def _count_changed(user_id):
+    from ecomerce.context_processors import invalidate_cart_count
+    transaction.on_commit(lambda: invalidate_cart_count(user_id))
+
+
+def _write(cart, to_delete, to_update, to_create):
+    with transaction.atomic():
+        # Edits to one cart queue here, so the totals below see every line
+        locked = Cart.objects.select_for_update().get(pk=cart.pk)
+        if to_delete:
+            CartItem.objects.filter(id__in=[item.id for item in to_delete]).delete()
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ["quantity", *CartItem.PRICE_FIELDS])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if locked.totals_are_fresh:
+            sums = CartItem.objects.filter(cart=locked).aggregate(
+                subtotal=Sum("line_subtotal"), addons=Sum("line_addons"), tax=Sum("line_tax"),
+            )
+            subtotal = sums["subtotal"] or Decimal("0.00")
+            addons = sums["addons"] or Decimal("0.00")
+            tax = sums["tax"] or Decimal("0.00")
+            Cart.objects.filter(pk=cart.pk).update(
+                subtotal=subtotal,
+                addons_total=addons,
+                tax_total=tax,
+                grand_total=subtotal + addons + tax + F("shipping_total") - F("discount_total"),
+                updated_at=timezone.now(),
+            )
+        else:
+            locked.recompute_totals()
+
+
+def cart_totals(request):
+    """The user's Cart with cached totals that are current (recomputed first if stale)."""
+    cart = _state(request)["cart"]
+    cart.refresh_from_db()
+    if not cart.totals_are_fresh:
+        cart.recompute_totals()
+    return cart
+
+
+def merge_session_cart(request, user):
+    """
+    Fold a guest's session cart into the user's DB cart at login.
+    Quantities of lines in both are added (capped at MAX_QTY_PER_LINE).
+    """
+    from .views import CART_SESSION_KEY, MAX_QTY_PER_LINE, _iter_cart_lines
+
+    session_cart = request.session.get(CART_SESSION_KEY)
+    if not session_cart:
+        return
+    cart_map = _state(request, user)["map"]
+    for pid, qty, vid in _iter_cart_lines(session_cart):
+        if qty <= 0:
+            continue
+        node = cart_map.setdefault(str(pid), [])
+        for line in node:
+            if str(line.get("variant_id")) == str(vid):
+                line["qty"] = min(int(line.get("qty", 0)) + qty, MAX_QTY_PER_LINE)
+                break
+        else:
+            node.append({"qty": min(qty, MAX_QTY_PER_LINE), "variant_id": vid})
+    save_cart(request, cart_map, user)
+    del request.session[CART_SESSION_KEY]
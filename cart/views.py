@@ -5,19 +5,18 @@ from django.views.decorators.http import require_POST, require_http_methods
 from django.views.decorators.cache import never_cache
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Prefetch
 from django.utils import timezone
-from category.models import Category
+from category.cache import active_categories
 from coupons.models import Coupon
 from datetime import date, datetime, timedelta
 from decimal import Decimal
 
 from products.models import (
     Product,
-    ProductImage,
     ProductVariant,
-    ProductVariantImage,
 )
+from .snapshot import buy_now_snapshot, cart_snapshot, line_for
+from .store import cart_totals, load_cart, save_cart, uses_db_cart
 
 
 # ==================== SESSION CONFIGURATION ====================
@@ -88,17 +87,22 @@ def _available_stock(product, vkey):
 
 def _get_session_cart(request):
     """
-    Get cart from session
+    Get cart from session (signed-in users: from their Cart rows, see cart.store)
     Cart shape: {
       "39": [{"qty": 2, "variant_id": "102"}, {"qty": 1, "variant_id": "103"}],
       "41": [{"qty": 1, "variant_id": null}],
     }
     """
+    if uses_db_cart(request):
+        return load_cart(request)
     return request.session.get(CART_SESSION_KEY, {})
 
 
 def _set_session_cart(request, cart):
-    """Save cart to session with proper timeout"""
+    """Save cart to session with proper timeout (signed-in users: only the changed Cart rows)"""
+    if uses_db_cart(request):
+        save_cart(request, cart)
+        return
     request.session[CART_SESSION_KEY] = cart
     request.session.set_expiry(CART_SESSION_TIMEOUT)  # 30 days for cart
     request.session.modified = True
@@ -134,51 +138,42 @@ def _validate_cart_items(request):
     - Quantity exceeds stock
     """
     cart_map = _get_session_cart(request)
+    snapshot = cart_snapshot(request, cart_map)
     cleaned = False
     
     for pid_str in list(cart_map.keys()):
-        try:
-            # ✅ Fetch category in same query
-            product = Product.objects.select_related('category').get(
-                id=pid_str, 
-                is_listed=True
-            )
-            
-            # ✅ CHECK: Category is active (NEW!)
-            if product.category and not product.category.is_active:
-                del cart_map[pid_str]
-                cleaned = True
-                continue  # Skip to next product
-            
-            node = cart_map[pid_str]
-            
-            if isinstance(node, list):
-                valid_lines = []
-                for line in node:
-                    vid = line.get("variant_id")
-                    stock = _available_stock(product, vid)
-                    if stock > 0:
-                        # Cap quantity to available stock
-                        line["qty"] = min(int(line.get("qty", 1)), stock, MAX_QTY_PER_LINE)
-                        valid_lines.append(line)
-                    else:
-                        cleaned = True
-                
-                if valid_lines:
-                    cart_map[pid_str] = valid_lines
+        product = snapshot.product(pid_str)
+        
+        # Product deleted or unlisted, or ✅ category inactive
+        if product is None or (product.category and not product.category.is_active):
+            del cart_map[pid_str]
+            cleaned = True
+            continue  # Skip to next product
+        
+        node = cart_map[pid_str]
+        
+        if isinstance(node, list):
+            valid_lines = []
+            for line in node:
+                ln = snapshot.line(pid_str, line.get("variant_id"))
+                stock = ln.stock if ln else 0
+                if stock > 0:
+                    # Cap quantity to available stock
+                    line["qty"] = min(int(line.get("qty", 1)), stock, MAX_QTY_PER_LINE)
+                    valid_lines.append(line)
                 else:
-                    del cart_map[pid_str]
                     cleaned = True
+            
+            if valid_lines:
+                cart_map[pid_str] = valid_lines
             else:
-                stock = _available_stock(product, None)
-                if stock <= 0:
-                    del cart_map[pid_str]
-                    cleaned = True
-                    
-        except Product.DoesNotExist:
-            # Product deleted or unlisted
-            del cart_map[pid_str]
-            cleaned = True
+                del cart_map[pid_str]
+                cleaned = True
+        else:
+            ln = snapshot.line(pid_str, None)
+            if not ln or ln.stock <= 0:
+                del cart_map[pid_str]
+                cleaned = True
     
     if cleaned:
         _set_session_cart(request, cart_map)
@@ -261,21 +256,16 @@ def buy_now_update_qty(request):
         return JsonResponse({'success': False, 'error': 'No buy-now line'}, status=404)
 
     # Validate stock
-    pid = line.get('product_id')
-    vid = line.get('variant_id')
-    
-    try:
-        product = Product.objects.get(id=pid, is_listed=True)
-        max_stock = _available_stock(product, vid)
-        
-        if max_stock <= 0:
-            return JsonResponse({
-                'success': False, 
-                'error': 'OUT_OF_STOCK'
-            }, status=409)
-        
-    except Product.DoesNotExist:
+    snapshot = buy_now_snapshot(request)
+    if not snapshot.lines:
         return JsonResponse({'success': False, 'error': 'Product not found'}, status=404)
+    
+    max_stock = snapshot.lines[0].stock
+    if max_stock <= 0:
+        return JsonResponse({
+            'success': False, 
+            'error': 'OUT_OF_STOCK'
+        }, status=409)
 
     # Cap quantity
     new_qty = max(1, min(new_qty, max_stock, MAX_QTY_PER_LINE))
@@ -326,65 +316,15 @@ def _buy_now_summary(request):
     if not line:
         return {}
 
-    pid = line.get('product_id')
     vid = line.get('variant_id')
-    qty = int(line.get('qty') or 1)
-
-    # Load product with images
-    p = Product.objects.filter(id=pid, is_listed=True).prefetch_related(
-        Prefetch(
-            'images',
-            queryset=ProductImage.objects.order_by("-featured", "id"),
-            to_attr="prefetched_images"
-        )
-    ).first()
 
-    if not p:
+    # Product, variant, images and offers (shared with the rest of the request)
+    snapshot = buy_now_snapshot(request)
+    if not snapshot.lines:
         return {}
-
-    # Load variant with images
-    v = None
-    if vid:
-        v = ProductVariant.objects.filter(id=vid, product_id=pid).prefetch_related(
-            Prefetch(
-                'images',
-                queryset=ProductVariantImage.objects.order_by("-featured", "id")[:1],
-                to_attr="first_image"
-            )
-        ).first()
-
-    # ✅ FIXED: Safe image URL handling
-    image_url = None
-    
-    # Try variant image first
-    if v and hasattr(v, 'first_image') and v.first_image:
-        vimg = v.first_image[0]
-        # Use image_url property if available
-        if hasattr(vimg, 'image_url'):
-            image_url = vimg.image_url
-        # Fallback: check if image field has file
-        elif hasattr(vimg, 'image') and vimg.image and vimg.image.name:
-            try:
-                image_url = vimg.image.url
-            except ValueError:
-                pass  # File doesn't exist
-    
-    # Fallback to product image
-    if not image_url and hasattr(p, 'prefetched_images') and p.prefetched_images:
-        pimg = p.prefetched_images[0]
-        # Use image_url property if available
-        if hasattr(pimg, 'image_url'):
-            image_url = pimg.image_url
-        # Fallback: check if image field has file
-        elif hasattr(pimg, 'image') and pimg.image and pimg.image.name:
-            try:
-                image_url = pimg.image.url
-            except ValueError:
-                pass  # File doesn't exist
-    
-    # Final fallback to placeholder
-    if not image_url:
-        image_url = '/static/images/placeholder.jpg'
+    ln = snapshot.lines[0]
+    p, v, qty = ln.product, ln.variant, ln.qty
+    image_url = ln.image
 
     # ✅ Pricing with get_final_price() - includes offers
     unit_sell = p.get_final_price() if hasattr(p, 'get_final_price') else (p.discount_price or p.base_price)
@@ -583,24 +523,21 @@ def cart_update_qty(request):
     if qty <= 0:
         node[:] = [ln for ln in node if str(ln.get("variant_id")) != str(vkey)]
     else:
-        # Enforce stock cap
-        try:
-            product = Product.objects.get(id=pid, is_listed=True)
-            cap = min(MAX_QTY_PER_LINE, _available_stock(product, vkey))
-            if cap <= 0:
-                node[:] = [ln for ln in node if str(ln.get("variant_id")) != str(vkey)]
-            else:
-                capped = max(1, min(qty, cap))
-                updated = False
-                for ln in node:
-                    if str(ln.get("variant_id")) == str(vkey):
-                        ln["qty"] = capped
-                        updated = True
-                        break
-                if not updated:
-                    node.append({"qty": capped, "variant_id": vkey})
-        except Product.DoesNotExist:
+        # Enforce stock cap (product not listed -> cap 0)
+        line = line_for(request, pid, vkey)
+        cap = min(MAX_QTY_PER_LINE, line.stock) if line else 0
+        if cap <= 0:
             node[:] = [ln for ln in node if str(ln.get("variant_id")) != str(vkey)]
+        else:
+            capped = max(1, min(qty, cap))
+            updated = False
+            for ln in node:
+                if str(ln.get("variant_id")) == str(vkey):
+                    ln["qty"] = capped
+                    updated = True
+                    break
+            if not updated:
+                node.append({"qty": capped, "variant_id": vkey})
 
     if not node:
         cart_map.pop(pid, None)
@@ -719,6 +656,36 @@ def clear_checkout_session(request):
 
 # ==================== CART/CHECKOUT CONTEXT BUILDERS ====================
 
+def _summary_unit_price(product):
+    """Sell price of one unit in the cart summary, for guest and DB carts alike (offers included)."""
+    return product.get_final_price()
+
+
+def _db_cart_summary_lines(request):
+    """
+    Summary lines + subtotals from the signed-in user's cached line prices
+    (priced with _summary_unit_price via CartItem.reprice). Unlisted
+    products are left out, as cart_snapshot() does for guests.
+    """
+    cart = cart_totals(request)
+    items = []
+    subtotal_sell = Decimal('0')
+    subtotal_mrp = Decimal('0')
+    for ci in cart.items.filter(product__is_listed=True).select_related('product').order_by('id'):
+        line_mrp = ci.product.base_price * ci.quantity
+        subtotal_sell += ci.line_subtotal
+        subtotal_mrp += line_mrp
+        items.append({
+            "id": ci.product_id,
+            "qty": ci.quantity,
+            "unit_sell": float(ci.unit_price_at_add or 0),
+            "line_sell": float(ci.line_subtotal),
+            "unit_mrp": float(ci.product.base_price),
+            "line_mrp": float(line_mrp),
+        })
+    return items, subtotal_sell, subtotal_mrp
+
+
 def _cart_summary_from_session(request):
     """Build cart summary for AJAX responses"""
     cart_map = _get_session_cart(request)
@@ -726,23 +693,22 @@ def _cart_summary_from_session(request):
     subtotal_mrp = Decimal('0')
     items = []
 
-    for pid, qty, vid in _iter_cart_lines(cart_map):
-        try:
-            p = Product.objects.get(id=pid, is_listed=True)
-        except Product.DoesNotExist:
-            continue
-        
-        unit_sell = p.discount_price or p.base_price
-        unit_mrp = p.base_price
-        line_sell = unit_sell * Decimal(str(qty))
-        line_mrp = unit_mrp * Decimal(str(qty))
+    if uses_db_cart(request):
+        items, subtotal_sell, subtotal_mrp = _db_cart_summary_lines(request)
+        cart_map = {}  # lines already read from the cached Cart
+
+    for ln in cart_snapshot(request, cart_map).lines:
+        unit_sell = _summary_unit_price(ln.product)
+        unit_mrp = ln.product.base_price
+        line_sell = unit_sell * Decimal(str(ln.qty))
+        line_mrp = unit_mrp * Decimal(str(ln.qty))
         
         subtotal_sell += line_sell
         subtotal_mrp += line_mrp
         
         items.append({
-            "id": int(pid),
-            "qty": int(qty),
+            "id": ln.product.id,
+            "qty": int(ln.qty),
             "unit_sell": float(unit_sell),
             "line_sell": float(line_sell),
             "unit_mrp": float(unit_mrp),
@@ -822,48 +788,11 @@ def _cart_items_context(request):
                 del request.session['applied_coupon_discount']
             applied_coupon = None
 
-    # Prefetch products/variants
-    product_ids, variant_ids = set(), set()
-    for pid, qty, vid in _iter_cart_lines(cart_map):
-        if qty > 0:
-            product_ids.add(pid)
-            if vid:
-                try:
-                    variant_ids.add(int(vid))
-                except Exception:
-                    pass
-
-    products = (
-        Product.objects.filter(id__in=product_ids, is_listed=True)
-        .prefetch_related(
-            Prefetch(
-                "images",
-                queryset=ProductImage.objects.order_by("-featured", "id"),
-                to_attr="prefetched_images"
-            )
-        )
-    )
-    variants = (
-        ProductVariant.objects.filter(id__in=variant_ids)
-        .prefetch_related(
-            Prefetch(
-                "images",
-                queryset=ProductVariantImage.objects.order_by("-featured", "id")[:1],
-                to_attr="first_image"
-            )
-        )
-        if variant_ids else ProductVariant.objects.none()
-    )
-
-    p_by_id = {p.id: p for p in products}
-    v_by_id = {v.id: v for v in variants}
-
-    for pid, qty, vid in _iter_cart_lines(cart_map):
+    for ln in cart_snapshot(request, cart_map).lines:
+        qty = ln.qty
         if qty <= 0:
             continue
-        p = p_by_id.get(pid)
-        if not p:
-            continue
+        p, v = ln.product, ln.variant
 
         # ✅ Pass coupon percent to get_final_price
         unit_sell = int(p.get_final_price(coupon_discount_percent))
@@ -874,22 +803,8 @@ def _cart_items_context(request):
         subtotal_mrp += line_mrp
         qty_sum += qty
 
-        v = v_by_id.get(int(vid)) if vid else None
-
-        # Images
-        img = None
-        if v and getattr(v, "first_image", None):
-            vf = v.first_image[0] if v.first_image else None
-            if vf:
-                img = vf.image_url
-        
-        if not img and getattr(p, "prefetched_images", None):
-            fp = p.prefetched_images[0] if p.prefetched_images else None
-            if fp:
-                img = fp.image_url
-        
-        if not img:
-            img = '/static/images/placeholder.jpg'
+        # Images (variant first, then product, then placeholder)
+        img = ln.image
 
         # Metadata
         color = getattr(v, "color", None) if v else None
@@ -898,8 +813,7 @@ def _cart_items_context(request):
         # Discount percent
         perc = p.get_discount_percent() if hasattr(p, 'get_discount_percent') else 0
 
-        available_stock = v.stock if v and hasattr(v, "stock") else getattr(p, "stock_quantity", 0)
-        max_qty = min(10, available_stock)
+        max_qty = min(10, ln.stock)
 
         items.append({
             "id": p.id,
@@ -914,7 +828,7 @@ def _cart_items_context(request):
             "line_mrp": int(line_mrp),
             "offer": getattr(p, "offer", None),
             "discount_percent": perc,
-            "variant_id": int(vid) if vid else None,
+            "variant_id": int(ln.variant_id) if ln.variant_id else None,
             "max_qty": max_qty,
         })
 
@@ -945,32 +859,9 @@ def _cart_items_context(request):
     save_note = int(discount + coupon_discount)
 
     # ✅ GET ACTIVE COUPONS - FILTER BY USER ELIGIBILITY
-    if request.user.is_authenticated:
-        # Get all active coupons first
-        all_coupons = Coupon.objects.filter(
-            is_active=True,
-            expiry_date__gte=today,
-            start_date__lte=today
-        ).order_by('display_order', '-discount')
-        
-        # Filter by user eligibility
-        eligible_coupons = []
-        for coupon in all_coupons:
-            # Check if user can use this coupon (usage limit, first-time only, etc.)
-            user_eligible, _ = coupon.check_user_eligibility(request.user)
-            
-            # Check if global usage limit reached
-            if user_eligible and coupon.used_count < coupon.limit:
-                eligible_coupons.append(coupon)
-        
-        active_coupons = eligible_coupons
-    else:
-        # Anonymous users see all active coupons
-        active_coupons = Coupon.objects.filter(
-            is_active=True,
-            expiry_date__gte=today,
-            start_date__lte=today
-        ).order_by('display_order', '-discount')
+    # (anonymous users see every live coupon)
+    from coupons.eligibility import usable_coupons
+    active_coupons = [check.coupon for check in usable_coupons(request.user, today=today)]
 
     return {
         "items": items,
@@ -991,7 +882,7 @@ def _cart_items_context(request):
 def cart(request):
     """Render cart page"""
     context = _cart_items_context(request)
-    context['categories'] = Category.objects.filter(is_active=True).order_by('name')
+    context['categories'] = active_categories()
     
     # Active offers
     context['offers'] = get_active_offers(request)
@@ -1011,7 +902,7 @@ def cart(request):
 def cart(request):
     """Render cart page"""
     context = _cart_items_context(request)
-    context['categories'] = Category.objects.filter(is_active=True).order_by('name')
+    context['categories'] = active_categories()
     
     # Active offers
     context['offers'] = get_active_offers(request)
@@ -1087,26 +978,8 @@ def apply_coupon(request):
             total_quantity = ctx.get('items', [{}])[0].get('qty', 1)
             cart_items = ctx.get('items', [])
         else:
-            cart_map = _get_session_cart(request)
-            subtotal = Decimal('0')
-            total_quantity = 0
-            cart_items = []
-            
-            for pid, qty, vid in _iter_cart_lines(cart_map):
-                try:
-                    product = Product.objects.get(id=pid, is_listed=True)
-                    price = product.discount_price or product.base_price
-                    subtotal += price * int(qty)
-                    total_quantity += int(qty)
-                    
-                    # Track if product has discount
-                    cart_items.append({
-                        'id': pid,
-                        'qty': qty,
-                        'has_discount': product.discount_price is not None
-                    })
-                except Product.DoesNotExist:
-                    continue
+            # Track quantity, subtotal and which products are discounted
+            total_quantity, subtotal, cart_items = cart_snapshot(request).coupon_totals()
         
         # ✅ CHECK 5: Cart eligibility (min amount, max amount, min items, discounted products)
         cart_eligible, message = coupon.check_cart_eligibility(
@@ -1177,26 +1050,8 @@ def _auto_validate_coupon(request, cart_map):
             _remove_coupon_from_session(request)
             return f"Coupon {applied_coupon_code} removed: {message}"
         
-        # Calculate current cart totals
-        total_quantity = 0
-        subtotal = Decimal('0')
-        cart_items = []
-        
-        for pid, qty, vid in _iter_cart_lines(cart_map):
-            try:
-                product = Product.objects.get(id=pid, is_listed=True)
-                price = product.discount_price or product.base_price
-                subtotal += price * qty
-                total_quantity += qty
-                
-                # ✅ Track if product has discount
-                cart_items.append({
-                    'id': pid,
-                    'qty': qty,
-                    'has_discount': product.discount_price is not None
-                })
-            except Product.DoesNotExist:
-                continue
+        # Calculate current cart totals (✅ incl. which products are discounted)
+        total_quantity, subtotal, cart_items = cart_snapshot(request, cart_map).coupon_totals()
         
         # ✅ CHECK 3: Cart eligibility (min/max amount, min items, discounted products)
         cart_eligible, message = coupon.check_cart_eligibility(
@@ -1256,9 +1111,7 @@ def get_active_offers(request):
     - Coupons not yet started
     - First-time only coupons (if user has orders)
     """
-    from coupons.models import Coupon, CouponUsage
-    from datetime import date
-    from django.db.models import Count, Q, F
+    from coupons.eligibility import usable_coupons
     
     # Get cart data
     buy_now_line = request.session.get(BUY_NOW_SESSION_KEY)
@@ -1268,67 +1121,14 @@ def get_active_offers(request):
         cart_total = Decimal(str(ctx.get('subtotal_sell', 0)))
         cart_items = ctx.get('items', [])
     else:
-        cart_map = _get_session_cart(request)
-        cart_total = Decimal('0')
-        cart_count = 0
-        cart_items = []
-        
-        for pid, qty, vid in _iter_cart_lines(cart_map):
-            try:
-                product = Product.objects.get(id=pid, is_listed=True)
-                price = product.discount_price or product.base_price
-                cart_total += price * int(qty)
-                cart_count += 1
-                
-                # Track discounted products
-                cart_items.append({
-                    'id': pid,
-                    'qty': qty,
-                    'has_discount': product.discount_price is not None
-                })
-            except Product.DoesNotExist:
-                continue
-    
-    # Get active coupons with filters
-    today = date.today()
-    active_coupons = Coupon.objects.filter(
-        is_active=True,
-        start_date__lte=today,  # ✅ Started
-        expiry_date__gte=today  # ✅ Not expired
-    ).filter(
-        used_count__lt=F('limit')  # ✅ Global limit not reached
-    )
-    
-    # ✅ Filter by user eligibility if authenticated
-    if request.user.is_authenticated:
-        # Annotate with user's usage count
-        active_coupons = active_coupons.annotate(
-            user_usage_count=Count(
-                'usage_records',
-                filter=Q(usage_records__user=request.user)
-            )
-        ).filter(
-            user_usage_count__lt=F('per_user_limit')  # ✅ Per-user limit not reached
-        )
+        # Item count as apply_coupon() checks min_items (quantity, not lines)
+        cart_count, cart_total, cart_items = cart_snapshot(request).coupon_totals()
     
-    active_coupons = active_coupons.order_by('display_order', '-discount')[:8]
-    
-    # Build offer data
+    # ✅ Live coupons the user can still use, with the cart rules checked
     offers = []
-    for coupon in active_coupons:
-        # ✅ Additional user eligibility check (first-time only, etc.)
-        if request.user.is_authenticated:
-            user_eligible, user_message = coupon.check_user_eligibility(request.user)
-            if not user_eligible:
-                continue  # Skip this coupon for this user
-        
-        # ✅ Check cart eligibility
-        cart_eligible, cart_message = coupon.check_cart_eligibility(
-            cart_count, 
-            cart_total, 
-            cart_items
-        )
-        
+    for coupon, cart_eligible, cart_message in usable_coupons(
+        request.user, cart_count, cart_total, cart_items
+    )[:8]:
         # Condition display text
         conditions = []
         if coupon.min_items > 0:
@@ -1423,24 +1223,7 @@ def quick_add_with_coupon(request):
                         coupon_message = f" (but {msg})"
                     else:
                         # Calculate cart totals
-                        total_quantity = 0
-                        subtotal = Decimal('0')
-                        cart_items = []
-                        
-                        for pid, qty, vid in _iter_cart_lines(cart_map):
-                            try:
-                                prod = Product.objects.get(id=pid, is_listed=True)
-                                price = prod.discount_price or prod.base_price
-                                subtotal += price * qty
-                                total_quantity += qty
-                                
-                                cart_items.append({
-                                    'id': pid,
-                                    'qty': qty,
-                                    'has_discount': prod.discount_price is not None
-                                })
-                            except Product.DoesNotExist:
-                                continue
+                        total_quantity, subtotal, cart_items = cart_snapshot(request, cart_map).coupon_totals()
                         
                         # Check cart eligibility
                         cart_eligible, msg = coupon.check_cart_eligibility(
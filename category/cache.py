@@ -0,0 +1,27 @@
+# category/cache.py
+
+from django.conf import settings
+from django.core.cache import cache
+
+ACTIVE_CATEGORIES_KEY = "category:active_list"
+# Invalidation only reaches other workers through a shared cache; otherwise
+# a disabled category may stay in their navigation until this runs out
+ACTIVE_CATEGORIES_TIMEOUT = 60 * 60 * 24 if settings.SHARED_CACHE else 60
+
+
+def active_categories():
+    """
+    Active categories ordered by name, served from the cache.
+    Rebuilt on first use after a Category save/toggle/delete.
+    """
+    categories = cache.get(ACTIVE_CATEGORIES_KEY)
+    if categories is None:
+        from category.models import Category
+
+        categories = list(Category.objects.filter(is_active=True).order_by("name"))
+        cache.set(ACTIVE_CATEGORIES_KEY, categories, ACTIVE_CATEGORIES_TIMEOUT)
+    return categories
+
+
+def invalidate_active_categories():
+    cache.delete(ACTIVE_CATEGORIES_KEY)
@@ -0,0 +1,19 @@
+# category/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_active_categories
+from .models import Category
+
+
+@receiver([post_save, post_delete], sender=Category)
+def refresh_active_categories(sender, instance, **kwargs):
+    invalidate_active_categories()
+
+
+# ---- Page / fragment cache invalidation ----
+from ecomerce.cache import register
+from .models import Brand, CategoryOffer
+
+for model in (Category, Brand, CategoryOffer):
+    register(model, "catalog")
@@ -0,0 +1,97 @@
+# coupons/eligibility.py
+"""
+Coupon eligibility for every live coupon at once.
+
+The cart and checkout list all coupons a user can apply. Checking them one
+by one (Coupon.check_user_eligibility) costs a usage count and an orders
+lookup per coupon; here the user's numbers are read once - one grouped
+CouponUsage query plus, only if some coupon is first-time-only, one
+Order exists() - and every rule is evaluated in memory with the model's
+own check methods, so the messages stay the same.
+
+The active coupon rows themselves are kept per process and reloaded when
+the "coupons" cache group is bumped (any Coupon save/delete, see
+signals.py, and every redemption, see services.py), or after
+ACTIVE_COUPONS_TTL seconds at the latest: a bump made in another process
+may never reach this one (LocMem cache), and a coupon can expire or run
+out without any save at all.
+"""
+import time
+from collections import namedtuple
+from datetime import date
+
+from django.db.models import Count
+
+from ecomerce.cache import group_versions
+
+CouponCheck = namedtuple("CouponCheck", "coupon eligible message")
+
+# Seconds one process keeps its copy of the active coupons, whatever the version says
+ACTIVE_COUPONS_TTL = 60
+
+# (group version, loaded at (monotonic), coupons) - replaced whole, never mutated
+_active = (None, 0.0, ())
+
+
+def active_coupons():
+    """
+    All is_active coupons in display order. Shared between requests, so
+    treat the instances as read-only; re-fetch before saving one.
+    """
+    global _active
+    from .models import Coupon
+
+    version = group_versions("coupons")["coupons"]
+    now = time.monotonic()
+    loaded_version, loaded_at, coupons = _active
+    if loaded_version != version or now - loaded_at >= ACTIVE_COUPONS_TTL:
+        coupons = tuple(Coupon.objects.filter(is_active=True).order_by('display_order', '-discount'))
+        _active = (version, now, coupons)
+    return coupons
+
+
+def user_coupon_stats(user, coupons):
+    """({coupon_id: times used}, has previous orders) for `user`, in at most two queries."""
+    from orders.models import Order
+    from .models import CouponUsage
+
+    usage = dict(
+        CouponUsage.objects.filter(user=user)
+        .order_by()
+        .values_list('coupon_id')
+        .annotate(n=Count('id'))
+    )
+    has_previous_orders = False
+    if any(c.first_time_only for c in coupons):
+        has_previous_orders = Order.objects.filter(
+            user=user,
+            status__in=['PLACED', 'SHIPPED', 'DELIVERED']
+        ).exists()
+    return usage, has_previous_orders
+
+
+def usable_coupons(user, cart_count=None, cart_total=None, cart_items=None, today=None):
+    """
+    Coupons that are live today (active, in date range, under the global
+    limit) and that `user` may still use, in display order, as
+    CouponCheck(coupon, eligible, message).
+
+    `eligible`/`message` are the cart rules (min_items, min_purchase,
+    max_purchase, exclude_discounted) when `cart_total` is given, else
+    True/"Eligible". Anonymous users skip the per-user rules.
+    """
+    today = today or date.today()
+    live = [c for c in active_coupons() if c.is_valid(today)[0]]
+
+    if user is not None and user.is_authenticated:
+        usage, has_previous_orders = user_coupon_stats(user, live)
+        live = [c for c in live if c.check_user_rules(usage.get(c.id, 0), has_previous_orders)[0]]
+
+    results = []
+    for coupon in live:
+        if cart_total is None:
+            results.append(CouponCheck(coupon, True, "Eligible"))
+        else:
+            eligible, message = coupon.check_cart_eligibility(cart_count, cart_total, cart_items)
+            results.append(CouponCheck(coupon, eligible, message))
+    return results
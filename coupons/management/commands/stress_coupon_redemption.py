@@ -0,0 +1,88 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from coupons.models import Coupon, CouponUsage
+from coupons.services import complete_coupon_usage
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer one throwaway coupon with concurrent redemptions and check that "
+        "the global and per-user limits hold exactly. Cleans up after itself."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16, help="Concurrent redeemers (DB connections).")
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--attempts", type=int, default=10, help="Redemptions tried per user.")
+        parser.add_argument("--limit", type=int, default=200, help="Coupon's global limit.")
+        parser.add_argument("--per-user", type=int, default=2, help="Coupon's per-user limit.")
+        parser.add_argument("--keep", action="store_true", help="Leave the coupon and users in place.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        tag = uuid.uuid4().hex[:8]
+        coupon = Coupon.objects.create(
+            code=f"STRESS{tag.upper()}",
+            title="Stress test",
+            discount=1,
+            coupon_type="flat",
+            expiry_date=date.today() + timedelta(days=1),
+            limit=options["limit"],
+            per_user_limit=options["per_user"],
+        )
+        users = [
+            User.objects.create(username=f"coupon-stress-{tag}-{i}", email=f"coupon-stress-{tag}-{i}@example.com")
+            for i in range(options["users"])
+        ]
+
+        def redeem(chunk):
+            try:
+                return [complete_coupon_usage(user, coupon, None)[0] for user in chunk]
+            finally:
+                connection.close()  # pool threads each opened their own
+
+        workers = max(options["workers"], 1)
+        attempts = [u for _ in range(options["attempts"]) for u in users]
+        chunks = [attempts[i::workers] for i in range(workers)]
+        started = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = [ok for chunk in pool.map(redeem, chunks) for ok in chunk]
+            elapsed = time.monotonic() - started
+
+            coupon.refresh_from_db()
+            per_user = {}
+            for user_id in CouponUsage.objects.filter(coupon=coupon).values_list("user_id", flat=True):
+                per_user[user_id] = per_user.get(user_id, 0) + 1
+            expected = min(options["limit"], options["users"] * options["per_user"])
+
+            self.stdout.write(
+                f"{len(attempts)} attempts, {sum(results)} redeemed in {elapsed:.2f}s "
+                f"({len(attempts) / elapsed:.0f} attempts/s, {options['workers']} workers)"
+            )
+            problems = []
+            if sum(results) != expected:
+                problems.append(f"{sum(results)} successes, expected {expected}")
+            if coupon.used_count != expected:
+                problems.append(f"used_count is {coupon.used_count}, expected {expected}")
+            if sum(per_user.values()) != coupon.used_count:
+                problems.append(f"{sum(per_user.values())} usage rows for used_count {coupon.used_count}")
+            if per_user and max(per_user.values()) > options["per_user"]:
+                problems.append(f"a user redeemed {max(per_user.values())} times (limit {options['per_user']})")
+            if coupon.is_active != (coupon.used_count < coupon.limit):
+                problems.append(f"is_active is {coupon.is_active} at {coupon.used_count}/{coupon.limit}")
+        finally:
+            if not options["keep"]:
+                coupon.delete()
+                User.objects.filter(id__in=[u.id for u in users]).delete()
+
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS(f"✅ Limits held: used_count={coupon.used_count}/{coupon.limit}"))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-16 21:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def number_existing_usages(apps, schema_editor):
+    CouponUsage = apps.get_model('coupons', 'CouponUsage')
+
+    seen = {}
+    batch = []
+    for usage in CouponUsage.objects.order_by('user_id', 'coupon_id', 'used_at', 'id').iterator(chunk_size=1000):
+        key = (usage.user_id, usage.coupon_id)
+        seen[key] = seen.get(key, 0) + 1
+        if usage.slot != seen[key]:
+            usage.slot = seen[key]
+            batch.append(usage)
+    CouponUsage.objects.bulk_update(batch, ['slot'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupons', '0007_deliverypincode_district_alter_deliverypincode_city_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='couponusage',
+            name='slot',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(number_existing_usages, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='couponusage',
+            constraint=models.UniqueConstraint(fields=('user', 'coupon', 'slot'), name='unique_coupon_usage_slot'),
+        ),
+    ]
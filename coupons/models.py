@@ -42,10 +42,10 @@ class Coupon(models.Model):
     def __str__(self):
         return f"{self.code} - {self.discount}{'%' if self.coupon_type == 'percent' else '₹'} off"
     
-    def is_valid(self):
+    def is_valid(self, today=None):
         """Check if coupon is currently valid (basic checks)"""
         from datetime import date
-        today = date.today()
+        today = today or date.today()
         
         if not self.is_active:
             return False, "Coupon is inactive"
@@ -64,15 +64,13 @@ class Coupon(models.Model):
     def check_user_eligibility(self, user):
         """Check if THIS specific user can use this coupon"""
         # Check if first-time only
+        has_previous_orders = False
         if self.first_time_only:
             from orders.models import Order
             has_previous_orders = Order.objects.filter(
                 user=user, 
                 status__in=['PLACED', 'SHIPPED', 'DELIVERED']
             ).exists()
-            
-            if has_previous_orders:
-                return False, "This coupon is only for first-time buyers"
         
         # Check per-user usage limit
         user_usage_count = CouponUsage.objects.filter(
@@ -80,6 +78,13 @@ class Coupon(models.Model):
             coupon=self
         ).count()
         
+        return self.check_user_rules(user_usage_count, has_previous_orders)
+    
+    def check_user_rules(self, user_usage_count, has_previous_orders):
+        """check_user_eligibility() with the user's numbers already looked up"""
+        if self.first_time_only and has_previous_orders:
+            return False, "This coupon is only for first-time buyers"
+        
         if user_usage_count >= self.per_user_limit:
             return False, f"You have already used this coupon {self.per_user_limit} time(s)"
         
@@ -134,12 +139,20 @@ class CouponUsage(models.Model):
     coupon = models.ForeignKey('Coupon', on_delete=models.CASCADE, related_name='usage_records')
     order = models.ForeignKey('orders.Order', on_delete=models.SET_NULL, null=True, blank=True)
     used_at = models.DateTimeField(auto_now_add=True)
+    # 1..coupon.per_user_limit; the unique constraint makes each use a slot
+    slot = models.PositiveIntegerField(default=1)
     
     class Meta:
         ordering = ['-used_at']
         indexes = [
             models.Index(fields=['user', 'coupon']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'coupon', 'slot'],
+                name='unique_coupon_usage_slot'
+            )
+        ]
     
     def __str__(self):
         return f"{self.user.username} used {self.coupon.code}"
@@ -1,38 +1,79 @@
 # coupons/services.py
 
-from django.db import transaction
-from django.db.models import F
+from django.db import IntegrityError, transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+
+from ecomerce.cache import bump
+
+
+class _Unavailable(Exception):
+    pass
+
+
+def _take_user_slot(user, coupon, order):
+    """
+    Insert the CouponUsage row in the lowest free slot (1..per_user_limit).
+    Two redemptions by the same user race for the same slot and the unique
+    constraint lets only one in; the loser looks again.
+    """
+    from coupons.models import CouponUsage
+
+    for _ in range(coupon.per_user_limit + 1):
+        taken = set(
+            CouponUsage.objects.filter(user=user, coupon=coupon).values_list('slot', flat=True)
+        )
+        free = [s for s in range(1, coupon.per_user_limit + 1) if s not in taken]
+        if not free:
+            break
+        try:
+            with transaction.atomic():
+                return CouponUsage.objects.create(user=user, coupon=coupon, order=order, slot=free[0])
+        except IntegrityError:
+            continue
+    raise _Unavailable(f"You have already used this coupon {coupon.per_user_limit} time(s)")
+
+
+def _take_global_use(coupon):
+    """
+    One conditional UPDATE: count a use only while used_count < limit, and
+    switch the coupon off in the same statement when this was the last one.
+    """
+    from coupons.models import Coupon
+
+    claimed = Coupon.objects.filter(
+        id=coupon.id, is_active=True, used_count__lt=F('limit')
+    ).update(
+        used_count=F('used_count') + 1,
+        # SET sees the old used_count, so "old + 1 < limit" means uses are left
+        is_active=ExpressionWrapper(Q(used_count__lt=F('limit') - 1), output_field=BooleanField()),
+    )
+    if not claimed:
+        raise _Unavailable("Coupon usage limit reached")
 
 
 def complete_coupon_usage(user, coupon, order):
     """
     Mark coupon as used by this user and increment global usage count.
     Must be called AFTER successful payment.
-    
+
     Args:
         user: User who used the coupon
         coupon: Coupon object that was applied
         order: Order object that was created
+
+    Returns:
+        (bool, message): False when the per-user or global limit was
+        already reached; nothing is written in that case.
     """
-    from coupons.models import CouponUsage, Coupon
-    
-    with transaction.atomic():
-        # Create usage record (prevents reuse by same user)
-        CouponUsage.objects.get_or_create(
-            user=user,
-            coupon=coupon,
-            defaults={'order': order}
-        )
-        
-        # Atomic increment using F expression (thread-safe)
-        Coupon.objects.filter(id=coupon.id).update(
-            used_count=F('used_count') + 1
-        )
-        
-        # Refresh to get updated count
-        coupon.refresh_from_db()
-        
-        # Auto-deactivate if limit reached
-        if coupon.used_count >= coupon.limit:
-            coupon.is_active = False
-            coupon.save(update_fields=['is_active'])
+    try:
+        with transaction.atomic():
+            # Per-user row first; the contended coupon row is touched last
+            # so its lock is held as briefly as possible
+            _take_user_slot(user, coupon, order)
+            _take_global_use(coupon)
+    except _Unavailable as e:
+        return False, str(e)
+
+    # update() sends no post_save; refresh the in-memory coupon list
+    transaction.on_commit(lambda: bump("coupons"))
+    return True, "Coupon applied"
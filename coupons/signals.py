@@ -0,0 +1,8 @@
+# coupons/signals.py
+from ecomerce.cache import register
+from .models import Coupon
+
+# Active coupons are listed on the product page
+register(Coupon, "catalog")
+# ...and kept in memory by coupons.eligibility
+register(Coupon, "coupons")
@@ -1,3 +1,85 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser, User
 from django.test import TestCase
 
-# Create your tests here.
+from orders.models import Order
+from . import eligibility
+from .eligibility import usable_coupons
+from .models import Coupon, CouponUsage
+
+
+class UsableCouponsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        today = date.today()
+        cls.user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+
+        def coupon(code, order, **fields):
+            fields = {
+                "title": code, "discount": Decimal("10"), "coupon_type": "percent",
+                "start_date": today - timedelta(days=1), "expiry_date": today + timedelta(days=30),
+                "limit": 100, "per_user_limit": 2, "display_order": order, **fields,
+            }
+            return Coupon.objects.create(code=code, **fields)
+
+        cls.open = coupon("OPEN", 1)
+        cls.big_cart = coupon("BIGCART", 2, min_purchase=Decimal("1000"))
+        cls.used_up = coupon("ONCE", 3, per_user_limit=1)
+        cls.first_order = coupon("WELCOME", 4, first_time_only=True)
+        coupon("EXPIRED", 5, expiry_date=today - timedelta(days=1))
+        coupon("SOLDOUT", 6, limit=1, used_count=1)
+        coupon("OFF", 7, is_active=False)
+        CouponUsage.objects.create(user=cls.user, coupon=cls.used_up)
+
+    def setUp(self):
+        # Coupons are cached per process; start every test from the database
+        eligibility._active = (None, 0.0, ())
+
+    def codes(self, checks):
+        return [check.coupon.code for check in checks]
+
+    def test_only_live_coupons_the_user_may_still_use(self):
+        checks = usable_coupons(self.user)
+        self.assertEqual(self.codes(checks), ["OPEN", "BIGCART", "WELCOME"])
+        self.assertTrue(all(check.eligible and check.message == "Eligible" for check in checks))
+
+    def test_agrees_with_the_per_coupon_check(self):
+        live = [c for c in Coupon.objects.filter(is_active=True) if c.is_valid()[0]]
+        expected = [c.code for c in live if c.check_user_eligibility(self.user)[0]]
+        self.assertEqual(self.codes(usable_coupons(self.user)), expected)
+
+    def test_first_time_coupons_hidden_after_an_order(self):
+        Order.objects.create(
+            user=self.user, order_number="T-1", status="PLACED",
+            ship_full_name="Buyer", ship_line1="1 Road", ship_city="Kochi",
+        )
+        self.assertEqual(self.codes(usable_coupons(self.user)), ["OPEN", "BIGCART"])
+
+    def test_anonymous_users_skip_per_user_rules(self):
+        self.assertEqual(self.codes(usable_coupons(AnonymousUser())), ["OPEN", "BIGCART", "ONCE", "WELCOME"])
+
+    def test_cart_rules_use_the_model_messages(self):
+        checks = {check.coupon.code: check for check in usable_coupons(self.user, cart_count=1, cart_total=Decimal("400"))}
+        self.assertTrue(checks["OPEN"].eligible)
+        self.assertEqual(
+            (checks["BIGCART"].eligible, checks["BIGCART"].message),
+            self.big_cart.check_cart_eligibility(1, Decimal("400")),
+        )
+        self.assertFalse(checks["BIGCART"].eligible)
+
+    def test_process_copy_expires_without_a_bump(self):
+        usable_coupons(self.user)
+        # Disabled by another process: no bump reaches this one
+        Coupon.objects.filter(pk=self.open.pk).update(is_active=False)
+        self.assertIn("OPEN", self.codes(usable_coupons(self.user)))
+        version, loaded_at, coupons = eligibility._active
+        eligibility._active = (version, loaded_at - eligibility.ACTIVE_COUPONS_TTL, coupons)
+        self.assertNotIn("OPEN", self.codes(usable_coupons(self.user)))
+
+    def test_user_numbers_are_read_once(self):
+        usable_coupons(self.user)
+        # One grouped usage count plus one orders exists(), however many coupons
+        with self.assertNumQueries(2):
+            usable_coupons(self.user)
@@ -0,0 +1,160 @@
+# ecomerce/cache.py
+"""
+Project-wide caching helpers.
+
+Cached values are grouped ("catalog", "banners", ...). Every key built with
+versioned_key() embeds the current version of its groups, and model signals
+registered through register() bump those versions, so one save invalidates
+every page, fragment and computed value that depended on the group without
+having to know their individual keys.
+
+A bump only reaches other processes through a shared cache
+(settings.SHARED_CACHE, i.e. Redis). Without one, versions also roll over
+every LOCAL_VERSION_SECONDS, so a change made by another process (the job
+worker, refresh_listing_prices, another web worker) shows within a minute.
+Versions start from the clock, so a version key lost to eviction never
+comes back as a number already used for older entries.
+"""
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+CACHE_GROUPS = ("catalog", "banners")
+
+PAGE_CACHE_TIMEOUT = 300
+
+# Without a shared cache, how long one process trusts its own group versions
+LOCAL_VERSION_SECONDS = 60
+
+_VERSION_KEY = "cache:group:{group}"
+_CSRF_PLACEHOLDER = "__csrf_token_placeholder__"
+_csrf_value_re = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+def _seed():
+    """Starting number for a missing version key: milliseconds, above anything handed out before."""
+    return int(time.time() * 1000)
+
+
+def group_versions(*groups):
+    """Current version of each group (one cache round trip)."""
+    groups = groups or CACHE_GROUPS
+    keys = {_VERSION_KEY.format(group=g): g for g in groups}
+    found = cache.get_many(keys.keys())
+    versions = {}
+    for key, group in keys.items():
+        version = found.get(key)
+        if version is None:
+            version = _seed()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+        versions[group] = version
+    if not getattr(settings, "SHARED_CACHE", False):
+        window = int(time.time() // LOCAL_VERSION_SECONDS)
+        versions = {group: f"{version}.{window}" for group, version in versions.items()}
+    return versions
+
+
+def bump(*groups):
+    """Invalidate everything cached under the given groups."""
+    for group in groups:
+        key = _VERSION_KEY.format(group=group)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _seed(), None)
+
+
+def versioned_key(prefix, *parts, groups=("catalog",)):
+    """Cache key for `prefix` + `parts` that changes whenever a group is bumped."""
+    versions = group_versions(*groups)
+    stamp = ".".join(f"{g}{versions[g]}" for g in groups)
+    raw = ":".join(str(p) for p in parts)
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"{prefix}:{stamp}:{digest}"
+
+
+def register(model, *groups):
+    """
+    Bump `groups` whenever an instance of `model` is saved or deleted.
+    Called from each app's signals module.
+    """
+    def _invalidate(sender, **kwargs):
+        bump(*groups)
+
+    uid = f"cache-invalidate:{model._meta.label}:{','.join(groups)}"
+    post_save.connect(_invalidate, sender=model, weak=False, dispatch_uid=uid + ":save")
+    post_delete.connect(_invalidate, sender=model, weak=False, dispatch_uid=uid + ":delete")
+
+
+def _can_use_page_cache(request):
+    """
+    Only anonymous GETs with an empty cart and no pending flash messages see
+    the shared copy; anything personalised renders normally.
+    """
+    from cart.views import CART_SESSION_KEY
+
+    if request.method not in ("GET", "HEAD"):
+        return False
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return False
+    if request.COOKIES.get("messages"):
+        return False
+    session = getattr(request, "session", None)
+    if session is not None and (session.get(CART_SESSION_KEY) or session.get("_messages")):
+        return False
+    return True
+
+
+def cache_anonymous_page(timeout=PAGE_CACHE_TIMEOUT, groups=CACHE_GROUPS):
+    """
+    Server-side cache of a view's HTML for anonymous visitors, keyed by path
+    and query string and invalidated through the group versions.
+
+    CSRF tokens rendered into the page are swapped for a placeholder before
+    storing and replaced with the visitor's own token on every hit.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not _can_use_page_cache(request):
+                return view_func(request, *args, **kwargs)
+
+            query = sorted(request.GET.lists())
+            key = versioned_key("page", request.path, query, groups=groups)
+            cached = cache.get(key)
+            if cached is not None:
+                content = cached["content"].replace(_CSRF_PLACEHOLDER, get_token(request))
+                response = HttpResponse(content, content_type=cached["content_type"], status=cached["status"])
+                response["X-Page-Cache"] = "HIT"
+                return response
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+
+            content = response.content.decode(response.charset)
+            tokens = set(_csrf_value_re.findall(content))
+            if request.META.get("CSRF_COOKIE_NEEDS_UPDATE") and not tokens:
+                # Token used somewhere we can't find it (e.g. inline JS) - don't share this page
+                return response
+            for token in tokens:
+                content = content.replace(token, _CSRF_PLACEHOLDER)
+
+            cache.set(
+                key,
+                {"content": content, "content_type": response["Content-Type"], "status": response.status_code},
+                timeout,
+            )
+            response["X-Page-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
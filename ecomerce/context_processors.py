@@ -1,16 +1,26 @@
-from category.models import Category
+from django.conf import settings
+from django.core.cache import cache
+from category.cache import active_categories
 from wishlist.models import WishlistItem
-from cart.views import CART_SESSION_KEY 
+from cart.views import CART_SESSION_KEY
 from coupons.models import Coupon
-from orders.models import Order  
+from orders.models import Order
+
+# Per-user chrome values; signals on WishlistItem / Order drop these keys.
+# Without a shared cache that only reaches the worker that made the change,
+# so other workers' badges are only trusted for half a minute.
+CHROME_CACHE_TIMEOUT = 60 * 60 if settings.SHARED_CACHE else 30
+WISHLIST_COUNT_KEY = "chrome:wishlist_count:{user_id}"
+CART_COUNT_KEY = "chrome:cart_count:{user_id}"
+HAS_REAL_ORDER_KEY = "chrome:has_real_order:{user_id}"
 
 
 def global_categories(request):
-    """Make categories available to all templates"""
+    """Make categories available to all templates (served from the cache)"""
     return {
-        'categories': Category.objects.filter(is_active=True).order_by('name')
+        'categories': active_categories()
     }
-    
+
 def _session_cart_product_count(request):
     """
     Count distinct product lines in the session cart, not total qty.
@@ -27,15 +37,45 @@ def _session_cart_product_count(request):
                 count += 1
     return count
 
+
+def cart_count_for(request):
+    """Header cart count: session cart for guests, cached line count of the DB cart otherwise."""
+    from cart.store import load_cart, uses_db_cart
+
+    if not uses_db_cart(request):
+        return _session_cart_product_count(request)
+    key = CART_COUNT_KEY.format(user_id=request.user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = sum(len(lines) for lines in load_cart(request).values())
+        cache.set(key, count, CHROME_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate_cart_count(user_id):
+    cache.delete(CART_COUNT_KEY.format(user_id=user_id))
+
+
+def wishlist_count_for(user):
+    key = WISHLIST_COUNT_KEY.format(user_id=user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = WishlistItem.objects.filter(wishlist__user=user).count()
+        cache.set(key, count, CHROME_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate_wishlist_count(user_id):
+    cache.delete(WISHLIST_COUNT_KEY.format(user_id=user_id))
+
+
 def header_counts(request):
-    cart_count = _session_cart_product_count(request)
+    cart_count = cart_count_for(request)
 
     wishlist_count = 0
     user = getattr(request, "user", None)
     if user and user.is_authenticated:
-        wishlist_count = WishlistItem.objects.filter(
-            wishlist__user=user
-        ).count()
+        wishlist_count = wishlist_count_for(user)
 
     return {
         "cart_count": cart_count,
@@ -43,7 +83,23 @@ def header_counts(request):
     }
 
 
-from orders.models import Order
+def has_real_order(user):
+    """Has the user any non-pending, non-failed order? (cached per user)"""
+    key = HAS_REAL_ORDER_KEY.format(user_id=user.pk)
+    flag = cache.get(key)
+    if flag is None:
+        flag = Order.objects.filter(
+            user=user
+        ).exclude(
+            status__in=["PENDING", "FAILED"]
+        ).exists()
+        cache.set(key, flag, CHROME_CACHE_TIMEOUT)
+    return flag
+
+
+def invalidate_has_real_order(user_id):
+    cache.delete(HAS_REAL_ORDER_KEY.format(user_id=user_id))
+
 
 def welcome_banner(request):
     """
@@ -58,10 +114,11 @@ def welcome_banner(request):
         return {"show_welcome_banner": True}
 
     # Logged‑in: has any non‑pending, non‑failed order?
-    has_real_order = Order.objects.filter(
-        user=user
-    ).exclude(
-        status__in=["PENDING", "FAILED"]
-    ).exists()
+    return {"show_welcome_banner": not has_real_order(user)}
+
+
+def cache_versions(request):
+    """Group versions used as {% cache %} fragment keys in the templates."""
+    from ecomerce.cache import group_versions
 
-    return {"show_welcome_banner": not has_real_order}
\ No newline at end of file
+    return {"cache_versions": group_versions()}
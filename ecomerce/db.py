@@ -0,0 +1,164 @@
+# ecomerce/db.py
+"""
+Read-replica routing for reports, exports and dashboards.
+
+Nothing reads from the replica unless asked to: code paths that run heavy
+scans opt in with use_replica(), as a context manager or decorator, and
+everything else keeps using the primary. Writes always go to the primary.
+
+    @use_replica()
+    def sales_report(request): ...
+
+    with use_replica():
+        rows = list(big_queryset)
+
+Reads fall back to the primary when
+  - no replica is configured (DATABASES has no REPLICA_DATABASE alias),
+  - the primary is inside transaction.atomic(),
+  - something was written earlier in the same request, or
+  - the browser wrote something in the last REPLICA_STICKY_SECONDS
+    (ReplicaStickinessMiddleware remembers that in a cookie),
+so a user never reads data older than their own last change.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = "db_primary_until"
+
+_state = ContextVar("db_routing_state", default=None)
+
+
+class _RoutingState:
+    __slots__ = ("replica_depth", "wrote", "sticky")
+
+    def __init__(self, sticky=False):
+        self.replica_depth = 0
+        self.wrote = False
+        self.sticky = sticky
+
+
+def replica_alias():
+    """The configured replica alias, or None when there isn't one."""
+    alias = getattr(settings, "REPLICA_DATABASE", "replica")
+    return alias if alias in settings.DATABASES else None
+
+
+def _reads_on_replica():
+    state = _state.get()
+    if state is None or state.replica_depth == 0:
+        return False
+    if state.wrote or state.sticky:
+        return False
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return False
+    return replica_alias() is not None
+
+
+@contextmanager
+def use_replica():
+    """Send reads inside the block (or decorated function) to the replica."""
+    state = _state.get()
+    token = None
+    if state is None:
+        state = _RoutingState()
+        token = _state.set(state)
+    state.replica_depth += 1
+    try:
+        yield
+    finally:
+        state.replica_depth -= 1
+        if token is not None:
+            _state.reset(token)
+
+
+@contextmanager
+def isolated_routing():
+    """
+    Run the block under its own routing state: its writes don't count as
+    "wrote in this request", so the surrounding use_replica() block keeps
+    reading from the replica (e.g. progress updates in a long export).
+    """
+    token = _state.set(_RoutingState())
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+def iter_on_replica(iterable):
+    """
+    Wrap the body of a StreamingHttpResponse so its queries run on the
+    replica. The body is consumed after the view (and the request's
+    routing state) has returned, so the decision is taken now, while the
+    view is still in use_replica(), and each step re-enters use_replica()
+    itself. A request that was pinned to the primary keeps it.
+    """
+    if not _reads_on_replica():
+        return iter(iterable)
+    return _replica_steps(iter(iterable))
+
+
+def _replica_steps(it):
+    while True:
+        with use_replica():
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+
+class ReplicaRouter:
+    """Route reads to the replica inside use_replica(); everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if _reads_on_replica():
+            return replica_alias()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so rows from either relate freely
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Gives each request its own routing state and pins the browser to the
+    primary for a few seconds after any request that wrote to the database.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            primary_until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            primary_until = 0
+        state = _RoutingState(sticky=primary_until > time.time())
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            seconds = getattr(settings, "REPLICA_STICKY_SECONDS", 10)
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time()) + seconds),
+                max_age=seconds, httponly=True, samesite="Lax",
+            )
+        return response
@@ -0,0 +1,86 @@
+# ecomerce/exports.py
+"""
+Streaming CSV downloads shared by the sales and wallet exports.
+
+    rows = qs.values_list(...).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return csv_response(HEADERS, (format_row(r) for r in rows), "report.csv",
+                        compress=wants_gzip(request))
+
+Rows are pulled from a server-side cursor as the client reads, encoded
+into ~64 KB blocks and handed to StreamingHttpResponse, so memory stays
+flat however many rows there are and the first bytes go out before the
+last row is read. With compress=True the blocks go through a gzip
+compressor first and the download is a .csv.gz.
+"""
+import csv
+import zlib
+
+from django.http import StreamingHttpResponse
+
+from .db import iter_on_replica
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Bytes buffered before a block is sent to the client
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows):
+    """Generator of CSV lines (header first) for an iterable of row sequences."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def encode_blocks(lines, block_size=STREAM_BLOCK_SIZE):
+    """Join text lines into UTF-8 blocks of roughly `block_size` bytes."""
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= block_size:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzip_blocks(blocks):
+    """Compress a stream of byte blocks into a single gzip member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def wants_gzip(request):
+    """True when the export was asked for compressed (?gzip=1)."""
+    return request.GET.get("gzip") in ("1", "true", "yes")
+
+
+def csv_response(header, rows, filename, compress=False):
+    """
+    StreamingHttpResponse that downloads `rows` as CSV named `filename`
+    (gzip-compressed, with ".gz" appended, when `compress`). Queries run
+    lazily while streaming, on the replica if the view was in use_replica().
+    """
+    blocks = encode_blocks(csv_lines(header, rows))
+    content_type = "text/csv; charset=utf-8"
+    if compress:
+        blocks = gzip_blocks(blocks)
+        content_type = "application/gzip"
+        filename += ".gz"
+    response = StreamingHttpResponse(iter_on_replica(blocks), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     #social apps
     'cloudinary_storage',  
     'cloudinary', 
@@ -64,6 +65,7 @@ INSTALLED_APPS = [
     'category',
     'user_profile',
     'payments',  
+    'jobs',
     'social_django',
     'shop',
     "widget_tweaks",
@@ -83,6 +85,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ecomerce.db.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
@@ -108,6 +111,7 @@ TEMPLATES = [
                 'ecomerce.context_processors.global_categories',  
                 "ecomerce.context_processors.header_counts",
                 "ecomerce.context_processors.welcome_banner",
+                "ecomerce.context_processors.cache_versions",
             ],
 
         },
@@ -131,6 +135,49 @@ DATABASES = {
     }
 }
 
+# Read replica for reports, exports and dashboards (see ecomerce/db.py).
+# Without DB_REPLICA_HOST everything reads from the primary.
+REPLICA_DATABASE = 'replica'
+# Seconds a browser keeps reading from the primary after it wrote something
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES[REPLICA_DATABASE] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['ecomerce.db.ReplicaRouter']
+
+
+# Cache
+# Local memory by default; set REDIS_URL (needs the `redis` package) to share
+# the cache between worker processes. Only a shared cache carries invalidation
+# (ecomerce.cache.bump) from one process - a management command, the job
+# worker, another web worker - to the rest; without one, cached pages,
+# fragments and lists are only trusted for about a minute.
+SHARED_CACHE = bool(os.getenv('REDIS_URL'))
+
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'TIMEOUT': 300,
+            'KEY_PREFIX': 'audioaura',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'audioaura',
+            'TIMEOUT': 300,
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -229,6 +276,17 @@ import cloudinary.api
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# Generated sales report files (kept off Cloudinary, served only to admins)
+EXPORTS_ROOT = os.getenv('EXPORTS_ROOT', os.path.join(BASE_DIR, 'exports'))
+
+# Rendered invoice PDFs, content-addressed (see orders/invoices.py)
+INVOICES_ROOT = os.getenv('INVOICES_ROOT', os.path.join(BASE_DIR, 'invoices'))
+INVOICE_RENDER_WORKERS = int(os.getenv('INVOICE_RENDER_WORKERS', '2'))
+INVOICE_RENDER_TIMEOUT = int(os.getenv('INVOICE_RENDER_TIMEOUT', '30'))
+
+# Minutes an unpaid Razorpay checkout keeps its stock before the sweeper releases it
+STOCK_HOLD_MINUTES = int(os.getenv('STOCK_HOLD_MINUTES', '15'))
+
 # Cloudinary configuration
 CLOUDINARY_STORAGE = {
     'CLOUD_NAME': os.getenv('CLOUDINARY_CLOUD_NAME'),
@@ -255,6 +313,10 @@ RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID')
 RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
 RAZOR_KEY_ID = os.getenv('RAZOR_KEY_ID')
 RAZOR_KEY_SECRET =os.getenv('RAZOR_KEY_SECRET')
+# Point at `manage.py fake_razorpay` for local tests/benchmarks, e.g. http://127.0.0.1:8765
+RAZORPAY_BASE_URL = os.getenv('RAZORPAY_BASE_URL')
+# Seconds before a gateway call is abandoned (refund workers retry it later)
+RAZORPAY_TIMEOUT = float(os.getenv('RAZORPAY_TIMEOUT', '15'))
 
 
 STORAGES = {
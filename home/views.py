@@ -1,8 +1,11 @@
 # home/views.py
 from django.shortcuts import render, redirect
 from django.views.decorators.cache import never_cache
+from ecomerce.cache import cache_anonymous_page
 from category.models import Category
+from category.cache import active_categories
 from products.models import Product  
+from products.pricing import apply_prices
 from django.http import JsonResponse
 from django.urls import reverse
 from decimal import Decimal
@@ -15,6 +18,7 @@ from banner.models import DealOfMonth, DealImage, FeaturedProduct
 
 
 @never_cache
+@cache_anonymous_page()
 def HomePage(request):
     featured_products = FeaturedProduct.objects.filter(is_active=True)[:4]
     active_deal = DealOfMonth.objects.filter(
@@ -27,7 +31,7 @@ def HomePage(request):
     today = timezone.now().date()
     
     # Fetch all active categories for display
-    categories = Category.objects.filter(is_active=True)
+    categories = active_categories()
 
     # Priority list of possible product ordering fields
     order_fields = ['-created_at', '-added_on', '-updated_at', '-id']
@@ -47,13 +51,10 @@ def HomePage(request):
     latest_products = Product.objects.filter(
         is_listed=True,
         category__is_active=True  # ✅ NEW: Only active categories
-    ).select_related('category').order_by(order_by)[:8]
+    ).select_related('category').prefetch_related('images').order_by(order_by)[:8]
 
-    # Enrich with price and offers info
-    for p in latest_products:
-        p.final_price = p.get_final_price()
-        p.discount_percent = p.get_discount_percent()
-        p.extra_off = p.get_extra_off()
+    # Enrich with price and offers info (constant number of queries)
+    latest_products = apply_prices(latest_products)
     
     # Get active banners (today is already defined above)
     banners = Banner.objects.filter(
@@ -127,7 +128,7 @@ def filter_new_arrivals(request):
         order_field = '-id'
 
     # Get the latest 12 products based on order field
-    latest_products = qs.order_by(order_field)[:12]
+    latest_products = apply_prices(qs.prefetch_related('images').order_by(order_field)[:12])
 
     # Build HTML for all product cards
     cards_html = ""
@@ -146,7 +147,7 @@ def filter_new_arrivals(request):
             sub_html = (
                 f'<div class="aa-sub">'
                 f'<span class="aa-mrp">₹{p.base_price}</span>'
-                f'<span class="aa-off">{p.get_discount_percent()}% off</span>'
+                f'<span class="aa-off">{p.discount_percent}% off</span>'
                 f'</div>'
             )
 
@@ -200,7 +201,7 @@ def filter_new_arrivals(request):
     return JsonResponse({
         'success': True,
         'html': cards_html,
-        'count': latest_products.count() if hasattr(latest_products, 'count') else len(latest_products)
+        'count': len(latest_products)
     })
 
 
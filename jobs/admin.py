@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "task", "status", "attempts", "run_at", "finished_at")
+    list_filter = ("status", "task")
+    search_fields = ("task", "idem_key")
+    readonly_fields = ("created_at", "finished_at", "locked_at", "locked_by", "last_error")
@@ -0,0 +1,64 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.queue import requeue_stale, work
+
+
+def _worker(batch_size, poll_interval, stop):
+    # Parent connections must not be shared across the fork
+    connections.close_all()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(batch_size=batch_size, poll_interval=poll_interval, stop=stop)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background job workers (OTP emails, admin notifications, referral credits ...). "
+        "Keep it running under systemd/supervisor; use --once from cron instead if preferred."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes to start.")
+        parser.add_argument("--batch-size", type=int, default=10, help="Jobs claimed per poll.")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when idle.")
+        parser.add_argument("--once", action="store_true", help="Drain due jobs in this process, then exit.")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Re-queued {requeued} stale job(s)"))
+
+        if options["once"]:
+            succeeded, failed = work(batch_size=options["batch_size"], once=True)
+            self.stdout.write(self.style.SUCCESS(f"✅ {succeeded} job(s) done, {failed} failed or retrying"))
+            return
+
+        stop = multiprocessing.Event()
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(
+                target=_worker,
+                args=(options["batch_size"], options["poll_interval"], stop),
+                daemon=True,
+            )
+            for _ in range(max(options["workers"], 1))
+        ]
+        for p in processes:
+            p.start()
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(processes)} job worker(s) started"))
+
+        def shutdown(*_):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        try:
+            for p in processes:
+                p.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for p in processes:
+                p.join()
+        self.stdout.write("Job workers stopped")
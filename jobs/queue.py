@@ -0,0 +1,189 @@
+# jobs/queue.py
+"""
+Database-backed job queue for slow side effects (SMTP, payment gateways,
+PDF rendering) so requests don't wait on third-party network time.
+
+    from jobs.queue import enqueue, task
+
+    @task("orders.notify_admins")
+    def notify_admins(subject, message): ...
+
+    enqueue("orders.notify_admins", subject=..., message=...)
+
+enqueue() inserts a row in the caller's transaction: the job only becomes
+visible to workers when that transaction commits and vanishes if it rolls
+back. Workers (`manage.py run_jobs`) claim rows with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can poll the table
+without handing the same job out twice. Failures retry with exponential
+backoff until max_attempts, then stay FAILED for inspection in the admin.
+Tasks must be idempotent: a worker dying mid-job means it runs again.
+Arguments named in `redact` (one-time codes and the like) are blanked out
+of the stored row once the job is finished with them.
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+REDACTED = "[redacted]"
+
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 60 * 60
+# RUNNING jobs older than this are assumed orphaned by a dead worker
+STALE_AFTER = timedelta(minutes=15)
+
+
+def task(name, max_attempts=5, redact=()):
+    """
+    Register a function as a job handler under `name`. kwargs listed in
+    `redact` are not kept on the job once it is DONE or finally FAILED.
+    """
+    def decorator(func):
+        TASKS[name] = (func, max_attempts, tuple(redact))
+        func.task_name = name
+        return func
+    return decorator
+
+
+def enqueue(name, idem_key=None, delay=0, **kwargs):
+    """
+    Queue `name(**kwargs)`. kwargs must be JSON-serialisable. With an
+    `idem_key`, enqueueing the same key again is a no-op. `delay` is in
+    seconds. Returns the Job, or None when the key already existed.
+    """
+    from .models import Job
+
+    if name not in TASKS:
+        raise KeyError(f"Unknown task {name!r}")
+    _, max_attempts, _ = TASKS[name]
+    fields = {
+        "task": name,
+        "kwargs": kwargs,
+        "max_attempts": max_attempts,
+        "run_at": timezone.now() + timedelta(seconds=delay),
+    }
+    if idem_key is None:
+        return Job.objects.create(**fields)
+    job, created = Job.objects.get_or_create(idem_key=idem_key, defaults=fields)
+    return job if created else None
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number `attempts` (10s, 20s, 40s ... capped at 1h)."""
+    return min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(batch_size=10, worker=None):
+    """Lock and mark RUNNING up to `batch_size` due jobs. Returns them."""
+    from .models import Job
+
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Job.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=Job.Status.QUEUED, run_at__lte=now)
+            .order_by("run_at", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids).update(
+            status=Job.Status.RUNNING,
+            attempts=F("attempts") + 1,
+            locked_by=worker or worker_name(),
+            locked_at=now,
+        )
+    return list(Job.objects.filter(id__in=ids).order_by("run_at", "id"))
+
+
+def run(job):
+    """Run one claimed job and record the outcome. Returns True on success."""
+    from .models import Job
+
+    try:
+        func, _, redact = TASKS[job.task]
+    except KeyError:
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.Status.FAILED, last_error=f"Unknown task {job.task!r}", finished_at=timezone.now()
+        )
+        return False
+
+    try:
+        func(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) attempt %s failed", job.pk, job.task, job.attempts, exc_info=True)
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.Status.FAILED, last_error=error, finished_at=timezone.now(),
+                **_redacted(job, redact),
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.Status.QUEUED,
+                last_error=error,
+                run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)),
+            )
+        return False
+    finally:
+        close_old_connections()
+
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.Status.DONE, finished_at=timezone.now(), last_error="", **_redacted(job, redact)
+    )
+    return True
+
+
+def _redacted(job, redact):
+    """The update that blanks `redact` out of job.kwargs ({} when there's nothing to hide)."""
+    if not any(key in job.kwargs for key in redact):
+        return {}
+    return {"kwargs": {key: REDACTED if key in redact else value for key, value in job.kwargs.items()}}
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """Put RUNNING jobs whose worker died back in the queue. Returns how many."""
+    from .models import Job
+
+    return Job.objects.filter(
+        status=Job.Status.RUNNING, locked_at__lt=timezone.now() - older_than
+    ).update(status=Job.Status.QUEUED, run_at=timezone.now())
+
+
+def work(batch_size=10, poll_interval=1.0, once=False, stop=None):
+    """
+    Worker loop: claim, run, repeat. With once=True, return when nothing
+    is due. `stop` is an optional threading/multiprocessing Event.
+    Returns (succeeded, failed).
+    """
+    worker = worker_name()
+    succeeded = failed = 0
+    while not (stop and stop.is_set()):
+        close_old_connections()
+        jobs = claim(batch_size, worker)
+        if not jobs:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        for job in jobs:
+            if run(job):
+                succeeded += 1
+            else:
+                failed += 1
+    return succeeded, failed
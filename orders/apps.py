@@ -9,3 +9,7 @@ class OrdersConfig(AppConfig):
     
     # Signal-based refunds disabled to prevent double refunds
     # Refunds now handled manually in views using refund_service.py
+
+    def ready(self):
+        # Cache invalidation only (no refund side effects)
+        from . import signals  # noqa
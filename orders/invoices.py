@@ -0,0 +1,147 @@
+# orders/invoices.py
+"""
+Invoice PDFs, rendered once and served from disk.
+
+The invoice HTML is cheap to render; the PDF is not. Each PDF is stored
+under INVOICES_ROOT named by the SHA-256 of the HTML it was made from, so
+any change that shows on the invoice (item status, prices, address,
+delivery date ...) gives a new name and the stale file is simply never
+asked for again. Conversion runs in a small process pool with a timeout so
+a hung wkhtmltopdf can't pin a request worker. `manage.py
+pregenerate_invoices` renders delivered orders ahead of the first click.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+WKHTMLTOPDF_OPTIONS = {
+    'page-size': 'A4',
+    'margin-top': '0mm',
+    'margin-right': '0mm',
+    'margin-bottom': '0mm',
+    'margin-left': '0mm',
+    'encoding': 'UTF-8',
+    'enable-local-file-access': None,
+    'dpi': 300,
+    'image-quality': 100,
+}
+WINDOWS_WKHTMLTOPDF = r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def html_to_pdf(html):
+    """
+    HTML -> PDF bytes. Runs inside a pool process, so it only touches
+    pdfkit/xhtml2pdf (no Django). Falls back to xhtml2pdf when the
+    wkhtmltopdf binary isn't installed.
+    """
+    import pdfkit
+
+    try:
+        if os.path.exists(WINDOWS_WKHTMLTOPDF):
+            config = pdfkit.configuration(wkhtmltopdf=WINDOWS_WKHTMLTOPDF)
+        else:
+            config = pdfkit.configuration()
+    except OSError:
+        config = None
+
+    if config is not None:
+        return pdfkit.from_string(html, False, options=WKHTMLTOPDF_OPTIONS, configuration=config)
+
+    from io import BytesIO
+    from xhtml2pdf import pisa
+
+    out = BytesIO()
+    result = pisa.CreatePDF(html, dest=out, encoding='utf-8')
+    if result.err:
+        raise RuntimeError(f"xhtml2pdf failed with {result.err} error(s)")
+    return out.getvalue()
+
+
+def _get_pool():
+    global _pool
+    from django.conf import settings
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.INVOICE_RENDER_WORKERS)
+        return _pool
+
+
+def _reset_pool():
+    """Drop a pool with a stuck worker; the next render starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        for process in list(getattr(pool, "_processes", {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_pdf(html, timeout=None):
+    """Convert in the process pool. Returns bytes, or None on error/timeout."""
+    from django.conf import settings
+
+    timeout = timeout or settings.INVOICE_RENDER_TIMEOUT
+    future = _get_pool().submit(html_to_pdf, html)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        print(f"❌ PDF Error: render timed out after {timeout}s")
+        _reset_pool()
+    except Exception as e:
+        print(f"❌ PDF Error: {e}")
+    return None
+
+
+def invoice_storage():
+    from django.conf import settings
+    from django.core.files.storage import FileSystemStorage
+
+    return FileSystemStorage(location=settings.INVOICES_ROOT)
+
+
+def invoice_html(order, items):
+    from django.template.loader import render_to_string
+
+    return render_to_string("invoices/invoice.html", {"order": order, "items": items})
+
+
+def invoice_path(order, items):
+    """
+    Absolute path of the PDF for this order/items as they look right now,
+    rendering it first if it doesn't exist yet. None if rendering failed.
+    """
+    html = invoice_html(order, items)
+    digest = hashlib.sha256(html.encode("utf-8")).hexdigest()
+    storage = invoice_storage()
+    name = os.path.join(digest[:2], f"{digest}.pdf")
+    path = storage.path(name)
+    if os.path.exists(path):
+        return path
+
+    pdf = render_pdf(html)
+    if not pdf:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write-then-rename so a concurrent reader never sees half a file
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".part", delete=False) as tmp:
+        tmp.write(pdf)
+    os.replace(tmp.name, path)
+    return path
+
+
+def invoice_response(order, items, filename):
+    """FileResponse for the invoice, or a 500 like the old on-the-fly renderer."""
+    from django.http import FileResponse, HttpResponse
+
+    path = invoice_path(order, items)
+    if not path:
+        return HttpResponse("Error generating PDF", status=500)
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=filename, content_type="application/pdf")
@@ -0,0 +1,42 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.invoices import invoice_path
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Render invoice PDFs for recently delivered orders so the customer's first "
+        "download is a file read. Run nightly (or more often) from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=2, help="Orders delivered within this many days.")
+        parser.add_argument("--all", action="store_true", help="Every delivered order, regardless of date.")
+
+    def handle(self, *args, **options):
+        started = time.time()
+        orders = Order.objects.filter(status="DELIVERED").prefetch_related("items").order_by("id")
+        if not options["all"]:
+            orders = orders.filter(delivered_at__gte=timezone.now() - timedelta(days=options["days"]))
+
+        rendered = cached = failed = 0
+        for order in orders.iterator(chunk_size=200):
+            items = order.items.all()
+            path = invoice_path(order, items)
+            if path is None:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"Invoice for {order.order_number} failed"))
+            elif os.path.getmtime(path) >= started:
+                rendered += 1
+            else:
+                cached += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ {rendered} invoice(s) rendered, {cached} already current, {failed} failed")
+        )
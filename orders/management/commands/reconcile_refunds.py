@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from orders.refund_service import reconcile_refunds
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-send Razorpay refunds stuck in the outbox and pull final refund statuses "
+        "from Razorpay. Run every few minutes from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="Gateway calls in flight at once.")
+        parser.add_argument(
+            "--stale-minutes", type=int, default=15,
+            help="Only re-send PENDING/unconfirmed refunds untouched for this long.",
+        )
+
+    def handle(self, *args, **options):
+        summary = reconcile_refunds(concurrency=options["concurrency"], stale_minutes=options["stale_minutes"])
+        if not summary:
+            self.stdout.write(self.style.SUCCESS("✅ No refunds to reconcile"))
+            return
+        counts = ", ".join(f"{n} {status.lower()}" for status, n in sorted(summary.items()))
+        self.stdout.write(self.style.SUCCESS(f"✅ Reconciled refunds: {counts}"))
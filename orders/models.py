@@ -1,6 +1,6 @@
 # orders/models.py
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta, date
@@ -89,7 +89,20 @@ class Order(models.Model):
 
     def __str__(self):
         return f'{self.order_number} - {self.user}'
-    
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if self._state.adding or self.pk is None or (
+            update_fields is not None and not {"status", "total_amount"} & set(update_fields)
+        ):
+            return super().save(*args, **kwargs)
+        from admin_side.rollups import lock_counted_state
+
+        with transaction.atomic():
+            # The rollups' "before" comes from the locked row, not from when this instance was loaded
+            lock_counted_state(self)
+            super().save(*args, **kwargs)
+
     # ✅ NEW: Check if order is delayed
     def is_delayed(self):
         """Check if order delivery is delayed"""
@@ -109,8 +122,11 @@ class Order(models.Model):
         return False
     
     # ✅ NEW: Calculate delivery date with auto-extension
-    def calculate_delivery_date(self):
-        """Calculate expected delivery date (auto-extends if delayed)"""
+    def calculate_delivery_date(self, persist=True):
+        """
+        Calculate expected delivery date (auto-extends if delayed).
+        With persist=False the extended date is only returned, not saved.
+        """
         # If already delivered
         if self.status == 'DELIVERED' and self.delivered_at:
             return self.delivered_at.date()
@@ -121,7 +137,10 @@ class Order(models.Model):
         
         # Check if delayed and auto-extend
         if self.is_delayed():
-            self.auto_extend_delivery_date(days=3)
+            if persist:
+                self.auto_extend_delivery_date(days=3)
+            elif self.status in ['PLACED', 'CONFIRMED', 'SHIPPED']:
+                return date.today() + timedelta(days=3)
         
         # Return current expected date
         if self.expected_delivery_date:
@@ -134,9 +153,9 @@ class Order(models.Model):
         return None
     
     # ✅ NEW: Get formatted delivery date
-    def get_delivery_date_formatted(self):
+    def get_delivery_date_formatted(self, persist=True):
         """Get formatted delivery date like 'Friday, 29 November'"""
-        delivery_date = self.calculate_delivery_date()
+        delivery_date = self.calculate_delivery_date(persist=persist)
         if delivery_date:
             return delivery_date.strftime('%A, %d %B')
         return "To be confirmed"
@@ -440,10 +459,15 @@ class ActionRequest(models.Model):
 
 
 class Refund(models.Model):
-    """Track all refunds for auditing and reconciliation"""
+    """
+    Track all refunds for auditing and reconciliation.
+    Razorpay refunds are written PENDING in the cancel/return transaction and
+    sent by a job worker after commit (see orders.refund_service).
+    """
     
     class RefundStatus(models.TextChoices):
         PENDING = 'PENDING', 'Pending'
+        PROCESSING = 'PROCESSING', 'Processing'
         COMPLETED = 'COMPLETED', 'Completed'
         FAILED = 'FAILED', 'Failed'
     
@@ -466,10 +490,22 @@ class Refund(models.Model):
     reason = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=RefundStatus.choices, default=RefundStatus.PENDING)
     
+    # razorpay / wallet / store_credit
+    method = models.CharField(max_length=20, blank=True)
+    # One refund per key (e.g. "refund:order_item:<id>")
+    idem_key = models.CharField(max_length=100, unique=True, null=True, blank=True)
+
     # Wallet transaction reference
     wallet_transaction_id = models.CharField(max_length=100, blank=True, null=True)
+
+    # Gateway dispatch / reconciliation
+    gateway_refund_id = models.CharField(max_length=100, blank=True, null=True)
+    gateway_status = models.CharField(max_length=20, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     processed_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
@@ -477,6 +513,7 @@ class Refund(models.Model):
         indexes = [
             models.Index(fields=['order', 'status']),
             models.Index(fields=['order_item']),
+            models.Index(fields=['status', 'updated_at']),
         ]
     
     def __str__(self):
@@ -1,155 +1,180 @@
 # orders/refund_service.py
+"""
+Item refunds.
 
+Wallet and store-credit refunds are local and happen inside the caller's
+transaction. Razorpay refunds follow an outbox: process_order_item_refund()
+only writes a PENDING Refund row (plus a job) in the cancel/return
+transaction, so no row lock is held across the gateway call. The job
+worker runs dispatch_refund() after commit; reconcile_refunds() (cron,
+`manage.py reconcile_refunds`) re-sends stuck rows and pulls final
+statuses from Razorpay.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from decimal import Decimal
-from django.db import transaction
+
+import razorpay
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
 from django.utils import timezone
-import razorpay
+
+from jobs.queue import enqueue
+from payments.gateway import razorpay_client
 from wallet.services import credit
 from wallet.models import WalletAccount
 
+logger = logging.getLogger(__name__)
+
 
-# Initialize Razorpay client
-razorpay_client = razorpay.Client(
-    auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
-)
+def _duplicate():
+    return {
+        'success': False,
+        'method': 'duplicate',
+        'amount': Decimal('0'),
+        'message': 'Refund already processed'
+    }
 
 
 @transaction.atomic
 def process_order_item_refund(order_item, reason="Order cancellation/return"):
     """
     Process refund based on ORIGINAL payment method.
-    
+
     Rules:
-    - Razorpay payment → Refund to Razorpay
+    - Razorpay payment → Refund to Razorpay (queued, sent after commit)
     - Wallet payment → Refund to Wallet
     - COD → Credit to Wallet (store credit)
-    
+
     Args:
         order_item: OrderItem instance
         reason: Refund reason string
-        
+
     Returns:
         dict: {
             'success': bool,
             'method': str,
             'amount': Decimal,
+            'queued': bool (optional, Razorpay refunds),
             'refund_id': str (optional)
         }
     """
-    
+    from .models import Refund
+
     order = order_item.order
     refund_amount = order.calculate_item_refund(order_item)
-    
-    print(f"🔍 Processing refund for Order: {order.order_number}")
-    print(f"💳 Payment Method: {order.payment_method}")
-    print(f"💰 Refund Amount: ₹{refund_amount}")
-    print(f"📦 Item: {order_item.product_name}")
-    
-    # ✅ CRITICAL: Check if already refunded
-    if hasattr(order_item, 'refund_status') and order_item.refund_status in ['COMPLETED', 'PROCESSING']:
-        print(f"⚠️ Refund already processed for item {order_item.id}")
-        return {
-            'success': False,
-            'method': 'duplicate',
-            'amount': Decimal('0'),
-            'message': 'Refund already processed'
-        }
-    
+    idem_key = f"refund:order_item:{order_item.id}"
+
+    logger.info(
+        "Refund of %s for order %s item %s (%s)", refund_amount, order.order_number, order_item.id, order.payment_method,
+        extra={"order_id": order.id, "order_item_id": order_item.id, "refund_amount": str(refund_amount),
+               "payment_method": order.payment_method},
+    )
+
+    # ✅ CRITICAL: Check if already refunded (or queued)
+    if order_item.refund_status in ['PENDING', 'COMPLETED', 'PROCESSING'] or Refund.objects.filter(idem_key=idem_key).exists():
+        logger.info("Refund for order item %s already processed", order_item.id, extra={"order_item_id": order_item.id})
+        return _duplicate()
+
     # ============================================
-    # RAZORPAY PAYMENT - Refund via Razorpay API
+    # RAZORPAY PAYMENT - Queue for the Razorpay API
     # ============================================
+    if order.payment_method == 'razorpay' and order.razorpay_payment_id:
+        refund = Refund.objects.create(
+            order=order,
+            order_item=order_item,
+            original_amount=order_item.line_total,
+            refund_amount=refund_amount,
+            reason=reason,
+            method='razorpay',
+            idem_key=idem_key,
+        )
+        order_item.refund_status = 'PENDING'
+        order_item.refund_amount = refund_amount
+        order_item.refund_method = 'razorpay'
+        order_item.save(update_fields=['refund_status', 'refund_amount', 'refund_method'])
+
+        enqueue("orders.dispatch_refund", idem_key=f"refund:dispatch:{refund.id}", refund_id=refund.id)
+        return {
+            'success': True,
+            'method': 'razorpay',
+            'amount': refund_amount,
+            'queued': True,
+            'message': f'Razorpay refund of ₹{refund_amount} initiated',
+        }
+
     if order.payment_method == 'razorpay':
-        return _refund_razorpay(order, order_item, refund_amount, reason)
-    
+        logger.warning(
+            "Order %s has no Razorpay payment id; refunding item %s to the wallet", order.order_number, order_item.id,
+            extra={"order_id": order.id, "order_item_id": order_item.id},
+        )
+        return _refund_wallet(order, order_item, refund_amount, reason, is_cod=False)
+
     # ============================================
     # WALLET PAYMENT - Refund to Wallet
     # ============================================
     elif order.payment_method == 'WALLET':
         return _refund_wallet(order, order_item, refund_amount, reason, is_cod=False)
-    
+
     # ============================================
     # COD PAYMENT - Store Credit to Wallet
     # ============================================
     elif order.payment_method == 'COD':
         return _refund_wallet(order, order_item, refund_amount, reason, is_cod=True)
-    
+
     # ============================================
     # UNKNOWN PAYMENT METHOD - Default to Wallet
     # ============================================
     else:
-        print(f"⚠️ Unknown payment method: {order.payment_method}")
+        logger.warning(
+            "Unknown payment method %r on order %s; refunding to the wallet", order.payment_method, order.order_number,
+            extra={"order_id": order.id, "payment_method": order.payment_method},
+        )
         return _refund_wallet(order, order_item, refund_amount, reason, is_cod=False)
 
 
-def _refund_razorpay(order, order_item, amount, reason):
-    """Refund via Razorpay API"""
-    try:
-        # Check if Razorpay payment ID exists
-        if not order.razorpay_payment_id:
-            print("❌ No Razorpay payment ID found! Falling back to wallet.")
-            return _refund_wallet(order, order_item, amount, reason, is_cod=False)
-        
-        # Create Razorpay refund
-        refund = razorpay_client.payment.refund(
-            order.razorpay_payment_id,
-            {
-                "amount": int(amount * 100),  # Convert to paise
-                "speed": "normal",
-                "notes": {
-                    "order_number": order.order_number,
-                    "item_id": order_item.id,
-                    "reason": reason
-                }
-            }
-        )
-        
-        print(f"✅ Razorpay refund created: {refund['id']}")
-        print(f"   Amount: ₹{amount}")
-        print(f"   Status: {refund['status']}")
-        
-        # Update order item refund tracking
-        if hasattr(order_item, 'refund_id'):
-            order_item.refund_id = refund['id']
-            order_item.refund_status = 'PROCESSING'
-            order_item.refund_amount = amount
-            order_item.refund_method = 'razorpay'
-            order_item.save(update_fields=['refund_id', 'refund_status', 'refund_amount', 'refund_method'])
-        
-        # ✅ NO WALLET CREDIT!
-        return {
-            'success': True,
+def queue_payment_refund(order, reason):
+    """
+    Refund a whole captured Razorpay payment for an order that could not be
+    fulfilled (e.g. paid after its stock hold expired and sold out). Goes
+    through the same outbox as item refunds; queued at most once per order.
+    """
+    from .models import Refund
+
+    refund, created = Refund.objects.get_or_create(
+        idem_key=f"refund:unfulfilled:order:{order.id}",
+        defaults={
+            'order': order,
+            'original_amount': order.total_amount,
+            'refund_amount': order.total_amount,
+            'reason': reason,
             'method': 'razorpay',
-            'amount': amount,
-            'refund_id': refund['id'],
-            'message': f'Razorpay refund initiated: {refund["id"]}'
-        }
-        
-    except razorpay.errors.BadRequestError as e:
-        print(f"❌ Razorpay refund failed: {e}")
-        # Fallback to wallet if Razorpay fails
-        return _refund_wallet(order, order_item, amount, f"{reason} (Razorpay failed)", is_cod=False)
-    
-    except Exception as e:
-        print(f"❌ Unexpected error in Razorpay refund: {e}")
-        return _refund_wallet(order, order_item, amount, f"{reason} (Error)", is_cod=False)
+        },
+    )
+    if created:
+        enqueue("orders.dispatch_refund", idem_key=f"refund:dispatch:{refund.id}", refund_id=refund.id)
+    return refund
+
 
+def _refund_wallet(order, order_item, amount, reason, is_cod=False, refund=None):
+    """Refund to user's wallet. `refund` is the outbox row when falling back from Razorpay."""
+    from .models import Refund
 
-def _refund_wallet(order, order_item, amount, reason, is_cod=False):
-    """Refund to user's wallet"""
     try:
         # Ensure wallet exists
         wallet, _ = WalletAccount.objects.get_or_create(user=order.user)
-        
+
         # Create description
         if is_cod:
             description = f"Store credit: {order_item.product_name} (Order {order.order_number})"
         else:
             description = f"Refund: {order_item.product_name} (Order {order.order_number})"
-        
+
         # ✅ CRITICAL: Use proper idempotency key
         idem_key = f"refund:order_item:{order_item.id}"
-        
+
         # Credit wallet with idempotency
         txn = credit(
             user=order.user,
@@ -158,42 +183,225 @@ def _refund_wallet(order, order_item, amount, reason, is_cod=False):
             reference=str(order.id),  # Keep reference as order ID
             idem_key=idem_key          # Separate idempotency key
         )
-        
+
         if txn is None:
             # Duplicate transaction blocked
-            print(f"⚠️ Duplicate refund blocked for item {order_item.id}")
-            return {
-                'success': False,
-                'method': 'duplicate',
-                'amount': Decimal('0'),
-                'message': 'Refund already processed'
-            }
-        
-        print(f"✅ Wallet credited: ₹{amount}")
-        print(f"   Transaction ID: {txn.id}")
-        
+            logger.info("Duplicate wallet refund blocked for order item %s", order_item.id, extra={"order_item_id": order_item.id})
+            return _duplicate()
+
+        logger.info(
+            "Wallet refund of %s for order item %s (txn %s)", amount, order_item.id, txn.id,
+            extra={"order_item_id": order_item.id, "refund_amount": str(amount), "wallet_txn_id": txn.id},
+        )
+
+        method = 'store_credit' if is_cod else 'wallet'
+        now = timezone.now()
+        audit = {
+            'method': method,
+            'status': Refund.RefundStatus.COMPLETED,
+            'wallet_transaction_id': str(txn.id),
+            'reason': reason,
+            'processed_at': now,
+        }
+        if refund is not None:
+            Refund.objects.filter(pk=refund.pk).update(updated_at=now, **audit)
+        else:
+            Refund.objects.create(
+                order=order,
+                order_item=order_item,
+                original_amount=order_item.line_total,
+                refund_amount=amount,
+                idem_key=idem_key,
+                **audit,
+            )
+
         # Update order item refund tracking
-        if hasattr(order_item, 'refund_status'):
-            order_item.refund_status = 'COMPLETED'
-            order_item.refund_amount = amount
-            order_item.refund_method = 'store_credit' if is_cod else 'wallet'
-            order_item.save(update_fields=['refund_status', 'refund_amount', 'refund_method'])
-        
+        order_item.refund_status = 'COMPLETED'
+        order_item.refund_amount = amount
+        order_item.refund_method = method
+        order_item.refund_processed_at = now
+        order_item.save(update_fields=['refund_status', 'refund_amount', 'refund_method', 'refund_processed_at'])
+
         return {
             'success': True,
-            'method': 'wallet' if not is_cod else 'store_credit',
+            'method': method,
             'amount': amount,
             'transaction_id': txn.id,
             'message': f'Wallet credited: ₹{amount}'
         }
-        
+
     except Exception as e:
-        print(f"❌ Wallet credit failed: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Wallet refund for order item %s failed", order_item.id, extra={"order_item_id": order_item.id})
         return {
             'success': False,
             'method': 'wallet',
             'amount': Decimal('0'),
             'message': f'Wallet credit failed: {str(e)}'
-        }
\ No newline at end of file
+        }
+
+
+# ============================================
+# OUTBOX DISPATCH (job worker) + RECONCILIATION (cron)
+# ============================================
+
+def _receipt(refund):
+    return f"refund-{refund.id}"
+
+
+def _find_gateway_refund(refund):
+    """A refund Razorpay already has for this outbox row (an earlier attempt that timed out), or None."""
+    found = razorpay_client.payment.fetch_multiple_refund(
+        refund.order.razorpay_payment_id, {"count": 100}, timeout=settings.RAZORPAY_TIMEOUT
+    )
+    for gw in found.get("items", []):
+        if gw.get("receipt") == _receipt(refund) or str((gw.get("notes") or {}).get("refund_row")) == str(refund.id):
+            return gw
+    return None
+
+
+def _record_gateway_refund(refund, gw):
+    """Store the gateway's view of a refund on the Refund row and the order item."""
+    from .models import OrderItem, Refund
+
+    done = gw.get("status") == "processed"
+    failed = gw.get("status") == "failed"
+    status = (
+        Refund.RefundStatus.COMPLETED if done
+        else Refund.RefundStatus.FAILED if failed
+        else Refund.RefundStatus.PROCESSING
+    )
+    now = timezone.now()
+    with transaction.atomic():
+        Refund.objects.filter(pk=refund.pk).update(
+            status=status,
+            gateway_refund_id=gw["id"],
+            gateway_status=gw.get("status", ""),
+            processed_at=now if done else None,
+            last_error="",
+            updated_at=now,
+        )
+        if refund.order_item_id:
+            item_fields = {"refund_id": gw["id"], "refund_status": status}
+            if done:
+                item_fields["refund_processed_at"] = now
+            OrderItem.objects.filter(pk=refund.order_item_id).update(**item_fields)
+    return status
+
+
+def dispatch_refund(refund_id):
+    """
+    Send one PENDING Razorpay refund. Runs outside any request transaction.
+    Network errors put the row back to PENDING and re-raise so the job
+    retries with backoff; a BadRequestError (payment not refundable) falls
+    back to a wallet refund.
+    """
+    from .models import Refund
+
+    claimed = Refund.objects.filter(pk=refund_id, status=Refund.RefundStatus.PENDING).update(
+        status=Refund.RefundStatus.PROCESSING, attempts=F("attempts") + 1, updated_at=timezone.now()
+    )
+    if not claimed:
+        return None  # already sent, or another worker has it
+    refund = Refund.objects.select_related("order", "order_item").get(pk=refund_id)
+    order, item = refund.order, refund.order_item
+
+    try:
+        gw = _find_gateway_refund(refund) if refund.attempts > 1 else None
+        if gw is None:
+            gw = razorpay_client.payment.refund(
+                order.razorpay_payment_id,
+                {
+                    "amount": int(refund.refund_amount * 100),  # Convert to paise
+                    "speed": "normal",
+                    "receipt": _receipt(refund),
+                    "notes": {
+                        "order_number": order.order_number,
+                        "item_id": refund.order_item_id,
+                        "refund_row": refund.id,
+                        "reason": refund.reason[:200],
+                    },
+                },
+                timeout=settings.RAZORPAY_TIMEOUT,
+            )
+    except razorpay.errors.BadRequestError as e:
+        logger.warning(
+            "Razorpay refund %s rejected (%s); falling back to the wallet", refund.id, e,
+            extra={"refund_id": refund.id, "order_id": order.id},
+        )
+        Refund.objects.filter(pk=refund.pk).update(last_error=str(e))
+        with transaction.atomic():
+            if item is not None:
+                result = _refund_wallet(order, item, refund.refund_amount, f"{refund.reason} (Razorpay failed)", refund=refund)
+                if result['success']:
+                    return Refund.RefundStatus.COMPLETED
+            Refund.objects.filter(pk=refund.pk).update(status=Refund.RefundStatus.FAILED)
+            return Refund.RefundStatus.FAILED
+    except Exception as e:
+        Refund.objects.filter(pk=refund.pk).update(
+            status=Refund.RefundStatus.PENDING, last_error=str(e), updated_at=timezone.now()
+        )
+        raise
+
+    logger.info(
+        "Razorpay refund %s created for refund %s (%s, %s)", gw["id"], refund.id, refund.refund_amount, gw.get("status"),
+        extra={"refund_id": refund.id, "gateway_refund_id": gw["id"], "refund_amount": str(refund.refund_amount)},
+    )
+    return _record_gateway_refund(refund, gw)
+
+
+def _reconcile_one(refund_id):
+    """Bring one refund up to date with Razorpay. Returns the new status (or None)."""
+    from .models import Refund
+
+    try:
+        refund = Refund.objects.select_related("order").get(pk=refund_id)
+        if refund.status == Refund.RefundStatus.PENDING:
+            return dispatch_refund(refund.id)
+        if refund.gateway_refund_id:
+            gw = razorpay_client.refund.fetch(refund.gateway_refund_id, timeout=settings.RAZORPAY_TIMEOUT)
+        else:
+            # Worker died between claiming and recording: did the gateway get it?
+            gw = _find_gateway_refund(refund)
+            if gw is None:
+                Refund.objects.filter(pk=refund.pk, status=Refund.RefundStatus.PROCESSING).update(
+                    status=Refund.RefundStatus.PENDING, updated_at=timezone.now()
+                )
+                return dispatch_refund(refund.id)
+        return _record_gateway_refund(refund, gw)
+    except Exception as e:
+        Refund.objects.filter(pk=refund_id).update(last_error=str(e))
+        return None
+    finally:
+        connection.close()  # pool threads each opened their own
+
+
+def reconcile_refunds(concurrency=4, stale_minutes=15):
+    """
+    Razorpay refunds that need attention, handled `concurrency` at a time:
+    PENDING rows whose job never ran, PROCESSING rows stuck without a
+    gateway id, and PROCESSING rows waiting for Razorpay to settle.
+    Returns {status: count} for the rows touched.
+    """
+    from .models import Refund
+
+    stale = timezone.now() - timedelta(minutes=stale_minutes)
+    ids = list(
+        Refund.objects.filter(method="razorpay").filter(
+            status=Refund.RefundStatus.PENDING, updated_at__lt=stale,
+        ).values_list("id", flat=True)
+    ) + list(
+        Refund.objects.filter(
+            method="razorpay", status=Refund.RefundStatus.PROCESSING, gateway_refund_id__isnull=True,
+            updated_at__lt=stale,
+        ).values_list("id", flat=True)
+    ) + list(
+        Refund.objects.filter(
+            method="razorpay", status=Refund.RefundStatus.PROCESSING, gateway_refund_id__isnull=False,
+        ).values_list("id", flat=True)
+    )
+
+    summary = {}
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        for status in pool.map(_reconcile_one, ids):
+            summary[status or "unchanged"] = summary.get(status or "unchanged", 0) + 1
+    return summary
@@ -46,3 +46,48 @@ def refund_shipping_if_applicable(order):
                     reference=str(order.id),
                     idem_key=idem,
                 )
+
+
+# Item statuses that close a line for good
+CLOSED_ITEM_STATUSES = ("CANCELLED", "RETURNED")
+
+
+def rollup_status(item_statuses):
+    """
+    Order-level status implied by its item statuses, or None when the items
+    don't decide it (the order keeps the fulfilment status set by admin).
+    """
+    statuses = list(item_statuses)
+    if not statuses:
+        return None
+    if all(s == "DELIVERED" for s in statuses):
+        return "DELIVERED"
+    if all(s in CLOSED_ITEM_STATUSES for s in statuses):
+        return "RETURNED" if "RETURNED" in statuses else "CANCELLED"
+    if "RETURNED" in statuses:
+        return "PARTIALLY_RETURNED"
+    if "CANCELLED" in statuses:
+        return "PARTIALLY_CANCELLED"
+    return None
+
+
+def refresh_order_status(order_id):
+    """
+    Re-derive Order.status from its items (one SELECT, then a locked
+    read + UPDATE only when the status differs).
+    Orders still in checkout (PENDING) or FAILED are left alone.
+    Returns True when the stored status changed.
+    """
+    from admin_side.rollups import update_status
+    from .models import Order, OrderItem
+
+    statuses = OrderItem.objects.filter(order_id=order_id).values_list("status", flat=True)
+    new_status = rollup_status(statuses)
+    if new_status is None:
+        return False
+    return bool(
+        update_status(
+            Order.objects.filter(pk=order_id).exclude(status__in=["PENDING", "FAILED"]),
+            new_status,
+        )
+    )
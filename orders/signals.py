@@ -0,0 +1,28 @@
+# orders/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ecomerce.context_processors import invalidate_has_real_order
+from .models import Order
+
+
+@receiver([post_save, post_delete], sender=Order)
+def refresh_welcome_banner_flag(sender, instance, **kwargs):
+    invalidate_has_real_order(instance.user_id)
+
+
+# ---- Order status rollup ----
+from .models import OrderItem
+from .service import refresh_order_status
+
+
+@receiver(post_save, sender=OrderItem)
+def rollup_order_status_on_item_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "status" not in update_fields:
+        return
+    refresh_order_status(instance.order_id)
+
+
+@receiver(post_delete, sender=OrderItem)
+def rollup_order_status_on_item_delete(sender, instance, **kwargs):
+    refresh_order_status(instance.order_id)
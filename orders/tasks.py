@@ -0,0 +1,15 @@
+# orders/tasks.py
+from django.core.mail import mail_admins
+
+from jobs.queue import task
+
+
+@task("orders.notify_admins")
+def notify_admins(subject, message):
+    mail_admins(subject=subject, message=message, fail_silently=False)
+
+
+@task("orders.dispatch_refund", max_attempts=8)
+def dispatch_refund(refund_id):
+    from .refund_service import dispatch_refund as send
+    send(refund_id)
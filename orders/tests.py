@@ -1,3 +1,94 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+
+from category.models import Category
+from jobs.models import Job
+from payments.views import _settle_razorpay_order
+from products.inventory import hold, reserve, sweep_expired_holds
+from products.models import Product, StockHold
+from .models import Order, OrderItem, Refund
+
+
+class RazorpaySettlementTests(TestCase):
+    """A verified payment meeting its order's stock hold: in time, late, or racing the sweeper."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("payer", "payer@example.com", "pw")
+        category = Category.objects.create(name="Speakers", image="categories/speakers.jpg")
+        cls.product = Product.objects.create(
+            name="Bookshelf Pair", category=category, base_price=Decimal("4999"), stock_quantity=3,
+        )
+
+    def setUp(self):
+        self.order = Order.objects.create(
+            user=self.user, order_number="RZ-1", status="PENDING", payment_method="razorpay",
+            total_amount=Decimal("9998"), ship_full_name="Payer", ship_line1="1 Road", ship_city="Kochi",
+        )
+        item = OrderItem.objects.create(
+            order=self.order, product_id=self.product.id, product_name=self.product.name,
+            quantity=2, unit_price=Decimal("4999"), line_total=Decimal("9998"),
+        )
+        movements = reserve([{"product_id": self.product.id, "variant_id": 0, "quantity": 2, "name": item.product_name}])
+        hold(self.order, movements, order_items=[item], minutes=15)
+
+    def settle(self):
+        return _settle_razorpay_order(self.order.id, self.user, "order_rz", "pay_rz", "sig_rz")
+
+    def sweep(self):
+        return sweep_expired_holds(now=timezone.now() + timedelta(minutes=16))
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock_quantity
+
+    def test_payment_in_time_converts_the_hold(self):
+        order, error = self.settle()
+        self.assertIsNone(error)
+        self.assertEqual((order.status, order.razorpay_payment_id), ("PLACED", "pay_rz"))
+        self.assertEqual(StockHold.objects.get(order=order).status, StockHold.Status.CONVERTED)
+        self.assertEqual(self.stock(), 1)
+
+    def test_payment_before_sweep_keeps_the_stock(self):
+        self.settle()
+        self.assertEqual(self.sweep(), (0, 0))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "PLACED")
+        self.assertEqual(self.stock(), 1)
+
+    def test_late_payment_takes_the_stock_again(self):
+        self.assertEqual(self.sweep(), (1, 1))
+        self.assertEqual(self.stock(), 3)
+
+        order, error = self.settle()
+        self.assertIsNone(error)
+        self.assertEqual(order.status, "PLACED")
+        self.assertEqual(self.stock(), 1)
+        self.assertFalse(Refund.objects.filter(order=order).exists())
+
+    def test_late_payment_without_stock_is_refunded(self):
+        self.sweep()
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=1)  # sold meanwhile
+
+        order, error = self.settle()
+        self.assertIn("refunded", error)
+        self.assertEqual((order.status, order.razorpay_payment_id), ("FAILED", "pay_rz"))
+        self.assertEqual(self.stock(), 1)
+        refund = Refund.objects.get(order=order)
+        self.assertEqual((refund.method, refund.refund_amount), ("razorpay", Decimal("9998")))
+        self.assertTrue(Job.objects.filter(task="orders.dispatch_refund", kwargs={"refund_id": refund.id}).exists())
+
+        # A retried callback neither re-reserves nor queues a second refund
+        self.settle()
+        self.assertEqual(Refund.objects.filter(order=order).count(), 1)
+        self.assertEqual(self.stock(), 1)
 
-# Create your tests here.
+    def test_settled_order_is_not_settled_twice(self):
+        self.settle()
+        order, error = self.settle()
+        self.assertIsNone(order)
+        self.assertEqual(self.stock(), 1)
@@ -1,6 +1,4 @@
 # Orders/views.py
-from django.http import HttpResponse
-from django.template.loader import render_to_string
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.shortcuts import render, redirect, get_object_or_404
@@ -17,14 +15,16 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.cache import never_cache
 from django.contrib import messages
 from .forms import ReturnReasonForm
-from django.core.mail import mail_admins 
-import os
-import pdfkit
+from jobs.queue import enqueue
+from .invoices import invoice_response
 from django.template.loader import get_template
 from decimal import Decimal 
 from payments.views import _gen_order_number
+from products.inventory import hold, log_movements, reserve
+from django.core.exceptions import ValidationError
 from coupons.models import Coupon, DeliveryPincode
-from cart.views import CART_SESSION_KEY, BUY_NOW_SESSION_KEY
+from coupons.eligibility import usable_coupons
+from cart.views import BUY_NOW_SESSION_KEY
 from user.forms import AddressForm
 
 
@@ -47,10 +47,19 @@ from admin_side.views import is_admin
 
 @login_required
 def orderss(request):
-    # Only exclude PENDING (incomplete checkout), but SHOW FAILED orders
+    # Only exclude PENDING (incomplete checkout), but SHOW FAILED orders.
+    # Order.status is kept in step with the items by orders.signals, so this
+    # page only reads; pending cancel/return requests come in one prefetch.
+    pending_requests = Prefetch(
+        "action_requests",
+        queryset=ActionRequest.objects.filter(state="PENDING").only("id", "item_id", "kind"),
+        to_attr="pending_requests",
+    )
     qs = Order.objects.filter(user=request.user).exclude(
         status='PENDING'
-    ).prefetch_related("items")
+    ).prefetch_related(
+        Prefetch("items", queryset=OrderItem.objects.prefetch_related(pending_requests))
+    )
 
     # --- Params ---
     q = (request.GET.get("q") or "").strip()
@@ -93,29 +102,7 @@ def orderss(request):
     allowed_sorts = {"created_at", "-created_at", "total_amount", "-total_amount"}
     if sort not in allowed_sorts:
         sort = "-created_at"
-    qs = qs.order_by(sort)
-
-    # --- Smart auto status update (Flipkart style) ---
-    for o in qs:
-        if o.status == 'FAILED':
-            continue
-            
-        item_statuses = [i.status for i in o.items.all()]
-        if not item_statuses:
-            continue
-        if all(s == "DELIVERED" for s in item_statuses):
-            o.status = "DELIVERED"
-        elif all(s == "CANCELLED" for s in item_statuses):
-            o.status = "CANCELLED"
-        elif all(s == "RETURNED" for s in item_statuses):
-            o.status = "RETURNED"
-        elif any(s == "RETURNED" for s in item_statuses):
-            o.status = "PARTIALLY_RETURNED"
-        elif any(s == "CANCELLED" for s in item_statuses):
-            o.status = "PARTIALLY_CANCELLED"
-        else:
-            o.status = "PROCESSING"
-        o.save(update_fields=["status"])
+    qs = qs.order_by(sort, "-id")
 
     # --- Pagination ---
     paginator = Paginator(qs, 5)
@@ -175,8 +162,9 @@ def orderss(request):
 
             # status-related
             status_class = status_map.get(it.status, "s-blue")
-            pending_return = it.action_requests.filter(kind="RETURN", state="PENDING").exists() if hasattr(it, 'action_requests') else False
-            pending_cancel = it.action_requests.filter(kind="CANCEL", state="PENDING").exists() if hasattr(it, 'action_requests') else False
+            pending_kinds = {ar.kind for ar in it.pending_requests}
+            pending_return = "RETURN" in pending_kinds
+            pending_cancel = "CANCEL" in pending_kinds
             can_cancel = it.status in ["PLACED", "CONFIRMED"] and not pending_cancel
             can_return = it.status == "DELIVERED" and not pending_return
 
@@ -239,7 +227,7 @@ def orderss(request):
             "can_retry": o.status == 'FAILED' and o.created_at >= timezone.now() - timedelta(days=7),
             
             # ✅ Add delivery info
-            "delivery_date": o.get_delivery_date_formatted() if hasattr(o, 'get_delivery_date_formatted') else None,
+            "delivery_date": o.get_delivery_date_formatted(persist=False),
             "is_delivery_delayed": is_delivery_delayed,  # ✅ NEW FLAG
         })
 
@@ -1159,10 +1147,11 @@ def approve_action_request(request, pk):
         )
         
         if refund_result['success']:
+            refunded = "refund initiated" if refund_result.get('queued') else "refunded"
             messages.success(
                 request, 
                 f'{ar.kind.title()} approved. Stock restored and ₹{refund_result["amount"]:.2f} '
-                f'refunded via {refund_result["method"]}.'
+                f'{refunded} via {refund_result["method"]}.'
             )
         else:
             messages.warning(
@@ -1266,7 +1255,8 @@ def request_cancel_item(request, order_number, item_id):
         reason=full_reason
     )
     
-    mail_admins(
+    enqueue(
+        "orders.notify_admins",
         subject=f"Cancel request: {order.order_number}",
         message=f"Item #{item.id} cancel requested by {request.user.email}\n"
                 f"Product: {item.product_name}\n"
@@ -1315,8 +1305,9 @@ def request_return_item(request, order_number, item_id):
         reason=form.cleaned_data["reason"]
     )
     
-    # Send email notification
-    mail_admins(
+    # Send email notification (after commit, from the job worker)
+    enqueue(
+        "orders.notify_admins",
         subject=f"Return request: {order.order_number}",
         message=f"Item #{item.id} return requested by {request.user.email}\nReason: {form.cleaned_data['reason']}"
     )
@@ -1412,9 +1403,10 @@ def cancel_item_now(request, order_number, item_id):
         )
         
         if refund_result['success']:
+            refunded = "refund initiated" if refund_result.get('queued') else "refunded"
             messages.success(
                 request, 
-                f"Item cancelled. ₹{refund_result['amount']:.2f} refunded via {refund_result['method']}."
+                f"Item cancelled. ₹{refund_result['amount']:.2f} {refunded} via {refund_result['method']}."
             )
         else:
             messages.warning(request, "Item cancelled but refund failed. Contact support.")
@@ -1598,7 +1590,8 @@ def checkout_address_update(request, pk):
 @login_required
 def checkout(request):
     """Checkout page with session management and validation"""
-    from cart.views import _clear_expired_checkout_session, _update_checkout_activity, _available_stock
+    from cart.views import _clear_expired_checkout_session, _update_checkout_activity
+    from cart.snapshot import buy_now_snapshot
     
     # Check session expiry
     if _clear_expired_checkout_session(request):
@@ -1611,22 +1604,19 @@ def checkout(request):
     buy_now_line = request.session.get(BUY_NOW_SESSION_KEY)
     
     if buy_now_line:
-        # Validate buy_now product
-        pid = buy_now_line.get('product_id')
-        vid = buy_now_line.get('variant_id')
-        
-        try:
-            product = Product.objects.get(id=pid, is_listed=True)
-            stock = _available_stock(product, vid)
-            if stock <= 0:
-                del request.session[BUY_NOW_SESSION_KEY]
-                messages.error(request, "Product is out of stock.")
-                return redirect('cart')
-        except Product.DoesNotExist:
+        # Validate buy_now product (loaded once, reused by _buy_now_summary)
+        snapshot = buy_now_snapshot(request)
+        if not snapshot.lines:
             del request.session[BUY_NOW_SESSION_KEY]
             messages.error(request, "Product no longer available.")
             return redirect('cart')
         
+        stock = snapshot.lines[0].stock
+        if stock <= 0:
+            del request.session[BUY_NOW_SESSION_KEY]
+            messages.error(request, "Product is out of stock.")
+            return redirect('cart')
+        
         ctx = _buy_now_summary(request)
         ctx['is_buy_now'] = True
         ctx['buy_now_qty'] = buy_now_line.get('qty', 1)
@@ -1653,13 +1643,9 @@ def checkout(request):
         addr = Address.objects.filter(user=request.user).order_by('-id').first()
     ctx['address'] = addr
     
-    # Fetch active coupons
+    # Fetch active coupons this user can still use
     today = date.today()
-    active_coupons = Coupon.objects.filter(
-        is_active=True,
-        expiry_date__gte=today
-    ).order_by('-discount')
-    ctx['coupons'] = active_coupons
+    ctx['coupons'] = [check.coupon for check in usable_coupons(request.user, today=today)]
 
     # Coupon handling
     coupon_discount = Decimal(str(request.session.get('applied_coupon_discount', 0)))
@@ -1895,58 +1881,11 @@ def confirm_order(request):
 """# invoice Download"""
 
 
-def get_wkhtmltopdf_config():
-    """Get wkhtmltopdf configuration"""
-    path = r'C:\Program Files\wkhtmltopdf\bin)\bin\wkhtmltopdf.exe'
-    
-    if os.path.exists(path):
-        return pdfkit.configuration(wkhtmltopdf=path)
-    
-    # Fallback to PATH
-    return pdfkit.configuration()
-
-
-def _render_to_pdf_wkhtmltopdf(template_src, context):
-    """Render HTML to PDF"""
-    html = render_to_string(template_src, context)
-    
-    options = {
-        'page-size': 'A4',
-        'margin-top': '0mm',
-        'margin-right': '0mm',
-        'margin-bottom': '0mm',
-        'margin-left': '0mm',
-        'encoding': 'UTF-8',
-        'enable-local-file-access': None,
-        'dpi': 300,
-        'image-quality': 100,
-    }
-    
-    try:
-        config = get_wkhtmltopdf_config()
-        pdf = pdfkit.from_string(html, False, options=options, configuration=config)
-        return pdf
-    except Exception as e:
-        print(f"❌ PDF Error: {e}")
-        return None
-
-
 @staff_member_required
 def admin_download_invoice(request, pk):
-    """Admin: Download invoice"""
+    """Admin: Download invoice (rendered once per invoice version, see orders.invoices)"""
     order = get_object_or_404(Order.objects.prefetch_related("items"), pk=pk)
-    
-    pdf = _render_to_pdf_wkhtmltopdf("invoices/invoice.html", {
-        "order": order,
-        "items": order.items.all(),
-    })
-    
-    if not pdf:
-        return HttpResponse("Error generating PDF", status=500)
-    
-    response = HttpResponse(pdf, content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="Invoice-{order.order_number}.pdf"'
-    return response
+    return invoice_response(order, order.items.all(), f"Invoice-{order.order_number}.pdf")
 
 
 @login_required
@@ -1957,18 +1896,7 @@ def user_download_invoice(request, order_number):
         order_number=order_number, 
         user=request.user
     )
-    
-    pdf = _render_to_pdf_wkhtmltopdf("invoices/invoice.html", {
-        "order": order,
-        "items": order.items.all(),
-    })
-    
-    if not pdf:
-        return HttpResponse("Error generating PDF", status=500)
-    
-    response = HttpResponse(pdf, content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="Invoice-{order.order_number}.pdf"'
-    return response
+    return invoice_response(order, order.items.all(), f"Invoice-{order.order_number}.pdf")
 
 
 @login_required
@@ -1976,18 +1904,7 @@ def user_download_item_invoice(request, order_number, item_id):
     """User: Download item invoice"""
     order = get_object_or_404(Order, order_number=order_number, user=request.user)
     item = get_object_or_404(OrderItem, id=item_id, order=order)
-    
-    pdf = _render_to_pdf_wkhtmltopdf("invoices/invoice.html", {
-        "order": order,
-        "items": [item],
-    })
-    
-    if not pdf:
-        return HttpResponse("Error generating PDF", status=500)
-    
-    response = HttpResponse(pdf, content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="Invoice-{order.order_number}-Item-{item.id}.pdf"'
-    return response
+    return invoice_response(order, [item], f"Invoice-{order.order_number}-Item-{item.id}.pdf")
 
 @login_required
 @transaction.atomic
@@ -2011,15 +1928,6 @@ def place_order(request):
     if total_payable < 0:
         total_payable = Decimal('0.00')
 
-    # Validate stock for each item
-    for item in ctx.get('items', []):
-        pid = int(item['id'])
-        qty = int(item['qty'])
-        product = get_object_or_404(Product.objects.select_for_update(), id=pid)
-        available = getattr(product, 'stock_quantity', 0)
-        if qty > available:
-            return JsonResponse({'success': False, 'message': f'{product.name}: only {available} left'}, status=409)
-
     # Get delivery address for order
     addr_id = request.session.get('checkout_address_id')
     address = None
@@ -2053,6 +1961,18 @@ def place_order(request):
     pm_display = 'COD' if pm == 'cod' else 'razorpay'
     status = 'PLACED' if pm == 'cod' else 'PENDING'
 
+    # ✅ Take stock for every line (variant-aware, locked in id order); nothing written on failure
+    lines = [{
+        'product_id': int(item['id']),
+        'variant_id': int(item.get('variant_id', 0) or 0),
+        'quantity': int(item['qty']),
+        'name': item['name'],
+    } for item in ctx.get('items', [])]
+    try:
+        movements = reserve(lines)
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'message': e.messages[0]}, status=409)
+
     # Generate order number (ensure function exists)
     order_number = _gen_order_number()
 
@@ -2080,33 +2000,39 @@ def place_order(request):
         expected_delivery_date=expected_delivery,
     )
 
-    # Create order items
-    for item in ctx.get('items', []):
-        OrderItem.objects.create(
+    # Create order items (one INSERT)
+    order_items = OrderItem.objects.bulk_create([
+        OrderItem(
             order=order,
-            product_id=int(item['id']),
+            product_id=line['product_id'],
             product_name=item['name'],
             image_url=item.get('image', '') or '',
-            quantity=int(item['qty']),
+            quantity=line['quantity'],
             unit_price=Decimal(str(item.get('unit_sell', 0))),
             line_total=Decimal(str(item.get('line_sell', 0))),
-            variant_id=item.get('variant_id')
+            variant_id=line['variant_id'] or None,
         )
+        for item, line in zip(ctx.get('items', []), lines)
+    ])
+    log_movements(
+        movements,
+        StockTransaction.TransactionType.RESERVE,
+        user=request.user,
+        reason=f"Order placed: {order.order_number}",
+        order_items=order_items,
+    )
 
-    # Update stock immediately if COD
     if pm == 'cod':
-        for item in ctx.get('items', []):
-            product = Product.objects.select_for_update().get(id=int(item['id']))
-            product.stock_quantity = max(0, product.stock_quantity - int(item['qty']))
-            product.save(update_fields=['stock_quantity'])
         order.paid_at = timezone.now()
         order.save(update_fields=['paid_at'])
+    else:
+        # ✅ Unpaid online order: stock is only held until the payment window closes
+        hold(order, movements, order_items)
 
     # Clear sessions on order placement success
     if BUY_NOW_SESSION_KEY in request.session:
         del request.session[BUY_NOW_SESSION_KEY]
-    if CART_SESSION_KEY in request.session:
-        del request.session[CART_SESSION_KEY]
+    _set_session_cart(request, {})
     if 'applied_coupon' in request.session:
         del request.session['applied_coupon']
     if 'applied_coupon_discount' in request.session:
@@ -0,0 +1,14 @@
+# payments/gateway.py
+"""Shared Razorpay client (RAZORPAY_BASE_URL lets local runs use `manage.py fake_razorpay`)."""
+import razorpay
+from django.conf import settings
+
+
+def _client():
+    options = {}
+    if settings.RAZORPAY_BASE_URL:
+        options["base_url"] = settings.RAZORPAY_BASE_URL.rstrip("/")
+    return razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET), **options)
+
+
+razorpay_client = _client()
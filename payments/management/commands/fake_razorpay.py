@@ -0,0 +1,141 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+
+
+class FakeRazorpay:
+    """In-memory stand-in for the Razorpay order/refund endpoints the shop uses."""
+
+    def __init__(self, latency=0.0, fail_rate=0.0, settle_after=5.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.settle_after = settle_after
+        self.refunds = {}
+        self.lock = threading.Lock()
+
+    def _settled(self, refund):
+        if refund["status"] == "pending" and time.time() - refund["created_at"] >= self.settle_after:
+            refund["status"] = "processed"
+        return refund
+
+    def create_order(self, data):
+        return 200, {
+            "id": f"order_{uuid.uuid4().hex[:14]}",
+            "entity": "order",
+            "amount": int(data.get("amount", 0)),
+            "currency": data.get("currency", "INR"),
+            "status": "created",
+            "notes": data.get("notes", {}),
+            "created_at": int(time.time()),
+        }
+
+    def create_refund(self, payment_id, data):
+        amount = int(data.get("amount") or 0)
+        if amount <= 0:
+            return 400, {"error": {"code": "BAD_REQUEST_ERROR", "description": "The amount must be atleast INR 1.00"}}
+        refund = {
+            "id": f"rfnd_{uuid.uuid4().hex[:14]}",
+            "entity": "refund",
+            "amount": amount,
+            "currency": "INR",
+            "payment_id": payment_id,
+            "receipt": data.get("receipt"),
+            "notes": data.get("notes", {}),
+            "status": "pending",
+            "speed_requested": data.get("speed", "normal"),
+            "created_at": time.time(),
+        }
+        with self.lock:
+            self.refunds[refund["id"]] = refund
+        return 200, refund
+
+    def list_refunds(self, payment_id):
+        with self.lock:
+            items = [self._settled(r) for r in self.refunds.values() if r["payment_id"] == payment_id]
+        return 200, {"entity": "collection", "count": len(items), "items": items}
+
+    def fetch_refund(self, refund_id):
+        with self.lock:
+            refund = self.refunds.get(refund_id)
+            if refund is None:
+                return 400, {"error": {"code": "BAD_REQUEST_ERROR", "description": "The id provided does not exist"}}
+            return 200, self._settled(refund)
+
+    def handle(self, method, path, data):
+        time.sleep(self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            return 500, {"error": {"code": "SERVER_ERROR", "description": "Injected failure"}}
+
+        if method == "POST" and path == "/v1/orders":
+            return self.create_order(data)
+        m = re.fullmatch(r"/v1/payments/([^/]+)/refund", path)
+        if method == "POST" and m:
+            return self.create_refund(m.group(1), data)
+        m = re.fullmatch(r"/v1/payments/([^/]+)/refunds", path)
+        if method == "GET" and m:
+            return self.list_refunds(m.group(1))
+        m = re.fullmatch(r"/v1/refunds/([^/]+)", path)
+        if method == "GET" and m:
+            return self.fetch_refund(m.group(1))
+        return 404, {"error": {"code": "BAD_REQUEST_ERROR", "description": f"No route for {method} {path}"}}
+
+
+def make_handler(fake, quiet):
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self, method):
+            url = urlparse(self.path)
+            data = {k: v[0] for k, v in parse_qs(url.query).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                data.update(json.loads(self.rfile.read(length) or b"{}"))
+            status, body = fake.handle(method, url.path, data)
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._respond("GET")
+
+        def do_POST(self):
+            self._respond("POST")
+
+        def log_message(self, fmt, *args):
+            if not quiet:
+                super().log_message(fmt, *args)
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local fake Razorpay API (orders + refunds) for tests and benchmarks. "
+        "Start it, then run the app with RAZORPAY_BASE_URL=http://127.0.0.1:<port>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+        parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of calls answered with a 500.")
+        parser.add_argument("--settle-after", type=float, default=5.0, help="Seconds until a refund is 'processed'.")
+        parser.add_argument("--quiet", action="store_true", help="Don't log each request.")
+
+    def handle(self, *args, **options):
+        fake = FakeRazorpay(options["latency"], options["fail_rate"], options["settle_after"])
+        server = ThreadingHTTPServer(("127.0.0.1", options["port"]), make_handler(fake, options["quiet"]))
+        self.stdout.write(self.style.SUCCESS(f"✅ Fake Razorpay listening on http://127.0.0.1:{options['port']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
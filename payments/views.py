@@ -8,14 +8,15 @@ from django.db import transaction
 from decimal import Decimal
 import uuid
 from django.utils import timezone
-from cart.views import _buy_now_summary, _cart_items_context, BUY_NOW_SESSION_KEY, CART_SESSION_KEY
+from cart.views import _buy_now_summary, _cart_items_context, _set_session_cart, BUY_NOW_SESSION_KEY
 from user.models import Address
 from orders.models import Order, OrderItem
 from wallet.models import WalletAccount
 from wallet.services import debit
-from products.models import Product, ProductVariant, StockTransaction  # ✅ NEW IMPORT
+from products.models import StockTransaction
+from products.inventory import convert_holds, hold, log_movements, release_holds, reserve
+from admin_side.rollups import update_status
 from django.core.exceptions import ValidationError  # ✅ NEW IMPORT
-import razorpay
 from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -23,6 +24,10 @@ import json
 from django.views.decorators.http import require_POST
 import hmac
 import hashlib
+import logging
+
+
+logger = logging.getLogger(__name__)
 
 
 def _gen_order_number():
@@ -31,8 +36,8 @@ def _gen_order_number():
 
 COD_MAX_AMOUNT = Decimal('3000.00')
 
-# Initialize Razorpay client
-razorpay_client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+# Shared Razorpay client
+from .gateway import razorpay_client
 
 def _create_order_from_context(user, ctx, address, payment_method, status, subtotal, shipping, coupon_amount, total):
     """
@@ -61,81 +66,44 @@ def _create_order_from_context(user, ctx, address, payment_method, status, subto
         ship_country=getattr(address, 'country', 'India') or 'India',
     )
 
-    # ✅ STEP 2: CREATE ORDER ITEMS AND RESERVE VARIANT STOCK
-    for it in ctx['items']:
-        product_id = int(it['id'])
-        variant_id = int(it.get('variant_id', 0))  # ✅ Get variant ID from cart
-        quantity = int(it['qty'])
-        
-        # ✅ RESERVE VARIANT STOCK (not just product)
-        try:
-            if variant_id:
-                # Reserve variant stock
-                variant = ProductVariant.objects.select_for_update().get(id=variant_id)
-                stock_info = variant.reserve_stock(
-                    quantity, 
-                    user=user, 
-                    reason=f"Order placed: {order.order_number}"
-                )
-                
-                product = variant.product
-                
-            else:
-                # Fallback: No variant (shouldn't happen in your system)
-                product = Product.objects.select_for_update().get(id=product_id)
-                
-                if product.stock_quantity < quantity:
-                    raise ValidationError(
-                        f"Insufficient stock for '{product.name}'. "
-                        f"Only {product.stock_quantity} available."
-                    )
-                
-                stock_before = product.stock_quantity
-                product.stock_quantity -= quantity
-                product.save(update_fields=['stock_quantity'])
-                variant = None
-                
-        except (ProductVariant.DoesNotExist, Product.DoesNotExist):
-            raise ValidationError(f"Product '{it['name']}' is no longer available.")
-        
-        # ✅ CREATE ORDER ITEM with variant_id
-        order_item = OrderItem.objects.create(
+    # ✅ STEP 2: RESERVE STOCK FOR ALL LINES (locks taken in id order, bulk writes)
+    lines = [{
+        'product_id': int(it['id']),
+        'variant_id': int(it.get('variant_id', 0) or 0),
+        'quantity': int(it['qty']),
+        'name': it['name'],
+    } for it in ctx['items']]
+    movements = reserve(lines)
+
+    # ✅ STEP 3: CREATE ORDER ITEMS with variant_id (one INSERT)
+    order_items = OrderItem.objects.bulk_create([
+        OrderItem(
             order=order,
-            product_id=product_id,
-            variant_id=variant_id if variant_id else None,  # ✅ Store variant ID
+            product_id=line['product_id'],
+            variant_id=line['variant_id'] or None,  # ✅ Store variant ID
             product_name=it['name'],
             variant_color=it.get('color', ''),
             image_url=it.get('image') or '',
-            quantity=quantity,
+            quantity=line['quantity'],
             unit_price=Decimal(str(it['unit_sell'])),
             line_total=Decimal(str(it['line_sell'])),
         )
-        
-        # ✅ LOG STOCK TRANSACTION
-        if variant:
-            StockTransaction.objects.create(
-                product=product,
-                variant=variant,  # ✅ Link to variant
-                order_item=order_item,
-                transaction_type='RESERVE',
-                quantity=-quantity,
-                stock_before=stock_info['variant_before'],
-                stock_after=stock_info['variant_after'],
-                reason=f"Order placed: {order.order_number} (Variant: {variant.color})",
-                created_by=user
-            )
-        else:
-            StockTransaction.objects.create(
-                product=product,
-                order_item=order_item,
-                transaction_type='RESERVE',
-                quantity=-quantity,
-                stock_before=stock_before,
-                stock_after=product.stock_quantity,
-                reason=f"Order placed: {order.order_number}",
-                created_by=user
-            )
-    
+        for it, line in zip(ctx['items'], lines)
+    ])
+
+    # ✅ STEP 4: LOG STOCK TRANSACTIONS (one INSERT)
+    log_movements(
+        movements,
+        StockTransaction.TransactionType.RESERVE,
+        user=user,
+        reason=f"Order placed: {order.order_number}",
+        order_items=order_items,
+    )
+
+    # ✅ STEP 5: UNPAID ONLINE ORDERS ONLY HOLD THE STOCK (released if payment never arrives)
+    if status == 'PENDING':
+        hold(order, movements, order_items)
+
     return order
 
 def _clear_cart_session(request, is_buy_now):
@@ -143,7 +111,7 @@ def _clear_cart_session(request, is_buy_now):
     if is_buy_now:
         request.session.pop(BUY_NOW_SESSION_KEY, None)
     else:
-        request.session[CART_SESSION_KEY] = {}
+        _set_session_cart(request, {})
     
     request.session.pop('checkout_address_id', None)
     request.session.pop('applied_coupon_discount', None)
@@ -151,6 +119,28 @@ def _clear_cart_session(request, is_buy_now):
     request.session.pop('applied_coupon', None)
 
 
+def _redeem_applied_coupon(request, order):
+    """
+    Count the session's coupon against its global and per-user limits.
+    Returns (ok, message); ok is True when no coupon was applied. A coupon
+    that can't be counted is dropped from the session.
+    """
+    from coupons.models import Coupon
+
+    coupon_id = request.session.get('applied_coupon_id')
+    if not coupon_id:
+        return True, ""
+    coupon = Coupon.objects.filter(id=coupon_id).first()
+    if coupon is None:
+        return True, ""
+
+    redeemed, message = complete_coupon_usage(request.user, coupon, order)
+    if not redeemed:
+        for key in ('applied_coupon', 'applied_coupon_id', 'applied_coupon_discount'):
+            request.session.pop(key, None)
+    return redeemed, message
+
+
 @login_required
 def payment(request):
     """Payment page - handles cart, buy_now, COD, Razorpay, and Wallet"""
@@ -243,13 +233,10 @@ def payment(request):
                     )
                     
                     # ✅ CRITICAL FIX: Track coupon usage AFTER successful order
-                    if 'applied_coupon_id' in request.session:
-                        try:
-                            from coupons.models import Coupon
-                            coupon = Coupon.objects.get(id=request.session['applied_coupon_id'])
-                            complete_coupon_usage(request.user, coupon, order)
-                        except Coupon.DoesNotExist:
-                            pass
+                    # (a coupon that ran out meanwhile rolls the order back)
+                    redeemed, coupon_message = _redeem_applied_coupon(request, order)
+                    if not redeemed:
+                        raise ValidationError(coupon_message)
 
                     _clear_cart_session(request, is_buy_now)
                     request.session['last_order_id'] = order.id
@@ -285,13 +272,10 @@ def payment(request):
                     )
                     
                     # ✅ CRITICAL FIX: Track coupon usage AFTER successful payment
-                    if 'applied_coupon_id' in request.session:
-                        try:
-                            from coupons.models import Coupon
-                            coupon = Coupon.objects.get(id=request.session['applied_coupon_id'])
-                            complete_coupon_usage(request.user, coupon, order)
-                        except Coupon.DoesNotExist:
-                            pass
+                    # (a coupon that ran out meanwhile rolls the order back)
+                    redeemed, coupon_message = _redeem_applied_coupon(request, order)
+                    if not redeemed:
+                        raise ValidationError(coupon_message)
 
                     _clear_cart_session(request, is_buy_now)
                     request.session['last_order_id'] = order.id
@@ -346,8 +330,8 @@ def payment(request):
                     return render(request, 'user/payment.html', page_ctx)
         
         except ValidationError as e:
-            # ✅ Stock validation failed - show error
-            messages.error(request, str(e))
+            # ✅ Stock/coupon validation failed - show error
+            messages.error(request, " ".join(e.messages))
             return redirect('cart')
         
         except Exception as e:
@@ -390,6 +374,68 @@ def payment_success(request):
     return render(request, 'user/order_success.html', ctx)
 
 
+def _settle_razorpay_order(order_id, user, razorpay_order_id, razorpay_payment_id, razorpay_signature):
+    """
+    Attach a verified Razorpay payment to its order. Returns (order, error):
+    (None, message) when there is no such unpaid order, (order, message)
+    when the payment arrived too late to get the stock back (the order stays
+    FAILED and a refund is queued), (order, None) once the order is PLACED.
+
+    The order row is locked before its holds, the same order the hold
+    sweeper uses, and its status is read under that lock.
+    """
+    from orders.refund_service import queue_payment_refund
+
+    payment = {
+        'razorpay_order_id': razorpay_order_id,
+        'razorpay_payment_id': razorpay_payment_id,
+        'razorpay_signature': razorpay_signature,
+    }
+    with transaction.atomic():
+        order = (
+            Order.objects.select_for_update()
+            .filter(id=order_id, user=user, payment_method='razorpay')
+            .first()
+        )
+        if order is None or order.status not in ('PENDING', 'FAILED'):
+            return None, 'Order not found'
+
+        # ✅ Held stock now belongs to the order
+        if not convert_holds(order.id):
+            # ✅ Hold expired and was swept while the customer was paying: take the stock again
+            order_items = list(order.items.all())
+            try:
+                with transaction.atomic():
+                    movements = reserve([{
+                        'product_id': oi.product_id,
+                        'variant_id': oi.variant_id or 0,
+                        'quantity': oi.quantity,
+                        'name': oi.product_name,
+                    } for oi in order_items])
+            except ValidationError as e:
+                # Money was captured but there is no stock: keep the payment on the order and refund it
+                update_status(Order.objects.filter(pk=order.pk, status='PENDING'), 'FAILED')
+                Order.objects.filter(pk=order.pk).update(**payment)
+                order.refresh_from_db()
+                queue_payment_refund(order, reason=f"Out of stock after late payment: {e.messages[0]}")
+                return order, f"Payment received but {e.messages[0]} Your payment will be refunded."
+            log_movements(
+                movements,
+                StockTransaction.TransactionType.RESERVE,
+                user=user,
+                reason=f"Late payment for order: {order.order_number}",
+                order_items=order_items,
+            )
+
+        # ✅ Mark as paid (payment id is what refunds are issued against)
+        order.status = 'PLACED'
+        order.paid_at = timezone.now()
+        for field, value in payment.items():
+            setattr(order, field, value)
+        order.save(update_fields=['status', 'paid_at', *payment])
+    return order, None
+
+
 @csrf_exempt
 @require_POST
 def razorpay_payment_handler(request):
@@ -411,10 +457,11 @@ def razorpay_payment_handler(request):
         ).hexdigest()
 
         if generated_signature != razorpay_signature:
-            # ✅ Mark order as failed (stock will be released later by admin/cron)
+            # ✅ Mark order as failed and give its held stock back
             pending_order_id = request.session.get('pending_order_id')
             if pending_order_id:
-                Order.objects.filter(id=pending_order_id).update(status='FAILED')
+                update_status(Order.objects.filter(id=pending_order_id, status='PENDING'), 'FAILED')
+                release_holds([pending_order_id], reason="Payment signature verification failed")
             return JsonResponse({'success': False, 'message': 'Signature verification failed'}, status=400)
 
         # Get the pending order
@@ -422,29 +469,22 @@ def razorpay_payment_handler(request):
         if not pending_order_id:
             return JsonResponse({'success': False, 'message': 'Order session expired'}, status=400)
 
-        order = Order.objects.filter(
-            id=pending_order_id,
-            user=request.user,
-            payment_method='razorpay',
-            status='PENDING'
-        ).first()
-
-        if not order:
-            return JsonResponse({'success': False, 'message': 'Order not found'}, status=404)
-
-        # ✅ Mark as paid (stock already reserved during order creation)
-        order.status = 'PLACED'
-        order.paid_at = timezone.now()
-        order.save(update_fields=['status', 'paid_at'])
+        order, error = _settle_razorpay_order(
+            pending_order_id, request.user, razorpay_order_id, razorpay_payment_id, razorpay_signature,
+        )
+        if order is None:
+            return JsonResponse({'success': False, 'message': error}, status=404)
+        if error:
+            return JsonResponse({'success': False, 'message': error}, status=409)
         
         # ✅ CRITICAL FIX: Track coupon usage AFTER successful payment
-        if 'applied_coupon_id' in request.session:
-            try:
-                from coupons.models import Coupon
-                coupon = Coupon.objects.get(id=request.session['applied_coupon_id'])
-                complete_coupon_usage(request.user, coupon, order)
-            except Coupon.DoesNotExist:
-                pass
+        # Already paid at the discounted price, so the order stands either way
+        redeemed, coupon_message = _redeem_applied_coupon(request, order)
+        if not redeemed:
+            logger.warning(
+                "Coupon not counted for order %s: %s", order.order_number, coupon_message,
+                extra={"order_id": order.id, "order_number": order.order_number, "coupon_message": coupon_message},
+            )
 
         # Clear cart and session
         buy_now_line = request.session.get(BUY_NOW_SESSION_KEY)
@@ -456,10 +496,11 @@ def razorpay_payment_handler(request):
         return JsonResponse({'success': True, 'order_id': order.id})
 
     except Exception as e:
-        # ✅ Mark order as failed
+        # ✅ Mark order as failed and give its held stock back
         pending_order_id = request.session.get('pending_order_id')
         if pending_order_id:
-            Order.objects.filter(id=pending_order_id).update(status='FAILED')
+            update_status(Order.objects.filter(id=pending_order_id, status='PENDING'), 'FAILED')
+            release_holds([pending_order_id], reason="Payment verification error")
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
 
@@ -469,12 +510,13 @@ def payment_failed(request):
     order_id = request.session.get('pending_order_id')
     error_message = request.session.pop('payment_error_message', None)
     
-    # ✅ Mark order as FAILED (admin can release stock later)
+    # ✅ Mark order as FAILED and give its held stock back right away
     if order_id:
         try:
-            order = Order.objects.get(id=order_id, user=request.user)
+            order = Order.objects.get(id=order_id, user=request.user, status='PENDING')
             order.status = 'FAILED'
             order.save(update_fields=['status'])
+            release_holds([order.id], reason="Payment failed", user=request.user)
         except Order.DoesNotExist:
             pass
     
@@ -501,37 +543,28 @@ def retry_payment(request, order_id):
         messages.error(request, "This order is too old to retry payment. Please place a new order.")
         return redirect('orders')
     
-    # ✅ NOTE: Stock was already released when order was marked FAILED
+    # ✅ NOTE: Stock is released when the order is marked FAILED (or by the hold sweeper)
     # So we need to re-reserve stock for retry
     try:
         with transaction.atomic():
-            for order_item in order.items.all():
-                product = Product.objects.select_for_update().get(id=order_item.product_id)
-                
-                # Check stock availability
-                if product.stock_quantity < order_item.quantity:
-                    messages.error(
-                        request, 
-                        f"Insufficient stock for '{product.name}'. Only {product.stock_quantity} available."
-                    )
-                    return redirect('orders')
-                
-                # Reserve stock again
-                stock_before = product.stock_quantity
-                product.stock_quantity -= order_item.quantity
-                product.save(update_fields=['stock_quantity'])
-                
-                # Log transaction
-                StockTransaction.objects.create(
-                    product=product,
-                    order_item=order_item,
-                    transaction_type='RESERVE',
-                    quantity=-order_item.quantity,
-                    stock_before=stock_before,
-                    stock_after=product.stock_quantity,
-                    reason=f"Payment retry for order: {order.order_number}",
-                    created_by=request.user
-                )
+            release_holds([order.id], reason=f"Payment retry for order: {order.order_number}")
+            order_items = list(order.items.all())
+            movements = reserve([{
+                'product_id': oi.product_id,
+                'variant_id': oi.variant_id or 0,
+                'quantity': oi.quantity,
+                'name': oi.product_name,
+            } for oi in order_items])
+
+            # Log transactions
+            log_movements(
+                movements,
+                StockTransaction.TransactionType.RESERVE,
+                user=request.user,
+                reason=f"Payment retry for order: {order.order_number}",
+                order_items=order_items,
+            )
+            hold(order, movements, order_items)
     
     except ValidationError as e:
         messages.error(request, str(e))
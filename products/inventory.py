@@ -0,0 +1,384 @@
+# products/inventory.py
+"""
+Batched stock movements.
+
+Rows are always locked variants-first, then products, each in ascending id
+order with a single SELECT ... FOR UPDATE, so two checkouts touching the
+same items queue behind each other instead of deadlocking. Writes go out as
+one bulk UPDATE per table; a variant product's stock_quantity moves by the
+summed change of its variants (F() + delta), never re-read from them, so
+checkouts on different variants of one product can't overwrite each
+other's totals. Listing columns and caches are refreshed once the
+transaction commits, outside the locks.
+
+Single-variant changes (cancel, return, restock) use adjust_variant_stock(),
+which moves variant and product stock together in one conditional statement.
+
+Unpaid Razorpay orders only hold their stock (StockHold): converted when the
+payment succeeds, released on failure or by `manage.py release_stock_holds`
+once STOCK_HOLD_MINUTES have passed.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+
+def _sync_product_totals(product_ids):
+    """
+    Product.stock_quantity = sum of its variants' stock, for many products
+    in one UPDATE. Only for repairs: it reads the variants, so it must not
+    race with checkouts (those use _shift_product_totals).
+    """
+    from .models import Product, ProductVariant
+
+    if not product_ids:
+        return
+    variant_total = Subquery(
+        ProductVariant.objects
+        .filter(product_id=OuterRef("pk"))
+        .order_by()
+        .values("product_id")
+        .annotate(total=Sum("stock"))
+        .values("total"),
+        output_field=IntegerField(),
+    )
+    Product.objects.filter(pk__in=product_ids).update(stock_quantity=Coalesce(variant_total, 0))
+
+
+def _shift_product_totals(deltas):
+    """Move each product's stock_quantity by deltas[product_id], in one UPDATE."""
+    from .models import Product
+
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    Product.objects.filter(pk__in=deltas).update(
+        stock_quantity=Greatest(
+            F("stock_quantity") + Case(
+                *[When(pk=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+                output_field=IntegerField(),
+            ),
+            0,
+        )
+    )
+
+
+def _after_commit(product_ids):
+    """Refresh denormalised listing columns and page caches once locks are gone."""
+    from ecomerce.cache import bump
+    from .pricing import refresh_listing_columns
+
+    product_ids = sorted(product_ids)
+
+    def refresh():
+        refresh_listing_columns(product_ids=product_ids)
+        bump("catalog")
+
+    transaction.on_commit(refresh)
+
+
+def adjust_variant_stock(variant_id, delta):
+    """
+    Add `delta` (negative to take stock) to one variant and its product's
+    stock_quantity in a single statement. The variant update is conditional
+    on stock + delta >= 0, so concurrent sales can't oversell.
+
+    Returns (variant_stock, product_stock) after the change, or None when
+    the variant is missing or would go negative (nothing is written).
+    """
+    from .models import Product, ProductVariant
+
+    variant_table = connection.ops.quote_name(ProductVariant._meta.db_table)
+    product_table = connection.ops.quote_name(Product._meta.db_table)
+    sql = f"""
+        WITH v AS (
+            UPDATE {variant_table}
+               SET stock = stock + %s
+             WHERE id = %s AND stock + %s >= 0
+         RETURNING product_id, stock
+        )
+        UPDATE {product_table} AS p
+           SET stock_quantity = GREATEST(p.stock_quantity + %s, 0)
+          FROM v
+         WHERE p.id = v.product_id
+     RETURNING v.product_id, v.stock, p.stock_quantity
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [delta, variant_id, delta, delta])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    product_id, variant_stock, product_stock = row
+    _after_commit({product_id})
+    return variant_stock, product_stock
+
+
+def _lock(lines):
+    """SELECT ... FOR UPDATE the variants, then the products, the lines touch (id order)."""
+    from .models import Product, ProductVariant
+
+    variant_ids = sorted({int(l["variant_id"]) for l in lines if l.get("variant_id")})
+    plain_ids = sorted({int(l["product_id"]) for l in lines if not l.get("variant_id")})
+
+    variants = {
+        v.id: v
+        for v in (
+            ProductVariant.objects
+            .select_for_update(of=("self",))
+            .select_related("product")
+            .filter(id__in=variant_ids)
+            .order_by("id")
+        )
+    } if variant_ids else {}
+    products = {
+        p.id: p
+        for p in Product.objects.select_for_update().filter(id__in=plain_ids).order_by("id")
+    } if plain_ids else {}
+    return variants, products
+
+
+def _write(variants, products):
+    """Bulk-save locked rows, shift variant products' totals, refresh listings on commit."""
+    from .models import Product, ProductVariant
+
+    deltas = defaultdict(int)
+    for variant in variants.values():
+        # _loaded_stock is the value read under the lock (ProductVariant.from_db)
+        deltas[variant.product_id] += variant.stock - variant._loaded_stock
+        variant._loaded_stock = variant.stock
+    if variants:
+        ProductVariant.objects.bulk_update(list(variants.values()), ["stock"])
+    if products:
+        Product.objects.bulk_update(list(products.values()), ["stock_quantity"])
+
+    _shift_product_totals(deltas)
+    _after_commit(set(deltas) | set(products))
+
+
+def reserve(lines):
+    """
+    Take stock for many cart lines at once.
+
+    `lines` is a list of dicts with product_id, variant_id (0/None for
+    products without variants), quantity and, for error messages, name.
+    Must run inside transaction.atomic(). Raises ValidationError (nothing
+    written) when a line is unavailable or short of stock.
+
+    Returns one movement dict per line, in the same order:
+    {product_id, variant_id, color, before, after}.
+    """
+    variants, products = _lock(lines)
+
+    movements = []
+    for line in lines:
+        quantity = int(line["quantity"])
+        variant_id = int(line.get("variant_id") or 0)
+        if variant_id:
+            variant = variants.get(variant_id)
+            if variant is None:
+                raise ValidationError(f"Product '{line.get('name', '')}' is no longer available.")
+            if variant.stock < quantity:
+                raise ValidationError(
+                    f"Insufficient stock for {variant.product.name} - {variant.color}. "
+                    f"Only {variant.stock} available."
+                )
+            before = variant.stock
+            variant.stock -= quantity
+            movements.append({
+                "product_id": variant.product_id,
+                "variant_id": variant.id,
+                "color": variant.color,
+                "before": before,
+                "after": variant.stock,
+            })
+        else:
+            product = products.get(int(line["product_id"]))
+            if product is None:
+                raise ValidationError(f"Product '{line.get('name', '')}' is no longer available.")
+            if product.stock_quantity < quantity:
+                raise ValidationError(
+                    f"Insufficient stock for '{product.name}'. "
+                    f"Only {product.stock_quantity} available."
+                )
+            before = product.stock_quantity
+            product.stock_quantity -= quantity
+            movements.append({
+                "product_id": product.id,
+                "variant_id": None,
+                "color": "",
+                "before": before,
+                "after": product.stock_quantity,
+            })
+
+    _write(variants, products)
+    return movements
+
+
+def release(lines):
+    """
+    Put stock back for many lines at once (same `lines` shape as reserve()).
+    Lines whose variant/product has since been deleted are skipped. Must run
+    inside transaction.atomic().
+
+    Returns one movement dict per restored line, plus the index of the
+    line it came from under "line".
+    """
+    variants, products = _lock(lines)
+
+    movements = []
+    for i, line in enumerate(lines):
+        quantity = int(line["quantity"])
+        variant_id = int(line.get("variant_id") or 0)
+        row = variants.get(variant_id) if variant_id else products.get(int(line["product_id"]))
+        if row is None:
+            continue
+        if variant_id:
+            before = row.stock
+            row.stock += quantity
+            after, product_id, color = row.stock, row.product_id, row.color
+        else:
+            before = row.stock_quantity
+            row.stock_quantity += quantity
+            after, product_id, color = row.stock_quantity, row.id, ""
+        movements.append({
+            "line": i,
+            "product_id": product_id,
+            "variant_id": variant_id or None,
+            "color": color,
+            "before": before,
+            "after": after,
+        })
+
+    _write(variants, products)
+    return movements
+
+
+def log_movements(movements, transaction_type, user=None, reason="", order_items=None):
+    """
+    bulk_create one StockTransaction per movement. `order_items`, when
+    given, is aligned with `movements`. Quantities are signed from the
+    before/after values.
+    """
+    from .models import StockTransaction
+
+    rows = []
+    for i, m in enumerate(movements):
+        line_reason = f"{reason} (Variant: {m['color']})" if m["variant_id"] else reason
+        rows.append(StockTransaction(
+            product_id=m["product_id"],
+            variant_id=m["variant_id"],
+            order_item=order_items[i] if order_items else None,
+            transaction_type=transaction_type,
+            quantity=m["after"] - m["before"],
+            stock_before=m["before"],
+            stock_after=m["after"],
+            reason=line_reason,
+            created_by=user,
+        ))
+    return StockTransaction.objects.bulk_create(rows)
+
+
+# ---- Time-boxed holds for unpaid online checkouts ----
+
+def hold(order, movements, order_items=None, minutes=None):
+    """
+    Record reserve() movements as StockHolds for an order that is waiting
+    for payment. The stock is already taken; the hold says when to give it
+    back if the payment never arrives.
+    """
+    from django.conf import settings
+    from django.utils import timezone
+    from .models import StockHold
+
+    minutes = minutes if minutes is not None else settings.STOCK_HOLD_MINUTES
+    expires_at = timezone.now() + timezone.timedelta(minutes=minutes)
+    return StockHold.objects.bulk_create([
+        StockHold(
+            order=order,
+            order_item=order_items[i] if order_items else None,
+            product_id=m["product_id"],
+            variant_id=m["variant_id"],
+            quantity=m["before"] - m["after"],
+            expires_at=expires_at,
+        )
+        for i, m in enumerate(movements)
+    ])
+
+
+def convert_holds(order_id):
+    """Payment succeeded: the held stock now belongs to the order. Returns holds converted."""
+    from django.utils import timezone
+    from .models import StockHold
+
+    return StockHold.objects.filter(order_id=order_id, status=StockHold.Status.HELD).update(
+        status=StockHold.Status.CONVERTED, closed_at=timezone.now()
+    )
+
+
+def release_holds(order_ids, reason="Payment not completed", user=None):
+    """
+    Return the stock of every open hold on `order_ids`: one locked batch for
+    all of them, one RELEASE StockTransaction per line. Returns holds released.
+    """
+    from django.utils import timezone
+    from .models import StockHold, StockTransaction
+
+    with transaction.atomic():
+        holds = list(
+            StockHold.objects
+            .select_for_update(of=("self",))
+            .select_related("order_item")
+            .filter(order_id__in=list(order_ids), status=StockHold.Status.HELD)
+            .order_by("id")
+        )
+        if not holds:
+            return 0
+
+        movements = release([
+            {"product_id": h.product_id, "variant_id": h.variant_id, "quantity": h.quantity}
+            for h in holds
+        ])
+        log_movements(
+            movements,
+            StockTransaction.TransactionType.RELEASE,
+            user=user,
+            reason=reason,
+            order_items=[holds[m["line"]].order_item for m in movements],
+        )
+        StockHold.objects.filter(pk__in=[h.pk for h in holds]).update(
+            status=StockHold.Status.RELEASED, closed_at=timezone.now()
+        )
+    return len(holds)
+
+
+def sweep_expired_holds(now=None, batch_size=500):
+    """
+    Periodic sweeper: orders still PENDING once their holds expired are
+    marked FAILED, and every open hold on a FAILED order is released.
+    Returns (orders_failed, holds_released).
+    """
+    from django.utils import timezone
+    from admin_side.rollups import update_status
+    from orders.models import Order
+    from .models import StockHold
+
+    now = now or timezone.now()
+    orders_failed = holds_released = 0
+    while True:
+        order_ids = list(
+            StockHold.objects
+            .filter(status=StockHold.Status.HELD, order__status__in=["PENDING", "FAILED"])
+            .filter(Q(expires_at__lte=now) | Q(order__status="FAILED"))
+            .values_list("order_id", flat=True)
+            .distinct()
+            .order_by("order_id")[:batch_size]
+        )
+        if not order_ids:
+            break
+        with transaction.atomic():
+            orders_failed += update_status(Order.objects.filter(id__in=order_ids, status="PENDING"), "FAILED")
+            holds_released += release_holds(order_ids, reason="Payment window expired")
+    return orders_failed, holds_released
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from category.models import CategoryOffer
+from products.models import ProductOffer
+from products.pricing import refresh_listing_columns
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll offer start/end dates into Product.effective_price, best_discount_percent "
+        "and in_stock. Run daily shortly after midnight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recompute every product (repairs any drift), not only those whose offers changed today.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        if options["all"]:
+            self.stdout.write(self.style.WARNING("Refreshing listing columns for all products..."))
+            updated = refresh_listing_columns(batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f"✅ {updated} products updated"))
+            return
+
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+
+        # Offers that became active today or expired at the end of yesterday
+        product_ids = set(
+            ProductOffer.objects.filter(start_date=today).values_list("product_id", flat=True)
+        ) | set(
+            ProductOffer.objects.filter(end_date=yesterday).values_list("product_id", flat=True)
+        )
+        category_ids = set(
+            CategoryOffer.objects.filter(start_date=today).values_list("category_id", flat=True)
+        ) | set(
+            CategoryOffer.objects.filter(end_date=yesterday).values_list("category_id", flat=True)
+        )
+
+        updated = 0
+        if product_ids:
+            updated += refresh_listing_columns(product_ids=product_ids, batch_size=batch_size, today=today)
+        if category_ids:
+            updated += refresh_listing_columns(category_ids=category_ids, batch_size=batch_size, today=today)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {len(product_ids)} product offers and {len(category_ids)} category offers rolled, "
+                f"{updated} products updated"
+            )
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from products.inventory import sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = (
+        "Release stock held by unpaid Razorpay checkouts whose payment window "
+        "(STOCK_HOLD_MINUTES) has passed, and mark those PENDING orders FAILED. "
+        "Run every few minutes from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Orders released per transaction.")
+
+    def handle(self, *args, **options):
+        orders_failed, holds_released = sweep_expired_holds(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ {orders_failed} pending orders failed, {holds_released} stock holds released")
+        )
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum
+
+from ecomerce.cache import bump
+from products.inventory import _sync_product_totals
+from products.models import Product
+from products.pricing import refresh_listing_columns
+
+
+class Command(BaseCommand):
+    help = (
+        "Find products whose stock_quantity differs from the sum of their variants' stock "
+        "and reset it. Variant saves apply stock as deltas, so run this after raw SQL edits "
+        "or imports, or nightly as a safety net."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without fixing it.")
+
+    def handle(self, *args, **options):
+        drifted = list(
+            Product.objects
+            .annotate(variant_total=Sum("variants__stock"))
+            .filter(variant_total__isnull=False)
+            .exclude(stock_quantity=F("variant_total"))
+            .values_list("id", "name", "stock_quantity", "variant_total")
+            .order_by("id")
+        )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("✅ Product stock matches variant stock"))
+            return
+
+        for product_id, name, stock_quantity, variant_total in drifted:
+            self.stdout.write(f"#{product_id} {name}: product={stock_quantity} variants={variant_total}")
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} products drifted (dry run, nothing changed)"))
+            return
+
+        product_ids = [row[0] for row in drifted]
+        with transaction.atomic():
+            _sync_product_totals(product_ids)
+        refresh_listing_columns(product_ids=product_ids)
+        bump("catalog")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(product_ids)} products repaired"))
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.6 on 2026-10-16 20:38
+
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def offer_price(base_selling, best_discount):
+    """products.pricing.final_price_for() as of this migration (no coupon), frozen here."""
+    discounted = base_selling - (base_selling * Decimal(best_discount) / Decimal('100'))
+    return max(discounted.quantize(Decimal('1'), rounding=ROUND_HALF_UP), Decimal('0.00'))
+
+
+def backfill_listing_columns(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductOffer = apps.get_model('products', 'ProductOffer')
+    CategoryOffer = apps.get_model('category', 'CategoryOffer')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+
+    today = date.today()
+    prod_discount = {}
+    for product_id, percent in (
+        ProductOffer.objects.filter(start_date__lte=today, end_date__gte=today)
+        .order_by('product_id', '-start_date', '-id')
+        .values_list('product_id', 'discount_percent')
+    ):
+        prod_discount.setdefault(product_id, percent or 0)
+    cat_discount = {}
+    for category_id, percent in (
+        CategoryOffer.objects.filter(start_date__lte=today, end_date__gte=today)
+        .order_by('category_id', '-start_date', '-id')
+        .values_list('category_id', 'discount_percent')
+    ):
+        cat_discount.setdefault(category_id, percent or 0)
+    variant_stock = dict(
+        ProductVariant.objects.values('product_id')
+        .annotate(total=Sum('stock'))
+        .values_list('product_id', 'total')
+    )
+
+    batch = []
+    for product in Product.objects.all().iterator(chunk_size=500):
+        base_selling = product.discount_price if product.discount_price is not None else product.base_price
+        best = max(prod_discount.get(product.id, 0), cat_discount.get(product.category_id, 0))
+        product.effective_price = offer_price(base_selling, best)
+        product.best_discount_percent = best
+        stock = variant_stock.get(product.id, product.stock_quantity)
+        product.in_stock = (stock or 0) > 0
+        batch.append(product)
+        if len(batch) >= 500:
+            Product.objects.bulk_update(batch, ['effective_price', 'best_discount_percent', 'in_stock'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['effective_price', 'best_discount_percent', 'in_stock'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('category', '0007_alter_category_image'),
+        ('products', '0022_alter_productdetailedimage_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='best_discount_percent',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='in_stock',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_listed', 'effective_price'], name='product_listed_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_listed', 'in_stock'], name='product_listed_stock_idx'),
+        ),
+        migrations.RunPython(backfill_listing_columns, migrations.RunPython.noop),
+    ]
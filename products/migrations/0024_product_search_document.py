@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-16 20:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+BACKFILL_SEARCH_DOCUMENT = """
+UPDATE products_product p SET search_document =
+    setweight(to_tsvector('english', coalesce(p.name, '')), 'A')
+    || setweight(to_tsvector('english', coalesce((SELECT b.name FROM category_brand b WHERE b.id = p.brand_id), '')), 'B')
+    || setweight(to_tsvector('english', coalesce((SELECT c.name FROM category_category c WHERE c.id = p.category_id), '')), 'B')
+    || setweight(to_tsvector('english', coalesce((SELECT string_agg(v.color, ' ') FROM products_productvariant v WHERE v.product_id = p.id), '')), 'B')
+    || setweight(to_tsvector('english', coalesce(p.short_description, '')), 'C')
+    || setweight(to_tsvector('english', coalesce(p.long_description, '')), 'D');
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('category', '0007_alter_category_image'),
+        ('products', '0023_product_listing_columns'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='product_search_doc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunSQL(BACKFILL_SEARCH_DOCUMENT, migrations.RunSQL.noop),
+    ]
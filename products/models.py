@@ -1,14 +1,18 @@
 # products/models.py
 
-from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from PIL import Image
 from datetime import date
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from .pricing import final_price_for, discount_percent_for, extra_off_for
 
 
 class Product(models.Model):
@@ -45,6 +49,15 @@ class Product(models.Model):
 
     is_listed = models.BooleanField(default=True, db_index=True)
 
+    # Denormalised listing columns - maintained by products.pricing.refresh_listing_columns()
+    # (signals on offers/variants/prices + the daily `refresh_listing_prices` command)
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
+    best_discount_percent = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal("0.00"))
+    in_stock = models.BooleanField(default=False)
+
+    # Weighted full-text document - maintained by products.search.refresh_search_documents()
+    search_document = SearchVectorField(null=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -53,6 +66,10 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=["is_listed"]),
             models.Index(fields=["-created_at"]),
+            models.Index(fields=["is_listed", "effective_price"], name="product_listed_price_idx"),
+            models.Index(fields=["is_listed", "in_stock"], name="product_listed_stock_idx"),
+            GinIndex(fields=["search_document"], name="product_search_doc_idx"),
+            GinIndex(fields=["name"], name="product_name_trgm_idx", opclasses=["gin_trgm_ops"]),
         ]
 
     def save(self, *args, **kwargs):
@@ -114,6 +131,10 @@ class Product(models.Model):
         return self.discount_price if self.discount_price is not None else self.base_price
 
     def get_best_discount(self):
+        # Listing pages resolve discounts in bulk (products.pricing.apply_prices)
+        cached = getattr(self, "_best_discount", None)
+        if cached is not None:
+            return cached
         today = date.today()
         prod_offer = self.offers.filter(start_date__lte=today, end_date__gte=today).order_by('-start_date').first()
         prod_discount = prod_offer.discount_percent if prod_offer and prod_offer.discount_percent else 0
@@ -121,46 +142,23 @@ class Product(models.Model):
         cat_discount = cat_offer.discount_percent if cat_offer and cat_offer.discount_percent else 0
         return max(prod_discount, cat_discount)
 
-    from decimal import Decimal, ROUND_HALF_UP
-
     def get_final_price(self, coupon_discount_percent=0):
         """Calculate final price with all discounts - rounded to nearest rupee"""
-        base_selling = self.get_base_selling_price()
-        best_discount = self.get_best_discount()
-        
-        # Apply product/category offer
-        discounted_price = base_selling - (base_selling * best_discount / Decimal('100'))
-        
-        # Apply coupon percentage
-        if coupon_discount_percent > 0:
-            coupon_discount_percent = Decimal(str(coupon_discount_percent))
-            discounted_price -= (discounted_price * coupon_discount_percent / Decimal('100'))
-        
-        # ✅ Round to nearest whole rupee (999.60 → 1000.00)
-        final = discounted_price.quantize(Decimal('1'), rounding=ROUND_HALF_UP)
-        
-        return max(final, Decimal('0.00'))
-
-
+        return final_price_for(
+            self.get_base_selling_price(),
+            self.get_best_discount(),
+            coupon_discount_percent,
+        )
 
     def get_discount_percent(self):
-        base_price = self.base_price
-        final_price = self.get_final_price()
-        try:
-            percent = ((base_price - final_price) / base_price) * Decimal("100")
-            return int(percent.quantize(Decimal("1"), rounding=ROUND_HALF_UP))
-        except (InvalidOperation, ZeroDivisionError):
-            return 0
+        return discount_percent_for(self.base_price, self.get_final_price())
 
     def get_extra_off(self):
         """
         Returns the rupee difference between base selling price (discount_price if set, else base_price)
         and the final price after all applicable offers.
         """
-        selling_price = self.get_base_selling_price()
-        final_price = self.get_final_price()
-        extra_off = selling_price - final_price
-        return max(int(round(float(extra_off))), 0)
+        return extra_off_for(self.get_base_selling_price(), self.get_final_price())
 
     def __str__(self):
         return self.name
@@ -190,78 +188,108 @@ class ProductVariant(models.Model):
         if not self.color.strip():
             raise ValidationError("Color cannot be empty.")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember loaded values so save() only does the work that changed
+        loaded = dict(zip(field_names, values))
+        instance._loaded_stock = loaded.get("stock")
+        instance._loaded_is_default = loaded.get("is_default")
+        return instance
+
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        super().save(*args, **kwargs)
+        is_new = self._state.adding
+        update_fields = kwargs.get("update_fields")
+
+        def touches(field):
+            return update_fields is None or field in update_fields
+
+        loaded_default = getattr(self, "_loaded_is_default", None)
+        # Read by the ensure_single_default signal as well
+        self._default_changed = is_new or (
+            touches("is_default") and (loaded_default is None or loaded_default != self.is_default)
+        )
+
+        stock_delta = None  # None = unknown previous value, resync from the variants
+        if not touches("stock"):
+            stock_delta = 0
+        elif is_new:
+            stock_delta = self.stock
+        elif getattr(self, "_loaded_stock", None) is not None:
+            stock_delta = self.stock - self._loaded_stock
+
+        # ✅ AUTO-SYNC: Product stock moves by the same delta as the variant (one UPDATE),
+        # before the variant's post_save hooks refresh the listing columns.
+        # The variant row is locked before the product, the order products.inventory
+        # uses, so an admin edit racing a checkout queues instead of deadlocking.
+        # `manage.py repair_product_stock` fixes any drift in bulk.
+        with transaction.atomic():
+            if stock_delta and not is_new:
+                list(ProductVariant.objects.select_for_update().filter(pk=self.pk).values_list("pk"))
+            if stock_delta:
+                Product.objects.filter(pk=self.product_id).update(
+                    stock_quantity=Greatest(F("stock_quantity") + stock_delta, 0)
+                )
+            super().save(*args, **kwargs)
+            if stock_delta is None:
+                from .inventory import _sync_product_totals
+                _sync_product_totals([self.product_id])
+
+        if self._default_changed:
+            # If this is marked default, demote others for the same product.
+            if self.is_default:
+                ProductVariant.objects.filter(product_id=self.product_id).exclude(pk=self.pk).update(is_default=False)
+            else:
+                # If no default exists for this product, make this one default (covers first-variant case).
+                has_default = ProductVariant.objects.filter(product_id=self.product_id, is_default=True).exists()
+                if not has_default:
+                    ProductVariant.objects.filter(pk=self.pk).update(is_default=True)
+
+        if stock_delta != 0 and self._meta.get_field("product").is_cached(self):
+            self.product.refresh_from_db(fields=["stock_quantity"])
+
+        self._loaded_stock = self.stock
+        self._loaded_is_default = self.is_default
 
-        # If this is marked default, demote others for the same product.
-        if self.is_default:
-            ProductVariant.objects.filter(product=self.product).exclude(pk=self.pk).update(is_default=False)
-        else:
-            # If no default exists for this product, make this one default (covers first-variant case).
-            has_default = ProductVariant.objects.filter(product=self.product, is_default=True).exists()
-            if not has_default:
-                ProductVariant.objects.filter(pk=self.pk).update(is_default=True)
-
-        # ✅ AUTO-SYNC: Product stock = sum of all variant stocks
-        # This runs EVERY TIME a variant is saved!
-        total_stock = self.product.variants.aggregate(total=models.Sum('stock'))['total'] or 0
-        if total_stock != self.product.stock_quantity:
-            self.product.stock_quantity = total_stock
-            self.product.save(update_fields=['stock_quantity'])
-
-    # ✅ FIXED: Only update variant stock, product syncs automatically
     def reserve_stock(self, quantity, user=None, reason="Stock reserved"):
         """
-        Reserve variant stock - product total updates automatically via save()
+        Reserve variant stock - variant and product totals move together in
+        one conditional UPDATE (products.inventory.adjust_variant_stock).
         Raises ValidationError if insufficient stock
         """
-        if self.stock < quantity:
+        from .inventory import adjust_variant_stock
+
+        result = adjust_variant_stock(self.pk, -quantity)
+        if result is None:
+            self.refresh_from_db(fields=["stock"])
             raise ValidationError(
                 f"Insufficient stock for {self.product.name} - {self.color}. "
                 f"Only {self.stock} available."
             )
-        
-        # Store before values for logging
-        stock_before_variant = self.stock
-        stock_before_product = self.product.stock_quantity
-        
-        # ✅ ONLY update variant stock
-        self.stock -= quantity
-        self.save(update_fields=['stock'])
-        # ☝️ This triggers save() → auto-calculates product.stock_quantity
-        
-        # Refresh product to get the auto-updated stock
-        self.product.refresh_from_db()
-        
-        return {
-            'variant_before': stock_before_variant,
-            'variant_after': self.stock,
-            'product_before': stock_before_product,
-            'product_after': self.product.stock_quantity  # Auto-updated value
-        }
-    
+        return self._apply_stock_result(result, -quantity)
+
     def release_stock(self, quantity, user=None, reason="Stock released"):
         """
-        Release variant stock - product total updates automatically via save()
+        Release variant stock - variant and product totals move together in
+        one UPDATE (products.inventory.adjust_variant_stock).
         """
-        # Store before values for logging
-        stock_before_variant = self.stock
-        stock_before_product = self.product.stock_quantity
-        
-        # ✅ ONLY update variant stock
-        self.stock += quantity
-        self.save(update_fields=['stock'])
-        # ☝️ This triggers save() → auto-calculates product.stock_quantity
-        
-        # Refresh product to get the auto-updated stock
-        self.product.refresh_from_db()
-        
+        from .inventory import adjust_variant_stock
+
+        result = adjust_variant_stock(self.pk, quantity)
+        if result is None:
+            raise ValidationError(f"Variant {self.pk} no longer exists.")
+        return self._apply_stock_result(result, quantity)
+
+    def _apply_stock_result(self, result, delta):
+        variant_after, product_after = result
+        self.stock = self._loaded_stock = variant_after
+        if self._meta.get_field("product").is_cached(self):
+            self.product.stock_quantity = product_after
         return {
-            'variant_before': stock_before_variant,
-            'variant_after': self.stock,
-            'product_before': stock_before_product,
-            'product_after': self.product.stock_quantity  # Auto-updated value
+            'variant_before': variant_after - delta,
+            'variant_after': variant_after,
+            'product_before': product_after - delta,
+            'product_after': product_after,
         }
 
     # ✅ KEEP ONLY THIS ONE - Works with both cloud_url and image field
@@ -461,3 +489,37 @@ class StockTransaction(models.Model):
     def __str__(self):
         variant_info = f" - {self.variant.color}" if self.variant else ""
         return f"{self.transaction_type} - {self.product.name}{variant_info} - Qty: {self.quantity} ({self.created_at.strftime('%d %b %Y')})"
+
+
+class StockHold(models.Model):
+    """
+    Stock taken for an online-payment order that hasn't been paid yet.
+    Converted when the payment succeeds; released (stock returned) when the
+    payment fails or the hold expires (`manage.py release_stock_holds`).
+    """
+
+    class Status(models.TextChoices):
+        HELD = "HELD", "Held"
+        CONVERTED = "CONVERTED", "Converted (Paid)"
+        RELEASED = "RELEASED", "Released"
+
+    order = models.ForeignKey('orders.Order', on_delete=models.CASCADE, related_name='stock_holds')
+    order_item = models.ForeignKey('orders.OrderItem', on_delete=models.SET_NULL, null=True, blank=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_holds')
+    variant = models.ForeignKey(
+        ProductVariant, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_holds'
+    )
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'stock_holds'
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.status} - {self.product_id}/{self.variant_id} x{self.quantity} (order {self.order_id})"
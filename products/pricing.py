@@ -0,0 +1,213 @@
+# products/pricing.py
+
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+
+def final_price_for(base_selling, best_discount, coupon_discount_percent=0):
+    """
+    Apply the best product/category offer (and an optional coupon percentage)
+    to a base selling price, rounded to the nearest whole rupee.
+    """
+    discounted_price = base_selling - (base_selling * Decimal(best_discount) / Decimal('100'))
+
+    if coupon_discount_percent > 0:
+        coupon_discount_percent = Decimal(str(coupon_discount_percent))
+        discounted_price -= (discounted_price * coupon_discount_percent / Decimal('100'))
+
+    final = discounted_price.quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+    return max(final, Decimal('0.00'))
+
+
+def discount_percent_for(base_price, final_price):
+    """Percentage off MRP (base_price), as a whole number."""
+    try:
+        percent = ((base_price - final_price) / base_price) * Decimal("100")
+        return int(percent.quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ZeroDivisionError):
+        return 0
+
+
+def extra_off_for(selling_price, final_price):
+    """Rupee difference between the base selling price and the final price."""
+    return max(int(round(float(selling_price - final_price))), 0)
+
+
+def best_discounts(products, today=None):
+    """
+    Resolve Product.get_best_discount() for many products at once.
+
+    For every product the latest-starting active ProductOffer and the
+    latest-starting active CategoryOffer are picked (same rule as the model
+    method) and the larger discount_percent wins.
+
+    Costs two queries regardless of how many products are passed.
+    Returns {product_id: Decimal}.
+    """
+    from products.models import ProductOffer
+    from category.models import CategoryOffer
+
+    products = list(products)
+    if not products:
+        return {}
+
+    today = today or date.today()
+    product_ids = {p.id for p in products}
+    category_ids = {p.category_id for p in products if p.category_id}
+
+    prod_discount = {}
+    prod_offers = (
+        ProductOffer.objects
+        .filter(product_id__in=product_ids, start_date__lte=today, end_date__gte=today)
+        .order_by('product_id', '-start_date', '-id')
+        .values_list('product_id', 'discount_percent')
+    )
+    for product_id, percent in prod_offers:
+        # first row per product is the one .first() would have returned
+        if product_id not in prod_discount:
+            prod_discount[product_id] = percent or 0
+
+    cat_discount = {}
+    if category_ids:
+        cat_offers = (
+            CategoryOffer.objects
+            .filter(category_id__in=category_ids, start_date__lte=today, end_date__gte=today)
+            .order_by('category_id', '-start_date', '-id')
+            .values_list('category_id', 'discount_percent')
+        )
+        for category_id, percent in cat_offers:
+            if category_id not in cat_discount:
+                cat_discount[category_id] = percent or 0
+
+    return {
+        p.id: max(prod_discount.get(p.id, 0), cat_discount.get(p.category_id, 0))
+        for p in products
+    }
+
+
+def price_map(products, today=None):
+    """
+    Price many products in a constant number of queries.
+
+    `products` may be a Product queryset, a list of Product instances or a
+    list of product ids. Returns {product_id: {...}} with base_selling,
+    best_discount, final_price, discount_percent and extra_off.
+    """
+    from products.models import Product
+
+    products = list(products)
+    if products and not isinstance(products[0], Product):
+        products = list(
+            Product.objects
+            .filter(id__in=products)
+            .only('id', 'base_price', 'discount_price', 'category_id')
+        )
+
+    discounts = best_discounts(products, today=today)
+
+    prices = {}
+    for p in products:
+        base_selling = p.get_base_selling_price()
+        best = discounts.get(p.id, 0)
+        final = final_price_for(base_selling, best)
+        prices[p.id] = {
+            'base_selling': base_selling,
+            'best_discount': best,
+            'final_price': final,
+            'discount_percent': discount_percent_for(p.base_price, final),
+            'extra_off': extra_off_for(base_selling, final),
+        }
+    return prices
+
+
+def apply_prices(products, today=None):
+    """
+    Attach final_price, discount_percent, extra_off and best_discount to each
+    product (the attributes listing templates read) and return them as a list.
+
+    The resolved discount is also cached on the instance so any later call to
+    get_final_price()/get_discount_percent()/get_extra_off() on the same
+    object does not hit the offer tables again.
+    """
+    products = list(products)
+    prices = price_map(products, today=today)
+    for p in products:
+        info = prices[p.id]
+        p._best_discount = info['best_discount']
+        p.best_discount = info['best_discount']
+        p.final_price = info['final_price']
+        p.discount_percent = info['discount_percent']
+        p.extra_off = info['extra_off']
+    return products
+
+
+LISTING_COLUMNS = ['effective_price', 'best_discount_percent', 'in_stock']
+
+
+def refresh_listing_columns(product_ids=None, category_ids=None, batch_size=500, today=None):
+    """
+    Recompute the denormalised Product.effective_price, best_discount_percent
+    and in_stock columns that the shop filters and sorts on.
+
+    Limit the work with `product_ids` and/or `category_ids`; pass neither to
+    refresh the whole catalogue. Rows are processed in batches (three queries
+    per batch) and only rows whose values changed are written.
+    Returns the number of products updated.
+    """
+    from django.db.models import Exists, OuterRef, Subquery, Sum, IntegerField
+    from django.db.models.functions import Coalesce
+    from products.models import Product, ProductVariant
+
+    variants = ProductVariant.objects.filter(product=OuterRef('pk'))
+    products = (
+        Product.objects
+        .only('id', 'base_price', 'discount_price', 'category_id', 'stock_quantity', *LISTING_COLUMNS)
+        .annotate(
+            has_variants=Exists(variants),
+            variant_stock=Coalesce(
+                Subquery(
+                    variants.order_by().values('product').annotate(total=Sum('stock')).values('total'),
+                    output_field=IntegerField(),
+                ),
+                0,
+            ),
+        )
+        .order_by('id')
+    )
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+    if category_ids is not None:
+        products = products.filter(category_id__in=category_ids)
+
+    updated = 0
+    batch = []
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            updated += _write_listing_columns(batch, today)
+            batch = []
+    if batch:
+        updated += _write_listing_columns(batch, today)
+    return updated
+
+
+def _write_listing_columns(products, today=None):
+    from products.models import Product
+
+    prices = price_map(products, today=today)
+    changed = []
+    for p in products:
+        info = prices[p.id]
+        stock = p.variant_stock if p.has_variants else p.stock_quantity
+        values = {
+            'effective_price': info['final_price'],
+            'best_discount_percent': Decimal(info['best_discount']),
+            'in_stock': (stock or 0) > 0,
+        }
+        if any(getattr(p, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(p, field, value)
+            changed.append(p)
+    if changed:
+        Product.objects.bulk_update(changed, LISTING_COLUMNS)
+    return len(changed)
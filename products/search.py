@@ -0,0 +1,106 @@
+# products/search.py
+
+import re
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db.models import F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+SEARCH_CONFIG = "english"
+
+_token_re = re.compile(r"[\w]+", re.UNICODE)
+
+
+def _search_document():
+    """
+    Weighted tsvector expression for Product.search_document:
+    A = name, B = brand/category/variant colours, C = short description,
+    D = long description.
+    """
+    from category.models import Brand, Category
+    from products.models import ProductVariant
+
+    brand_name = Subquery(Brand.objects.filter(pk=OuterRef("brand_id")).values("name")[:1])
+    category_name = Subquery(Category.objects.filter(pk=OuterRef("category_id")).values("name")[:1])
+    colours = Subquery(
+        ProductVariant.objects
+        .filter(product_id=OuterRef("pk"))
+        .order_by()
+        .values("product_id")
+        .annotate(colours=StringAgg("color", delimiter=" "))
+        .values("colours"),
+        output_field=TextField(),
+    )
+
+    def text(expr):
+        return Coalesce(expr, Value(""), output_field=TextField())
+
+    return (
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector(text(brand_name), weight="B", config=SEARCH_CONFIG)
+        + SearchVector(text(category_name), weight="B", config=SEARCH_CONFIG)
+        + SearchVector(text(colours), weight="B", config=SEARCH_CONFIG)
+        + SearchVector(text(F("short_description")), weight="C", config=SEARCH_CONFIG)
+        + SearchVector(text(F("long_description")), weight="D", config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_documents(product_ids=None, brand_ids=None, category_ids=None):
+    """
+    Rebuild Product.search_document in a single UPDATE for the given
+    products / brands / categories (everything when nothing is passed).
+    """
+    from products.models import Product
+
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    if brand_ids is not None:
+        products = products.filter(brand_id__in=brand_ids)
+    if category_ids is not None:
+        products = products.filter(category_id__in=category_ids)
+    return products.update(search_document=_search_document())
+
+
+def _prefix_query(q):
+    """
+    Turn free text into a prefix tsquery ("sony wh" -> sony:* & wh:*) so
+    partially typed words still match. Returns None when nothing searchable
+    is left after stripping punctuation.
+    """
+    tokens = _token_re.findall(q.lower())
+    if not tokens:
+        return None
+    return SearchQuery(" & ".join(f"{t}:*" for t in tokens), search_type="raw", config=SEARCH_CONFIG)
+
+
+def search_products(queryset, q):
+    """
+    Filter `queryset` to products matching `q` and annotate `search_rank`.
+
+    Matches the GIN-indexed search document with prefix terms, and falls
+    back to trigram similarity on the name so typos ("sonny") still hit.
+    Callers order by "-search_rank" for relevance.
+    """
+    query = _prefix_query(q)
+    if query is None:
+        return queryset.none()
+
+    return (
+        queryset
+        .filter(Q(search_document=query) | Q(name__trigram_similar=q))
+        .annotate(
+            search_rank=SearchRank(F("search_document"), query)
+            + TrigramSimilarity("name", q),
+        )
+    )
+
+
+def autocomplete(queryset, q, limit=8):
+    """Top `limit` matches for type-ahead, best first."""
+    return list(
+        search_products(queryset, q)
+        .order_by("-search_rank", "-id")
+        .values("id", "name", "effective_price")[:limit]
+    )
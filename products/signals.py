@@ -4,6 +4,9 @@ from .models import ProductVariant
 
 @receiver(post_save, sender=ProductVariant)
 def ensure_single_default(sender, instance, created, **kwargs):
+    # Stock-only saves leave the default flag alone (see ProductVariant.save)
+    if not getattr(instance, "_default_changed", True):
+        return
     # If no variant for this product is default, mark this one as default.
     if not instance.product.variants.filter(is_default=True).exclude(id=instance.id).exists():
         if not instance.is_default:
@@ -12,3 +15,96 @@ def ensure_single_default(sender, instance, created, **kwargs):
     # If this was set default=True, demote others.
     if instance.is_default:
         ProductVariant.objects.filter(product=instance.product).exclude(id=instance.id).update(is_default=False)
+
+
+# ---- Denormalised listing columns (effective_price / best_discount_percent / in_stock) ----
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete
+from django.utils import timezone
+from category.models import CategoryOffer
+from .models import Product, ProductOffer
+from .pricing import refresh_listing_columns
+
+# Product fields that feed the listing columns
+LISTING_INPUT_FIELDS = {"base_price", "discount_price", "stock_quantity", "category", "category_id"}
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_listing_columns(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not (set(update_fields) & LISTING_INPUT_FIELDS):
+        return
+    refresh_listing_columns(product_ids=[instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+def refresh_listing_on_variant_stock(sender, instance, created, update_fields=None, **kwargs):
+    # Variant saves move stock_quantity with a queryset UPDATE, so the Product hook doesn't fire
+    if update_fields is not None and "stock" not in update_fields:
+        return
+    refresh_listing_columns(product_ids=[instance.product_id])
+
+
+@receiver(post_delete, sender=ProductVariant)
+def refresh_listing_on_variant_delete(sender, instance, **kwargs):
+    # The deleted variant's stock leaves the product total
+    if instance.stock:
+        Product.objects.filter(pk=instance.product_id).update(
+            stock_quantity=Greatest(F("stock_quantity") - instance.stock, 0)
+        )
+    refresh_listing_columns(product_ids=[instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=ProductOffer)
+def refresh_listing_on_product_offer(sender, instance, **kwargs):
+    # Offers have no timestamp of their own; Cart.pricing_stamp() reads Product.updated_at
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+    refresh_listing_columns(product_ids=[instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=CategoryOffer)
+def refresh_listing_on_category_offer(sender, instance, **kwargs):
+    Product.objects.filter(category_id=instance.category_id).update(updated_at=timezone.now())
+    refresh_listing_columns(category_ids=[instance.category_id])
+
+
+# ---- Full-text search document ----
+from category.models import Brand, Category
+from .search import refresh_search_documents
+
+# Product fields that feed the search document
+SEARCH_INPUT_FIELDS = {"name", "short_description", "long_description", "brand", "brand_id", "category", "category_id"}
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_search_document(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not (set(update_fields) & SEARCH_INPUT_FIELDS):
+        return
+    refresh_search_documents(product_ids=[instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def refresh_search_on_variant_colour(sender, instance, update_fields=None, **kwargs):
+    # Stock-only saves (reserve/release) don't change the colour list
+    if update_fields is not None and "color" not in update_fields:
+        return
+    refresh_search_documents(product_ids=[instance.product_id])
+
+
+@receiver(post_save, sender=Brand)
+def refresh_search_on_brand(sender, instance, **kwargs):
+    refresh_search_documents(brand_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def refresh_search_on_category(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "name" not in update_fields:
+        return
+    refresh_search_documents(category_ids=[instance.pk])
+
+
+# ---- Page / fragment cache invalidation ----
+from ecomerce.cache import register
+
+for model in (Product, ProductVariant, ProductOffer):
+    register(model, "catalog")
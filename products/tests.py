@@ -1,3 +1,66 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+
+from category.models import Category
+from orders.models import Order, OrderItem
+from .inventory import convert_holds, hold, reserve, sweep_expired_holds
+from .models import Product, StockHold
+
+
+class StockHoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("payer", "payer@example.com", "pw")
+        category = Category.objects.create(name="Headphones", image="categories/headphones.jpg")
+        cls.product = Product.objects.create(
+            name="Studio Cans", category=category, base_price=Decimal("2999"), stock_quantity=5,
+        )
+
+    def place_held_order(self, quantity=2, minutes=15):
+        """A PENDING Razorpay order whose stock was reserved and held, as checkout does it."""
+        order = Order.objects.create(
+            user=self.user, order_number=f"H-{Order.objects.count() + 1}", status="PENDING",
+            payment_method="razorpay", total_amount=Decimal("2999") * quantity,
+            ship_full_name="Payer", ship_line1="1 Road", ship_city="Kochi",
+        )
+        item = OrderItem.objects.create(
+            order=order, product_id=self.product.id, product_name=self.product.name,
+            quantity=quantity, unit_price=Decimal("2999"), line_total=Decimal("2999") * quantity,
+        )
+        movements = reserve([{"product_id": self.product.id, "variant_id": 0, "quantity": quantity, "name": item.product_name}])
+        hold(order, movements, order_items=[item], minutes=minutes)
+        return order
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock_quantity
+
+    def test_hold_takes_stock_and_convert_keeps_it(self):
+        order = self.place_held_order()
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(convert_holds(order.id), 1)
+        self.assertEqual(StockHold.objects.get(order=order).status, StockHold.Status.CONVERTED)
+        self.assertEqual(self.stock(), 3)
+        # Converted holds are never swept
+        self.assertEqual(sweep_expired_holds(now=timezone.now() + timedelta(hours=1)), (0, 0))
+        self.assertEqual(self.stock(), 3)
+
+    def test_sweep_fails_expired_orders_and_returns_their_stock(self):
+        order = self.place_held_order(minutes=15)
+        self.assertEqual(sweep_expired_holds(), (0, 0))  # not expired yet
+        self.assertEqual(sweep_expired_holds(now=timezone.now() + timedelta(minutes=16)), (1, 1))
+        order.refresh_from_db()
+        self.assertEqual(order.status, "FAILED")
+        self.assertEqual(StockHold.objects.get(order=order).status, StockHold.Status.RELEASED)
+        self.assertEqual(self.stock(), 5)
 
-# Create your tests here.
+    def test_convert_after_sweep_finds_nothing(self):
+        # The sweeper won the race: the payment must not think it still owns stock
+        order = self.place_held_order()
+        sweep_expired_holds(now=timezone.now() + timedelta(hours=1))
+        self.assertEqual(convert_holds(order.id), 0)
+        self.assertEqual(self.stock(), 5)
@@ -8,6 +8,7 @@ from datetime import timezone
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
 from django.views.decorators.cache import never_cache
+from ecomerce.cache import cache_anonymous_page
 from django.views.decorators.csrf import csrf_protect
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.contrib import messages
@@ -15,6 +16,7 @@ from django.db import transaction
 from django.db.models import Q
 from .models import Product, ProductImage, ProductVariant, ProductVariantImage, ProductDetailedImage,ProductOffer
 from category.models import Category, Brand
+from category.cache import active_categories
 from decimal import Decimal
 from functools import wraps
 from django.utils import timezone
@@ -25,6 +27,7 @@ from django.core.paginator import Paginator
 from django.views.decorators.csrf import csrf_exempt
 from decimal import Decimal, InvalidOperation
 from .models import TemporaryUpload
+from .pricing import apply_prices
 import cloudinary.uploader
 import json
 from django.db.models import Sum
@@ -326,6 +329,7 @@ def check_stock(request, variant_id):
 
 
 @never_cache
+@cache_anonymous_page()
 def product_detail(request, id):
     try:
         # ✅ BOTH CHECKS: product.is_listed AND category.is_active
@@ -349,7 +353,7 @@ def product_detail(request, id):
         return redirect("shop")
 
     # ✅ Only active categories in sidebar
-    categories = Category.objects.filter(is_active=True).order_by("name")
+    categories = active_categories()
 
     default_variant = None
     if product.variants.exists():
@@ -486,7 +490,7 @@ def product_list(request):
     price_range = request.GET.get('price_range', '').strip()
     sort_by = request.GET.get('sort', '')
 
-    products = Product.objects.select_related("brand", "category").all()
+    products = Product.objects.select_related("brand", "category").prefetch_related("images").all()
 
     if query:
         products = products.filter(
@@ -518,15 +522,13 @@ def product_list(request):
     elif sort_by == "new":
         products = products.order_by("-id")
 
-    # Add discount and final price attributes on each product for template
-    for product in products:
-        product.best_discount = product.get_best_discount()
-        product.final_price = product.get_final_price()
-
     paginator = Paginator(products, 6) 
     page_number = request.GET.get("page")
     products = paginator.get_page(page_number)
 
+    # Add discount and final price attributes on the visible page for template
+    products.object_list = apply_prices(products.object_list)
+
     categories = Category.objects.filter(is_active=True)
     brands = Brand.objects.all()
 
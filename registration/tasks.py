@@ -0,0 +1,8 @@
+# registration/tasks.py
+from jobs.queue import task
+
+
+@task("registration.send_otp_email", max_attempts=3, redact=("otp",))
+def send_otp_email(email, otp, email_type='signup', username=None):
+    from .views import deliver_otp_email
+    deliver_otp_email(email, otp, email_type=email_type, username=username)
@@ -8,6 +8,7 @@ from django.views.decorators.cache import never_cache
 from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
+import logging
 import random
 from django.conf import settings
 
@@ -23,7 +24,9 @@ from .forms import (
 from user.models import Profile
 # Referral & Wallet
 from wallet.models import ReferralProfile, Referral, ReferralConfig, WalletAccount, WalletTransaction
-from wallet.services import credit, qualify_signup_referral_and_credit
+from wallet.services import credit
+
+logger = logging.getLogger(__name__)
 
 # ========== EMAIL UTILITIES ==========
 
@@ -34,7 +37,8 @@ from django.utils.html import strip_tags
 
 def send_dynamic_otp_email(email, otp, email_type='signup', username=None):
     """
-    Send dynamic OTP email based on context.
+    Queue a dynamic OTP email based on context (sent by the job worker,
+    so the request doesn't wait on SMTP).
     
     Args:
         email (str): Recipient email
@@ -43,8 +47,31 @@ def send_dynamic_otp_email(email, otp, email_type='signup', username=None):
         username (str): User's name (optional, extracted from email if not provided)
     
     Returns:
-        bool: True if sent successfully, False otherwise
+        bool: True if queued successfully, False otherwise
     """
+    from django.utils.crypto import salted_hmac
+    from jobs.queue import enqueue
+
+    # Keyed hash, so the job's idempotency key can't be brute-forced back to the code.
+    # The code itself sits in the job's kwargs until send_otp_email has delivered it,
+    # then the queue redacts it (see registration/tasks.py).
+    digest = salted_hmac("registration.otp_email", f"{email_type}:{email}:{otp}", algorithm="sha256").hexdigest()
+    try:
+        enqueue(
+            "registration.send_otp_email",
+            idem_key=f"otp:{digest}",
+            email=email, otp=str(otp), email_type=email_type, username=username,
+        )
+        return True
+    except Exception:
+        logger.exception(
+            "Could not queue %s OTP email", email_type, extra={"email_type": email_type},
+        )
+        return False
+
+
+def deliver_otp_email(email, otp, email_type='signup', username=None):
+    """Render and send the OTP email (runs in the job worker; raises on SMTP errors so it retries)."""
     
     # Email type configurations
     EMAIL_CONFIGS = {
@@ -101,27 +128,21 @@ def send_dynamic_otp_email(email, otp, email_type='signup', username=None):
         'footer_text': config['footer_text'],
     }
     
-    try:
-        # Render HTML email
-        html_content = render_to_string('emails/dynamic_otp_email.html', context)
-        text_content = strip_tags(html_content)  # Fallback plain text
-        
-        # Create email
-        subject = config['subject']
-        from_email = settings.DEFAULT_FROM_EMAIL# Replace with your email
-        to_email = [email]
-        
-        # Create email with HTML
-        email_message = EmailMultiAlternatives(subject, text_content, from_email, to_email)
-        email_message.attach_alternative(html_content, "text/html")
-        email_message.send()
-        
-        print(f"✅ {email_type.upper()} OTP {otp} sent to {email}")
-        return True
-        
-    except Exception as e:
-        print(f'❌ Error sending OTP: {e}')
-        return False
+    # Render HTML email
+    html_content = render_to_string('emails/dynamic_otp_email.html', context)
+    text_content = strip_tags(html_content)  # Fallback plain text
+    
+    # Create email
+    subject = config['subject']
+    from_email = settings.DEFAULT_FROM_EMAIL# Replace with your email
+    to_email = [email]
+    
+    # Create email with HTML
+    email_message = EmailMultiAlternatives(subject, text_content, from_email, to_email)
+    email_message.attach_alternative(html_content, "text/html")
+    email_message.send()
+    
+    print(f"✅ {email_type.upper()} OTP {otp} sent to {email}")
 
 
 # ========== HELPER FUNCTIONS ==========
@@ -262,12 +283,9 @@ def VerifyOTP(request):
                     except ReferralProfile.DoesNotExist:
                         pass
 
-            # 4) Qualify + credit once (atomic and idempotent inside the service)
-            try:
-                qualify_signup_referral_and_credit(user)
-            except Exception as e:
-                # Do not block signup; you can log this for ops
-                messages.warning(request, f"Referral bonus pending: {e}")
+            # 4) Qualify + credit once, in the background (atomic and idempotent inside the service)
+            from jobs.queue import enqueue
+            enqueue("wallet.qualify_signup_referral", idem_key=f"referral:signup:{user.id}", user_id=user.id)
 
             messages.success(request, "Signup successful! 🎉")
 
@@ -0,0 +1,181 @@
+# shop/facets.py
+
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Q
+from django.db.models.functions import Lower
+
+from ecomerce.cache import versioned_key
+from products.models import Product, ProductVariant
+from products.search import search_products
+
+# (min, max) in rupees; None means open-ended
+PRICE_BUCKETS = [
+    (None, 1000),
+    (1000, 2000),
+    (2000, 5000),
+    (5000, 10000),
+    (10000, None),
+]
+
+FACET_CACHE_TIMEOUT = 300
+
+
+def listing_queryset():
+    """Products a customer can see in the shop."""
+    return Product.objects.filter(category__is_active=True, is_listed=True)
+
+
+def _decimal_or_none(value):
+    if value in (None, ""):
+        return None
+    try:
+        value = Decimal(str(value))
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+    # ?min=NaN or ?max=Infinity would otherwise reach the query
+    return value if value.is_finite() else None
+
+
+def apply_filters(products, filters, skip=()):
+    """
+    Apply the shop filter state to `products`.
+
+    `filters` is the dict built from the query string (q, category, brand,
+    color, min, max, available); names listed in `skip` are left out so
+    facet counts can ignore their own selection.
+    """
+    if filters.get("category") and "category" not in skip:
+        products = products.filter(category_id__in=filters["category"])
+    if filters.get("brand") and "brand" not in skip:
+        products = products.filter(brand_id__in=filters["brand"])
+
+    if filters.get("q"):
+        products = search_products(products, filters["q"])
+
+    # Color filter (EXISTS instead of a join + DISTINCT so pagination stays in SQL)
+    if filters.get("color") and "color" not in skip:
+        cq = Q()
+        for term in filters["color"]:
+            cq |= Q(color__icontains=term)
+        products = products.filter(
+            Exists(ProductVariant.objects.filter(cq, product=OuterRef("pk")))
+        )
+
+    # Price filter - effective_price is the persisted, offer-aware price customers pay
+    if "price" not in skip:
+        price_min = _decimal_or_none(filters.get("min"))
+        price_max = _decimal_or_none(filters.get("max"))
+        if price_min is not None:
+            products = products.filter(effective_price__gte=price_min)
+        if price_max is not None:
+            products = products.filter(effective_price__lte=price_max)
+
+    # Availability filter - in_stock is maintained from product and variant stock
+    if filters.get("available") == "1" and "available" not in skip:
+        products = products.filter(in_stock=True)
+
+    return products
+
+
+def _bucket_q(low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(effective_price__gte=low)
+    if high is not None:
+        q &= Q(effective_price__lt=high)
+    return q
+
+
+def filter_signature(filters):
+    """Stable cache key fragment for a filter state."""
+    normalised = {
+        key: sorted(value) if isinstance(value, (list, tuple)) else value
+        for key, value in filters.items()
+        if value not in (None, "", [], ())
+    }
+    raw = json.dumps(normalised, sort_keys=True, default=str)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def facet_counts(filters):
+    """
+    Per-category, per-brand, per-colour, availability and price-bucket counts
+    for the current filter state. Each facet ignores its own selection, so
+    the numbers say what ticking that option would return.
+
+    Costs four grouped queries however many facet values exist, and the
+    result is cached per filter signature until the "catalog" cache group
+    is bumped (any product, variant, offer, category or brand change).
+    """
+    key = versioned_key("shop:facets", filter_signature(filters))
+    facets = cache.get(key)
+    if facets is None:
+        facets = _compute_facets(filters)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def _compute_facets(filters):
+    base = listing_queryset()
+
+    categories = dict(
+        apply_filters(base, filters, skip=("category",))
+        .order_by()
+        .values("category_id")
+        .annotate(n=Count("id"))
+        .values_list("category_id", "n")
+    )
+
+    brands = dict(
+        apply_filters(base, filters, skip=("brand",))
+        .exclude(brand_id=None)
+        .order_by()
+        .values("brand_id")
+        .annotate(n=Count("id"))
+        .values_list("brand_id", "n")
+    )
+
+    colour_products = apply_filters(base, filters, skip=("color",)).order_by().values("id")
+    colors = [
+        {"value": value, "count": n}
+        for value, n in (
+            ProductVariant.objects
+            .filter(product_id__in=colour_products)
+            .annotate(value=Lower("color"))
+            .order_by()
+            .values("value")
+            .annotate(n=Count("product_id", distinct=True))
+            .order_by("value")
+            .values_list("value", "n")
+        )
+    ]
+
+    # Price buckets ignore the price filter, stock count ignores availability;
+    # both come out of one conditional aggregate.
+    price_q = Q()
+    price_min = _decimal_or_none(filters.get("min"))
+    price_max = _decimal_or_none(filters.get("max"))
+    if price_min is not None:
+        price_q &= Q(effective_price__gte=price_min)
+    if price_max is not None:
+        price_q &= Q(effective_price__lte=price_max)
+    stock_q = Q(in_stock=True) if filters.get("available") == "1" else Q()
+    aggregates = {"stock_count": Count("id", filter=price_q & Q(in_stock=True))}
+    for i, (low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f"bucket_{i}"] = Count("id", filter=stock_q & _bucket_q(low, high))
+    totals = apply_filters(base, filters, skip=("price", "available")).aggregate(**aggregates)
+
+    return {
+        "category": categories,
+        "brand": brands,
+        "color": colors,
+        "in_stock": totals["stock_count"],
+        "price": [
+            {"min": low, "max": high, "count": totals[f"bucket_{i}"]}
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+    }
@@ -0,0 +1,104 @@
+# shop/pagination.py
+
+import base64
+import binascii
+import json
+import math
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+# Sort keys that aren't text, and how a cursor value is read back for each
+CURSOR_TYPES = {
+    'id': int,
+    'effective_price': Decimal,
+    'search_rank': float,
+}
+
+
+def _field(ordering_term):
+    return ordering_term.lstrip('-')
+
+
+def encode_cursor(obj, ordering):
+    """
+    Encode the sort-key values of `obj` (the last row of a page) into an
+    opaque, URL-safe token.
+    """
+    values = [getattr(obj, _field(term)) for term in ordering]
+    raw = json.dumps(values, default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _coerce(field, value):
+    """`value` as the type of `field`; raises ValueError if it isn't one."""
+    kind = CURSOR_TYPES.get(field, str)
+    if kind is str:
+        if not isinstance(value, str):
+            raise ValueError(field)
+        return value
+    if isinstance(value, (bool, list, dict)) or value is None:
+        raise ValueError(field)
+    try:
+        # via str so 1.5 doesn't become id 1 and prices keep their digits
+        value = kind(str(value))
+    except InvalidOperation:
+        raise ValueError(field)
+    if kind is not int and not math.isfinite(value):
+        raise ValueError(field)
+    return value
+
+
+def decode_cursor(token, ordering):
+    """
+    Decode a token produced by encode_cursor(), with each value converted
+    to its field's type (see CURSOR_TYPES). Returns None for anything
+    malformed so callers can fall back to the first page.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != len(ordering):
+        return None
+    try:
+        return [_coerce(_field(term), value) for term, value in zip(ordering, values)]
+    except ValueError:
+        return None
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the "rows after this cursor" predicate for a lexicographic ordering,
+    e.g. ('price_eff', 'id') -> price_eff > v0 OR (price_eff = v0 AND id > v1).
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for term, value in zip(ordering, values):
+        field = _field(term)
+        lookup = 'lt' if term.startswith('-') else 'gt'
+        condition |= equal_so_far & Q(**{f'{field}__{lookup}': value})
+        equal_so_far &= Q(**{field: value})
+    return condition
+
+
+def keyset_page(queryset, ordering, cursor, per_page):
+    """
+    Fetch one page after `cursor` using an index-friendly range predicate
+    instead of OFFSET, so deep pages cost the same as the first one.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by(*ordering)
+    values = decode_cursor(cursor, ordering)
+    if values is not None:
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    rows = list(queryset[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(rows[-1], ordering) if has_more and rows else None
+    return rows, next_cursor
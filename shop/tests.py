@@ -1,3 +1,47 @@
-from django.test import TestCase
+from decimal import Decimal
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.db.models import Q
+from django.test import SimpleTestCase
+
+from .pagination import decode_cursor, encode_cursor, keyset_filter
+
+
+class CursorTests(SimpleTestCase):
+    ordering = ('-effective_price', '-id')
+
+    def test_round_trip_restores_field_types(self):
+        row = SimpleNamespace(effective_price=Decimal('1499.50'), id=42)
+        values = decode_cursor(encode_cursor(row, self.ordering), self.ordering)
+        self.assertEqual(values, [Decimal('1499.50'), 42])
+        self.assertIsInstance(values[0], Decimal)
+        self.assertIsInstance(values[1], int)
+
+    def test_text_sort_keys_stay_text(self):
+        row = SimpleNamespace(name='Bass Boost 3', id=7)
+        self.assertEqual(decode_cursor(encode_cursor(row, ('name', 'id')), ('name', 'id')), ['Bass Boost 3', 7])
+
+    def test_malformed_tokens_return_none(self):
+        for token in ['', 'not base64!', encode_cursor(SimpleNamespace(id=1), ('id',))]:
+            with self.subTest(token=token):
+                self.assertIsNone(decode_cursor(token, self.ordering))
+
+    def test_values_of_the_wrong_type_return_none(self):
+        for price, pk in [('cheap', 1), ('NaN', 1), ('Infinity', 1), ('10', 1.5), ('10', 'abc'), ('10', True), (None, 1)]:
+            with self.subTest(price=price, pk=pk):
+                token = encode_cursor(SimpleNamespace(effective_price=price, id=pk), self.ordering)
+                self.assertIsNone(decode_cursor(token, self.ordering))
+
+
+class KeysetFilterTests(SimpleTestCase):
+    def test_ascending_ordering(self):
+        self.assertEqual(
+            keyset_filter(('effective_price', 'id'), [Decimal('10'), 5]),
+            Q(effective_price__gt=Decimal('10')) | (Q(effective_price=Decimal('10')) & Q(id__gt=5)),
+        )
+
+    def test_descending_ordering(self):
+        self.assertEqual(
+            keyset_filter(('-name', '-id'), ['b', 3]),
+            Q(name__lt='b') | (Q(name='b') & Q(id__lt=3)),
+        )
@@ -4,4 +4,5 @@ from shop import views
 urlpatterns = [
     path('shop/',views.shop,name='shop'),
     path('shop/category/<int:id>/', views.shop_category_by_id, name='shop_category_id'),
+    path('shop/autocomplete/', views.search_autocomplete, name='shop_autocomplete'),
 ]
\ No newline at end of file
@@ -1,16 +1,59 @@
 from django.shortcuts import get_object_or_404, render
-from django.db.models import Q, F, Sum
-from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from django.db.models import F, Sum
 from django.core.paginator import Paginator
 from django.urls import reverse
 from products.models import Product
+from products.pricing import apply_prices
+from products.search import autocomplete
+from .facets import apply_filters, facet_counts, listing_queryset
+from .pagination import keyset_page, encode_cursor
 from category.models import Category, Brand
+from category.cache import active_categories
 from django.views.decorators.cache import never_cache
+from ecomerce.cache import cache_anonymous_page
 from django.utils import timezone
 from decimal import Decimal
 
 
+SHOP_PAGE_SIZE = 15
+
+# Deep pages switch from OFFSET to keyset pagination after this page number
+KEYSET_FROM_PAGE = 10
+
+SORT_ORDERINGS = {
+    'popularity': ('-id',),
+    'newest': ('-id',),
+    'price_asc': ('effective_price', 'id'),
+    'price_desc': ('-effective_price', '-id'),
+    'az': ('name', 'id'),
+    'za': ('-name', '-id'),
+    'relevance': ('-search_rank', '-id'),
+}
+
+
+def _decorate_listing(products):
+    """
+    Attach pricing (bulk, constant queries) and stock availability to the
+    products actually being rendered. Expects variants to be prefetched.
+    """
+    products_list = []
+    for product in apply_prices(products):
+        variants = list(product.variants.all())
+        if variants:
+            # For variant products - sum all variant stocks
+            product.total_stock = sum(int(v.stock or 0) for v in variants)
+        else:
+            # For simple products
+            product.total_stock = int(product.stock_quantity or 0)
+        product.in_stock = product.total_stock > 0
+        products_list.append(product)
+    return products_list
+
+
 @never_cache
+@cache_anonymous_page()
 def shop(request):
     # Query params
     q          = (request.GET.get('q') or '').strip()
@@ -22,96 +65,56 @@ def shop(request):
     available  = request.GET.get('available')
     sort_key   = request.GET.get('sort') or 'popularity'
 
+    filters = {
+        "q": q,
+        "category": cat_ids,
+        "brand": brand_ids,
+        "color": color_terms,
+        "min": price_min,
+        "max": price_max,
+        "available": available,
+    }
+
     # Base queryset
     products = (
-        Product.objects
-        .filter(category__is_active=True, is_listed=True)
+        listing_queryset()
         .select_related('brand', 'category')
         .prefetch_related('images', 'variants')  # ✅ Added variants prefetch
     )
 
-    # 1) facet filters (category, brand)
-    if cat_ids:
-        products = products.filter(category_id__in=cat_ids)
-    if brand_ids:
-        products = products.filter(brand_id__in=brand_ids)
+    # Facet filters, ranked text search, colour, price and availability
+    products = apply_filters(products, filters)
 
-    # 2) text search
-    if q:
-        search_q = Q(name__icontains=q) | Q(short_description__icontains=q) | Q(long_description__icontains=q)
-        if not brand_ids:
-            search_q |= Q(brand__name__icontains=q)
-        if not cat_ids:
-            search_q |= Q(category__name__icontains=q)
-        products = products.filter(search_q)
-
-    # Color filter
-    if color_terms:
-        cq = Q()
-        for term in color_terms:
-            cq |= Q(variants__color__name__icontains=term)
-        products = products.filter(cq).distinct()
-
-    # Price filter
-    products = products.annotate(price_eff=Coalesce('discount_price', 'base_price'))
-
-    if price_min:
-        try:
-            products = products.filter(price_eff__gte=float(price_min))
-        except (ValueError, TypeError):
-            pass
-    if price_max:
-        try:
-            products = products.filter(price_eff__lte=float(price_max))
-        except (ValueError, TypeError):
-            pass
-
-    # ✅ Availability filter - check both product stock and variant stock
-    if available == '1':
-        # Filter products that have stock OR have variants with stock
-        products = products.filter(
-            Q(stock_quantity__gt=0) |  # Simple product stock
-            Q(variants__stock__gt=0)   # Variant stock
-        ).distinct()
-
-    # Sorting
-    sort_map = {
-        'popularity': '-id',
-        'newest': '-id',
-        'price_asc': 'price_eff',
-        'price_desc': '-price_eff',
-        'az': 'name',
-        'za': '-name',
-    }
-    products = products.order_by(sort_map.get(sort_key, '-id'))
+    # Sorting (id tiebreak keeps pages stable and makes keyset cursors unique)
+    if q and sort_key in ('popularity', 'relevance'):
+        ordering = SORT_ORDERINGS['relevance']
+    else:
+        ordering = SORT_ORDERINGS.get(sort_key, SORT_ORDERINGS['popularity'])
+    products = products.order_by(*ordering)
 
-    # Facets
-    categories = Category.objects.filter(is_active=True).order_by('name')
-    brands     = Brand.objects.all().order_by('name')
+    # Facets - counts for the current filter state (cached per filter signature)
+    facets     = facet_counts(filters)
+    categories = active_categories()
+    brands     = list(Brand.objects.all().order_by('name'))
+    for c in categories:
+        c.facet_count = facets['category'].get(c.id, 0)
+    for b in brands:
+        b.facet_count = facets['brand'].get(b.id, 0)
     
-    # ✅ Build products list with pricing and stock info
-    products_list = []
-    for product in products:
-        product.final_price = product.get_final_price()
-        product.discount_percent = product.get_discount_percent()
-        product.extra_off = product.get_extra_off()
-        
-        # ✅ Calculate stock availability
-        if product.variants.exists():
-            # For variant products - sum all variant stocks
-            product.total_stock = sum(int(v.stock or 0) for v in product.variants.all())
-            product.in_stock = product.total_stock > 0
-        else:
-            # For simple products
-            product.total_stock = int(product.stock_quantity or 0)
-            product.in_stock = product.total_stock > 0
-        
-        products_list.append(product)
-
-    # Pagination (15 per page)
-    paginator = Paginator(products_list, 15)  # ✅ Changed from products to products_list
-    page_num  = request.GET.get('page')
-    page_obj  = paginator.get_page(page_num)
+    # Pagination (15 per page) - LIMIT/OFFSET in SQL, only the visible page is loaded
+    cursor = request.GET.get('cursor')
+    if cursor:
+        # Keyset mode for deep pages: no COUNT(*) and no OFFSET scan
+        page_items, next_cursor = keyset_page(products, ordering, cursor, SHOP_PAGE_SIZE)
+        page_obj = _decorate_listing(page_items)
+    else:
+        paginator = Paginator(products, SHOP_PAGE_SIZE)
+        page_obj  = paginator.get_page(request.GET.get('page'))
+        page_obj.object_list = _decorate_listing(page_obj.object_list)
+        next_cursor = None
+        if page_obj.has_next() and page_obj.number >= KEYSET_FROM_PAGE:
+            # Past this depth the "next" link switches to a cursor
+            next_cursor = encode_cursor(page_obj.object_list[-1], ordering)
 
     # Dynamic page title logic
     dynamic_title = "All Products"
@@ -130,8 +133,11 @@ def shop(request):
     ctx = {
         "products": page_obj,
         "page_obj": page_obj,
+        "keyset_mode": bool(cursor),
+        "next_cursor": next_cursor,
         "categories": categories,
         "brands": brands,
+        "facets": facets,
         "applied": {
             "q": q,
             "category": cat_ids,
@@ -149,6 +155,28 @@ def shop(request):
     return render(request, "user/shop.html", ctx)
 
 
+@require_GET
+def search_autocomplete(request):
+    """
+    Type-ahead suggestions for the shop search box.
+    GET ?q=<partial text> -> {"results": [{id, name, price, url}, ...]}
+    """
+    q = (request.GET.get('q') or '').strip()
+    if len(q) < 2:
+        return JsonResponse({'results': []})
+
+    results = [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'price': str(row['effective_price']),
+            'url': reverse('product_detail', args=[row['id']]),
+        }
+        for row in autocomplete(listing_queryset(), q)
+    ]
+    return JsonResponse({'results': results})
+
+
 def shop_category_by_id(request, id):
     category = get_object_or_404(Category, id=id, is_active=True)
     products = Product.objects.filter(
@@ -156,26 +184,12 @@ def shop_category_by_id(request, id):
         is_listed=True
     ).select_related('brand', 'category').prefetch_related('variants', 'images')
     
-    # ✅ Add stock info to products
-    products_list = []
-    for product in products:
-        product.final_price = product.get_final_price()
-        product.discount_percent = product.get_discount_percent()
-        product.extra_off = product.get_extra_off()
-        
-        # Calculate stock
-        if product.variants.exists():
-            product.total_stock = sum(int(v.stock or 0) for v in product.variants.all())
-            product.in_stock = product.total_stock > 0
-        else:
-            product.total_stock = int(product.stock_quantity or 0)
-            product.in_stock = product.total_stock > 0
-        
-        products_list.append(product)
+    # ✅ Add pricing and stock info to products
+    products_list = _decorate_listing(products)
     
     return render(request, 'user/shop.html', {
         'products': products_list,  # ✅ Changed to products_list
-        'categories': Category.objects.filter(is_active=True),
+        'categories': active_categories(),
         'brands': Brand.objects.all(),
         'applied': {
             'category': [str(id)], 
@@ -0,0 +1,245 @@
+# wallet/ledger.py
+"""
+Wallet ledger engine behind wallet.services.credit/debit.
+
+WalletTransaction rows are append-only: an entry is written once, with the
+balance it left the account at, and never changed. WalletAccount.balance
+is the running snapshot of that ledger, moved in the same transaction.
+
+Posting one entry takes two statements and no SELECT ... FOR UPDATE:
+
+  1. UPDATE the account with balance = balance +/- amount. Debits add
+     "AND balance >= amount", so an overdraft simply matches no row. The
+     UPDATE locks the account row until commit, which orders concurrent
+     postings to the same account; other accounts are never blocked.
+  2. INSERT the entry, taking balance_after from the row just updated, with
+     ON CONFLICT (account, idem_key) DO NOTHING. If the idempotency key was
+     already used, nothing is inserted and the balance change is rolled
+     back, so a retried refund or webhook credits the wallet only once.
+
+credit_many() posts a batch (mass refunds, referral payouts) with a handful
+of statements per batch instead of two per entry. It locks the accounts
+involved in id order, so concurrent batches can't deadlock.
+
+rebuild_wallet_stats warns when the balances drift from the ledger;
+stress_wallet_ledger checks the engine under parallel load.
+"""
+import json
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from .models import WalletAccount, WalletTransaction, gen_transaction_id
+from . import stats
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
+
+BATCH_SIZE = 500
+
+# A clash on the random transaction_id rolls back and is retried this many times
+ID_RETRIES = 3
+
+
+class InsufficientBalance(ValueError):
+    pass
+
+
+class _Duplicate(Exception):
+    pass
+
+
+def _money(amount):
+    return Decimal(str(amount)).quantize(CENT)
+
+
+def _user_id(user):
+    return getattr(user, "pk", user)
+
+
+def _insert_sql():
+    txn = WalletTransaction._meta
+    col = lambda name: txn.get_field(name).column  # noqa: E731
+    columns = [
+        "transaction_id", "kind", "amount", "status", "description", "reference",
+        "idem_key", "meta", "created_at", "updated_at",
+    ]
+    return (
+        f"INSERT INTO {txn.db_table} "
+        f"({', '.join(col(c) for c in columns)}, {col('account')}, {col('balance_after')}) "
+        f"SELECT {', '.join(['%s'] * (len(columns) - 3))}, %s::jsonb, %s, %s, a.id, a.balance "
+        f"FROM {WalletAccount._meta.db_table} a WHERE a.{WalletAccount._meta.get_field('user').column} = %s "
+        f"ON CONFLICT ({col('account')}, {col('idem_key')}) WHERE {col('idem_key')} IS NOT NULL DO NOTHING "
+        f"RETURNING id, {col('account')}, {col('balance_after')}"
+    )
+
+
+def _move_balance(user_id, kind, amount, now):
+    """Step 1: the conditional balance update. Creates a missing wallet for credits."""
+    delta = amount if kind == WalletTransaction.CREDIT else -amount
+    accounts = WalletAccount.objects.filter(user_id=user_id)
+    if kind == WalletTransaction.DEBIT:
+        accounts = accounts.filter(balance__gte=amount)
+    if accounts.update(balance=F("balance") + delta, updated_at=now):
+        return
+    if kind == WalletTransaction.DEBIT:
+        raise InsufficientBalance("Insufficient wallet balance")
+    WalletAccount.objects.get_or_create(user_id=user_id)
+    WalletAccount.objects.filter(user_id=user_id).update(balance=F("balance") + delta, updated_at=now)
+
+
+def _post_once(user_id, kind, amount, description, reference, meta, idem_key):
+    now = timezone.now()
+    with transaction.atomic():
+        _move_balance(user_id, kind, amount, now)
+        with connection.cursor() as cursor:
+            cursor.execute(_insert_sql(), [
+                gen_transaction_id(), kind, amount, "completed", description, reference,
+                idem_key, json.dumps(meta), now, now, user_id,
+            ])
+            row = cursor.fetchone()
+        if row is None:
+            # Key already used: undo the balance change
+            raise _Duplicate()
+
+        txn_id, account_id, balance_after = row
+        txn = WalletTransaction(
+            id=txn_id, account_id=account_id, kind=kind, amount=amount,
+            balance_after=balance_after, status="completed", description=description,
+            reference=reference, idem_key=idem_key, meta=meta, created_at=now, updated_at=now,
+        )
+        txn._state.adding = False
+        txn._state.db = connection.alias
+        stats.record(txn)
+    return txn
+
+
+def post(user, kind, amount, description="", reference="", meta=None, idem_key=None):
+    """
+    Credit or debit (`kind`) `amount` to the user's wallet. Returns the new
+    WalletTransaction, or None when `idem_key` was already used on this
+    wallet. Debits raise InsufficientBalance rather than overdraw.
+    """
+    user_id = _user_id(user)
+    amount = _money(amount)
+    meta = meta or {}
+    for attempt in range(ID_RETRIES):
+        try:
+            txn = _post_once(user_id, kind, amount, description, reference, meta, idem_key)
+            break
+        except _Duplicate:
+            logger.info(
+                "Wallet %s skipped: idempotency key %s already used (user %s)", kind, idem_key, user_id,
+                extra={"wallet_user_id": user_id, "wallet_kind": kind, "wallet_idem_key": idem_key},
+            )
+            return None
+        except IntegrityError:
+            if attempt == ID_RETRIES - 1:
+                raise
+
+    logger.info(
+        "Wallet %s of %s for user %s (txn %s, balance %s)", kind, amount, user_id, txn.pk, txn.balance_after,
+        extra={
+            "wallet_user_id": user_id, "wallet_kind": kind, "wallet_amount": str(amount),
+            "wallet_txn_id": txn.pk, "wallet_balance": str(txn.balance_after), "wallet_idem_key": idem_key,
+        },
+    )
+    return txn
+
+
+def _credit_batch(entries):
+    """Post one batch of credits in a single transaction; returns the new entries."""
+    now = timezone.now()
+    user_ids = {_user_id(entry["user"]) for entry in entries}
+    WalletAccount.objects.bulk_create(
+        [WalletAccount(user_id=user_id) for user_id in user_ids], ignore_conflicts=True,
+    )
+
+    with transaction.atomic():
+        accounts = {}
+        balances = {}
+        # Locks taken in id order, so overlapping batches queue instead of deadlocking
+        rows = (
+            WalletAccount.objects.select_for_update()
+            .filter(user_id__in=user_ids)
+            .order_by("id")
+            .values_list("id", "user_id", "balance")
+        )
+        for account_id, user_id, balance in rows:
+            accounts[user_id] = account_id
+            balances[account_id] = balance
+
+        keys = [entry["idem_key"] for entry in entries if entry.get("idem_key")]
+        seen = set(
+            WalletTransaction.objects.filter(account_id__in=balances, idem_key__in=keys)
+            .values_list("account_id", "idem_key")
+        ) if keys else set()
+
+        txns = []
+        deltas = defaultdict(Decimal)
+        for entry in entries:
+            account_id = accounts[_user_id(entry["user"])]
+            idem_key = entry.get("idem_key")
+            if idem_key:
+                if (account_id, idem_key) in seen:
+                    continue
+                seen.add((account_id, idem_key))
+            amount = _money(entry["amount"])
+            balances[account_id] += amount
+            deltas[account_id] += amount
+            txns.append(WalletTransaction(
+                account_id=account_id,
+                transaction_id=gen_transaction_id(),
+                kind=WalletTransaction.CREDIT,
+                amount=amount,
+                balance_after=balances[account_id],
+                description=entry.get("description", ""),
+                reference=entry.get("reference", ""),
+                idem_key=idem_key,
+                meta=entry.get("meta") or {},
+            ))
+        if not txns:
+            return []
+
+        WalletTransaction.objects.bulk_create(txns)
+        WalletAccount.objects.filter(id__in=deltas).update(
+            balance=F("balance") + Case(
+                *[When(id=account_id, then=Value(delta)) for account_id, delta in deltas.items()],
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            updated_at=now,
+        )
+        stats.record_many(txns)
+    return txns
+
+
+def credit_many(entries, batch_size=BATCH_SIZE):
+    """
+    Credit many wallets at once. Each entry is a dict of credit()'s
+    arguments (user or user id, amount, description, reference, meta,
+    idem_key). Entries whose idem_key was already used on that wallet, or
+    repeats one earlier in `entries`, are skipped. Each batch of
+    `batch_size` commits on its own. Returns the new WalletTransactions.
+    """
+    entries = list(entries)
+    created = []
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        for attempt in range(ID_RETRIES):
+            try:
+                txns = _credit_batch(batch)
+                break
+            except IntegrityError:
+                if attempt == ID_RETRIES - 1:
+                    raise
+        created += txns
+        logger.info(
+            "Wallet batch credit: %s of %s entries posted", len(txns), len(batch),
+            extra={"wallet_batch_size": len(batch), "wallet_batch_posted": len(txns)},
+        )
+    return created
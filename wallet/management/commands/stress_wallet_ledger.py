@@ -0,0 +1,129 @@
+import random
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from wallet import stats
+from wallet.ledger import InsufficientBalance
+from wallet.models import WalletAccount, WalletTransaction
+from wallet.services import credit, credit_many, debit
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer a few throwaway wallets with concurrent credits, debits, replayed "
+        "idempotency keys and batch credits, then check that no update was lost, "
+        "no wallet went negative and no key was applied twice. Cleans up after itself."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=32, help="Concurrent posters (DB connections).")
+        parser.add_argument("--users", type=int, default=10, help="Wallets shared by all workers.")
+        parser.add_argument("--operations", type=int, default=200, help="Operations per worker.")
+        parser.add_argument("--batch-every", type=int, default=50, help="Every Nth operation is a 20-entry credit_many.")
+        parser.add_argument("--keep", action="store_true", help="Leave the users and their wallets in place.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        tag = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create(username=f"wallet-stress-{tag}-{i}", email=f"wallet-stress-{tag}-{i}@example.com")
+            for i in range(options["users"])
+        ]
+        for user in users:
+            WalletAccount.objects.get_or_create(user=user)
+
+        def hammer(worker):
+            rng = random.Random(worker)
+            counts = defaultdict(int)
+            try:
+                for n in range(options["operations"]):
+                    user = rng.choice(users)
+                    amount = Decimal(rng.randint(1, 500))
+                    if options["batch_every"] and n % options["batch_every"] == 0:
+                        entries = [
+                            # Keys shared between workers: each should land exactly once
+                            {"user": rng.choice(users), "amount": 5, "idem_key": f"stress:{tag}:batch:{rng.randint(1, 200)}"}
+                            for _ in range(20)
+                        ]
+                        counts["batch_credits"] += len(credit_many(entries))
+                    elif rng.random() < 0.1:
+                        key = f"stress:{tag}:replay:{rng.randint(1, 50)}"
+                        counts["replays" if credit(user, 1, idem_key=key) is None else "credits"] += 1
+                    elif rng.random() < 0.5:
+                        credit(user, amount, description="Stress credit")
+                        counts["credits"] += 1
+                    else:
+                        try:
+                            debit(user, amount, description="Stress debit")
+                            counts["debits"] += 1
+                        except InsufficientBalance:
+                            counts["rejected_debits"] += 1
+                return counts
+            finally:
+                connection.close()  # pool threads each opened their own
+
+        workers = max(options["workers"], 1)
+        started = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                totals = defaultdict(int)
+                for counts in pool.map(hammer, range(workers)):
+                    for key, value in counts.items():
+                        totals[key] += value
+            elapsed = time.monotonic() - started
+            problems = self._check(users)
+        finally:
+            if not options["keep"]:
+                User.objects.filter(id__in=[u.id for u in users]).delete()
+                today = timezone.localdate()
+                stats.rebuild(today, today)
+
+        operations = workers * options["operations"]
+        self.stdout.write(
+            f"{operations} operations in {elapsed:.2f}s ({operations / elapsed:.0f} ops/s, {workers} workers): "
+            + ", ".join(f"{key}={value}" for key, value in sorted(totals.items()))
+        )
+        if problems:
+            raise CommandError("; ".join(problems[:10]))
+        self.stdout.write(self.style.SUCCESS("✅ No lost updates: every balance matches its ledger"))
+
+    def _check(self, users):
+        problems = []
+        for account in WalletAccount.objects.filter(user__in=users):
+            running = Decimal("0")
+            rows = (
+                WalletTransaction.objects.filter(account=account)
+                .order_by("id")
+                .values_list("id", "kind", "amount", "balance_after")
+            )
+            for txn_id, kind, amount, balance_after in rows:
+                running += amount if kind == WalletTransaction.CREDIT else -amount
+                if balance_after != running:
+                    problems.append(f"wallet {account.pk}: txn {txn_id} says {balance_after}, ledger says {running}")
+                    break
+                if running < 0:
+                    problems.append(f"wallet {account.pk} went negative at txn {txn_id}")
+                    break
+            if account.balance != running:
+                problems.append(f"wallet {account.pk}: balance {account.balance}, ledger sums to {running}")
+
+        duplicates = (
+            WalletTransaction.objects.filter(account__user__in=users, idem_key__isnull=False)
+            .values("account_id", "idem_key")
+            .order_by()
+        )
+        seen = set()
+        for row in duplicates:
+            key = (row["account_id"], row["idem_key"])
+            if key in seen:
+                problems.append(f"idempotency key {row['idem_key']} applied twice on wallet {row['account_id']}")
+            seen.add(key)
+        return problems
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-16 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0006_wallettransaction_idem_key_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyWalletStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('kind', models.CharField(choices=[('CREDIT', 'Credit'), ('DEBIT', 'Debit')], max_length=6)),
+                ('status', models.CharField(choices=[('completed', 'Completed'), ('pending', 'Pending'), ('failed', 'Failed')], max_length=20)),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('entries', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'kind', 'status', 'shard'), name='unique_daily_wallet_stats')],
+            },
+        ),
+    ]
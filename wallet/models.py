@@ -1,4 +1,6 @@
 # wallet/models.py
+import uuid
+
 from django.conf import settings
 from django.db import models
 from django.utils.crypto import get_random_string
@@ -8,6 +10,10 @@ from django.dispatch import receiver
 User = settings.AUTH_USER_MODEL
 
 
+def gen_transaction_id():
+    return f"TXN{uuid.uuid4().hex[:8].upper()}"
+
+
 class WalletAccount(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="wallet")
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
@@ -69,8 +75,7 @@ class WalletTransaction(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.transaction_id:
-            import uuid
-            self.transaction_id = f"TXN{uuid.uuid4().hex[:8].upper()}"
+            self.transaction_id = gen_transaction_id()
         
         if not self.balance_after and self.account_id:
             self.balance_after = self.account.balance
@@ -81,6 +86,30 @@ class WalletTransaction(models.Model):
         return f"{self.transaction_id} - {self.account.user.username} - ₹{self.amount}"
 
 
+class DailyWalletStats(models.Model):
+    """
+    Ledger entries and their amount per creation day, kind and status
+    (maintained by wallet.stats, read by the admin wallet transactions page).
+    Each key is split over a few shards so concurrent wallet operations
+    don't all queue on the same row.
+    """
+
+    day = models.DateField()
+    kind = models.CharField(max_length=6, choices=WalletTransaction.KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=WalletTransaction.STATUS_CHOICES)
+    shard = models.PositiveSmallIntegerField(default=0)
+    entries = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "kind", "status", "shard"], name="unique_daily_wallet_stats"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.kind} {self.status}: ₹{self.amount}"
+
+
 @receiver(post_save, sender=User)
 def ensure_wallet(sender, instance, created, **kwargs):
     if created:
@@ -1,15 +1,21 @@
 # wallet/services.py
+import logging
 
 from django.db import transaction
-from decimal import Decimal
-from .models import WalletAccount, WalletTransaction
+from django.db.models import F
 from django.utils import timezone
 
+from .models import WalletTransaction
+from . import ledger
+from .ledger import InsufficientBalance  # noqa: F401 (raised by debit)
+
+logger = logging.getLogger(__name__)
+
 
 def credit(user, amount, description="", reference="", meta=None, idem_key=None):
     """
     Credit user wallet with proper idempotency support
-    
+
     Args:
         user: User object
         amount: Amount to credit
@@ -17,89 +23,41 @@ def credit(user, amount, description="", reference="", meta=None, idem_key=None)
         reference: Reference ID (e.g., payment_id)
         meta: Additional metadata (dict)
         idem_key: Idempotency key to prevent duplicates
-    
+
     Returns:
         WalletTransaction object or None if duplicate
     """
-    meta = meta or {}
-    
-    with transaction.atomic():
-        # Get or create wallet account
-        acct = WalletAccount.objects.select_for_update().get_or_create(user=user)[0]
-        
-        # ✅ FIXED: Check idempotency using idem_key field
-        if idem_key:
-            existing = WalletTransaction.objects.filter(
-                account=acct,
-                idem_key=idem_key  # ✅ Check correct field
-            ).first()
-            
-            if existing:
-                print(f"⚠️ DUPLICATE TRANSACTION BLOCKED!")
-                print(f"   User: {user.username}")
-                print(f"   Idem Key: {idem_key}")
-                print(f"   Existing Transaction: {existing.id}")
-                print(f"   Created: {existing.created_at}")
-                return None  # Don't raise error, just return None
-        
-        # Update balance
-        acct.balance = (acct.balance or Decimal("0")) + Decimal(amount)
-        balance_after = acct.balance
-        acct.save(update_fields=["balance"])
-        
-        # Create transaction
-        txn = WalletTransaction.objects.create(
-            account=acct,
-            kind=WalletTransaction.CREDIT,
-            amount=Decimal(amount),
-            balance_after=balance_after,
-            description=description,
-            reference=reference,  # ✅ Keep reference separate
-            idem_key=idem_key,    # ✅ Store idem_key separately
-            meta=meta,
-        )
-        
-        print(f"✅ WALLET CREDITED")
-        print(f"   User: {user.username}")
-        print(f"   Amount: ₹{amount}")
-        print(f"   Balance: ₹{balance_after}")
-        print(f"   Transaction: {txn.id}")
-        print(f"   Idem Key: {idem_key}")
-        
-        return txn
-
-
-def debit(user, amount, description="", reference="", meta=None):
-    """Debit user wallet"""
-    meta = meta or {}
-    
-    with transaction.atomic():
-        acct = WalletAccount.objects.select_for_update().get(user=user)
-        
-        if acct.balance < Decimal(amount):
-            raise ValueError("Insufficient wallet balance")
-        
-        acct.balance = acct.balance - Decimal(amount)
-        balance_after = acct.balance
-        acct.save(update_fields=["balance"])
-        
-        return WalletTransaction.objects.create(
-            account=acct,
-            kind=WalletTransaction.DEBIT,
-            amount=amount,
-            balance_after=balance_after,
-            description=description,
-            reference=reference,
-            meta=meta
-        )
+    return ledger.post(
+        user, WalletTransaction.CREDIT, amount,
+        description=description, reference=reference, meta=meta, idem_key=idem_key,
+    )
+
+
+def debit(user, amount, description="", reference="", meta=None, idem_key=None):
+    """
+    Debit user wallet. Raises InsufficientBalance (a ValueError) instead
+    of overdrawing; returns None if `idem_key` was already used.
+    """
+    return ledger.post(
+        user, WalletTransaction.DEBIT, amount,
+        description=description, reference=reference, meta=meta, idem_key=idem_key,
+    )
+
+
+def credit_many(entries):
+    """
+    Credit many wallets in batches (mass refunds, referral payouts). Each
+    entry is a dict of credit()'s arguments. Returns the new transactions.
+    """
+    return ledger.credit_many(entries)
 
 
 def qualify_signup_referral_and_credit(referee):
     """Qualify referral and credit reward"""
-    print("QUALIFY FUNCTION TRIGGERED", referee.id)
+    logger.debug("Qualifying signup referral for user %s", referee.id, extra={"wallet_user_id": referee.id})
+
+    from wallet.models import Referral, ReferralConfig, ReferralProfile
 
-    from wallet.models import Referral, ReferralConfig
-    
     cfg = ReferralConfig.objects.filter(active=True).first()
     if not cfg or cfg.signup_reward <= 0:
         return False
@@ -122,33 +80,27 @@ def qualify_signup_referral_and_credit(referee):
         reward = cfg.signup_reward
         referrer = ref.referrer
 
-        wallet, _ = WalletAccount.objects.select_for_update().get_or_create(user=referrer)
-
-        wallet.balance = (wallet.balance or Decimal("0")) + reward
-        balance_after = wallet.balance
-        wallet.save(update_fields=["balance"])
-
-        # ✅ Use idempotency key
-        WalletTransaction.objects.create(
-            account=wallet,
-            kind=WalletTransaction.CREDIT,
-            amount=reward,
-            balance_after=balance_after,
+        txn = credit(
+            referrer,
+            reward,
             description="Referral Signup Reward",
             reference=f"referral_signup_{referee.id}",
-            idem_key=f"referral:signup:{referee.id}",  # ✅ Add idem_key
+            idem_key=f"referral:signup:{referee.id}",
             meta={
                 "referrer_id": referrer.id,
                 "referee_id": referee.id,
                 "code": ref.code_used,
-            }
+            },
         )
+        if txn is None:
+            # Reward already paid for this referee
+            return False
 
         # Update referral profile
-        rp = referrer.referral_profile
-        rp.total_referrals += 1
-        rp.lifetime_earnings = (rp.lifetime_earnings or Decimal("0")) + reward
-        rp.save(update_fields=["total_referrals", "lifetime_earnings"])
+        ReferralProfile.objects.filter(user=referrer).update(
+            total_referrals=F("total_referrals") + 1,
+            lifetime_earnings=F("lifetime_earnings") + reward,
+        )
 
         ref.status = "qualified"
         ref.reward_amount = reward
@@ -0,0 +1,161 @@
+# wallet/stats.py
+"""
+Ledger statistics behind the admin wallet transactions page.
+
+DailyWalletStats holds the number and sum of WalletTransaction rows per
+creation day (local time), kind and status. record() adds each new entry
+inside the same transaction that writes it (wallet.services), so the
+rollup commits or rolls back together with the ledger. The page then
+reads a few rows per day instead of aggregating the whole ledger.
+
+Every key is split over SHARDS rows (by account id), so concurrent
+credits and debits for different accounts rarely wait on each other's
+row lock; readers just sum the shards.
+
+rebuild() recomputes a date range from WalletTransaction. The
+rebuild_wallet_stats command uses it to backfill, and to repair drift
+(e.g. entries written by raw SQL or edited in the shell).
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Mod, TruncDate
+from django.utils import timezone
+
+from .models import DailyWalletStats, WalletAccount, WalletTransaction
+
+SHARDS = 8
+
+# Window for the "from last month" change on the page
+CHANGE_WINDOW_DAYS = 30
+
+
+def _add(key, entries, amount):
+    """Add to the stats row at `key`, creating it if needed (safe under concurrency)."""
+    changes = {"entries": F("entries") + entries, "amount": F("amount") + amount}
+    if DailyWalletStats.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyWalletStats.objects.create(**key, entries=entries, amount=amount)
+    except IntegrityError:
+        # Someone created the row first
+        DailyWalletStats.objects.filter(**key).update(**changes)
+
+
+def record(txn, sign=1):
+    """
+    Count ledger entry `txn` (sign=-1 uncounts it). Call inside the
+    transaction that saves the entry.
+    """
+    _add(
+        {
+            "day": timezone.localtime(txn.created_at).date(),
+            "kind": txn.kind,
+            "status": txn.status,
+            "shard": txn.account_id % SHARDS,
+        },
+        sign,
+        sign * Decimal(txn.amount),
+    )
+
+
+def record_many(txns):
+    """record() for a batch of new entries, one stats update per key."""
+    totals = defaultdict(lambda: [0, Decimal("0")])
+    for txn in txns:
+        key = (timezone.localtime(txn.created_at).date(), txn.kind, txn.status, txn.account_id % SHARDS)
+        totals[key][0] += 1
+        totals[key][1] += Decimal(txn.amount)
+    # Keys in sorted order so concurrent batches can't deadlock on the stats rows
+    for day, kind, status, shard in sorted(totals):
+        entries, amount = totals[(day, kind, status, shard)]
+        _add({"day": day, "kind": kind, "status": status, "shard": shard}, entries, amount)
+
+
+def rebuild(start, end):
+    """Recompute the stats for the days start..end (inclusive) from WalletTransaction."""
+    with transaction.atomic():
+        DailyWalletStats.objects.filter(day__range=(start, end)).delete()
+        rows = (
+            WalletTransaction.objects.filter(created_at__date__range=(start, end))
+            .annotate(d=TruncDate("created_at"), s=Mod("account_id", SHARDS))
+            .values("d", "kind", "status", "s")
+            .annotate(n=Count("id"), total=Sum("amount"))
+            .order_by()
+        )
+        stats = [
+            DailyWalletStats(
+                day=row["d"], kind=row["kind"], status=row["status"], shard=row["s"],
+                entries=row["n"], amount=row["total"] or 0,
+            )
+            for row in rows
+        ]
+        DailyWalletStats.objects.bulk_create(stats, batch_size=1000)
+    return len(stats)
+
+
+def ledger_drift():
+    """Sum of WalletAccount balances minus the balance implied by the stats (0 when in sync)."""
+    totals = summary()
+    balances = WalletAccount.objects.aggregate(total=Sum("balance"))["total"] or 0
+    return balances - totals["total_balance"]
+
+
+def _change(recent, previous):
+    # Same rule the page has always shown: an empty previous window counts as 1
+    previous = previous or 1
+    return (recent - previous) / previous * 100
+
+
+def summary(today=None):
+    """
+    Figures for the wallet transactions page in one query over the stats:
+    completed credits/debits, pending amount, the balance they add up to,
+    and the % change of credits/debits over the last CHANGE_WINDOW_DAYS
+    versus the window before.
+    """
+    today = today or timezone.localdate()
+    recent_start = today - timedelta(days=CHANGE_WINDOW_DAYS)
+    prev_start = recent_start - timedelta(days=CHANGE_WINDOW_DAYS)
+
+    completed_credit = Q(kind=WalletTransaction.CREDIT, status="completed")
+    completed_debit = Q(kind=WalletTransaction.DEBIT, status="completed")
+    recent = Q(day__gt=recent_start, day__lte=today)
+    previous = Q(day__gt=prev_start, day__lte=recent_start)
+
+    totals = DailyWalletStats.objects.aggregate(
+        credits=Sum("amount", filter=completed_credit),
+        debits=Sum("amount", filter=completed_debit),
+        pending=Sum("amount", filter=Q(status="pending")),
+        credits_recent=Sum("amount", filter=completed_credit & recent),
+        credits_previous=Sum("amount", filter=completed_credit & previous),
+        debits_recent=Sum("amount", filter=completed_debit & recent),
+        debits_previous=Sum("amount", filter=completed_debit & previous),
+    )
+    totals = {key: value or Decimal("0") for key, value in totals.items()}
+    return {
+        "total_credits": totals["credits"],
+        "total_debits": totals["debits"],
+        "pending_amount": totals["pending"],
+        "total_balance": totals["credits"] - totals["debits"],
+        "credit_change": _change(totals["credits_recent"], totals["credits_previous"]),
+        "debit_change": _change(totals["debits_recent"], totals["debits_previous"]),
+    }
+
+
+def count(kind=None, status=None, start=None, end=None):
+    """Number of ledger entries matching the page's type/status/date filters."""
+    qs = DailyWalletStats.objects.all()
+    if kind:
+        qs = qs.filter(kind=kind)
+    if status:
+        qs = qs.filter(status=status)
+    if start:
+        qs = qs.filter(day__gte=start)
+    if end:
+        qs = qs.filter(day__lte=end)
+    return qs.aggregate(n=Sum("entries"))["n"] or 0
@@ -0,0 +1,12 @@
+# wallet/tasks.py
+from django.contrib.auth.models import User
+
+from jobs.queue import task
+from .services import qualify_signup_referral_and_credit
+
+
+@task("wallet.qualify_signup_referral")
+def qualify_signup_referral(user_id):
+    user = User.objects.filter(pk=user_id).first()
+    if user:
+        qualify_signup_referral_and_credit(user)
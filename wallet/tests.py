@@ -1,3 +1,29 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from ecomerce.exports import csv_lines, encode_blocks, gzip_blocks
+
+
+class StreamingCsvTests(SimpleTestCase):
+    def test_csv_lines_writes_header_then_rows(self):
+        lines = list(csv_lines(["ID", "Note"], [[1, "plain"], [2, 'has "quotes", commas']]))
+        self.assertEqual(len(lines), 3)
+        parsed = list(csv.reader(io.StringIO("".join(lines))))
+        self.assertEqual(parsed, [["ID", "Note"], ["1", "plain"], ["2", 'has "quotes", commas']])
+
+    def test_encode_blocks_groups_lines_without_losing_bytes(self):
+        lines = [f"row {i},₹{i}\r\n" for i in range(1000)]
+        blocks = list(encode_blocks(lines, block_size=256))
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(b"".join(blocks), "".join(lines).encode("utf-8"))
+
+    def test_gzip_blocks_produce_one_valid_gzip_stream(self):
+        payload = [f"line {i}\n".encode() for i in range(5000)]
+        compressed = b"".join(gzip_blocks(iter(payload)))
+        self.assertEqual(gzip.decompress(compressed), b"".join(payload))
+
+    def test_gzip_blocks_of_nothing_is_an_empty_gzip_file(self):
+        self.assertEqual(gzip.decompress(b"".join(gzip_blocks([]))), b"")
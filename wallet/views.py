@@ -4,17 +4,20 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
+from django.http import JsonResponse, HttpResponseBadRequest
 from django.core.paginator import Paginator
-from django.db.models import Sum, Q
+from django.db.models import Q
 from django.conf import settings
+from django.utils.dateparse import parse_date
 from decimal import Decimal
 from datetime import datetime, timedelta
-import csv
 import razorpay
 
+from ecomerce.db import use_replica
+from ecomerce.exports import EXPORT_CHUNK_SIZE, csv_response, wants_gzip
 from .models import WalletAccount, WalletTransaction, ReferralProfile, Referral
 from .services import credit
+from . import stats
 from .utils import build_ref_link
 
 # Initialize Razorpay client
@@ -111,6 +114,7 @@ def refer(request):
 
 
 @staff_member_required
+@use_replica()
 def wallet_transactions(request):
     # Get filter parameters
     transaction_type = request.GET.get('type', '')
@@ -147,71 +151,33 @@ def wallet_transactions(request):
             Q(reference__icontains=search_query)
         )
     
-    # Calculate statistics
-    total_credits = WalletTransaction.objects.filter(
-        kind='CREDIT', 
-        status='completed'
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    total_debits = WalletTransaction.objects.filter(
-        kind='DEBIT', 
-        status='completed'
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    pending_amount = WalletTransaction.objects.filter(
-        status='pending'
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    total_balance = WalletAccount.objects.aggregate(total=Sum('balance'))['total'] or 0
-    
-    # Calculate month-over-month changes
-    last_month_start = datetime.now() - timedelta(days=30)
-    
-    last_month_credits = WalletTransaction.objects.filter(
-        kind='CREDIT',
-        status='completed',
-        created_at__gte=last_month_start
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    prev_month_start = last_month_start - timedelta(days=30)
-    prev_month_credits = WalletTransaction.objects.filter(
-        kind='CREDIT',
-        status='completed',
-        created_at__gte=prev_month_start,
-        created_at__lt=last_month_start
-    ).aggregate(total=Sum('amount'))['total'] or 1
-    
-    credit_change = ((last_month_credits - prev_month_credits) / prev_month_credits * 100) if prev_month_credits > 0 else 0
-    
-    # Calculate debit change
-    last_month_debits = WalletTransaction.objects.filter(
-        kind='DEBIT',
-        status='completed',
-        created_at__gte=last_month_start
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    prev_month_debits = WalletTransaction.objects.filter(
-        kind='DEBIT',
-        status='completed',
-        created_at__gte=prev_month_start,
-        created_at__lt=last_month_start
-    ).aggregate(total=Sum('amount'))['total'] or 1
-    
-    debit_change = ((last_month_debits - prev_month_debits) / prev_month_debits * 100) if prev_month_debits > 0 else 0
-    
-    # Pagination
+    # Page figures come from the daily ledger rollup (wallet.stats), not the ledger itself
+    totals = stats.summary()
+
+    # Pagination. Without a text search the count can come from the rollup too
     paginator = Paginator(transactions, 10)
+    if not search_query:
+        try:
+            start_day = parse_date(from_date) if from_date else None
+            end_day = parse_date(to_date) if to_date else None
+        except ValueError:
+            start_day = end_day = None
+        if (not from_date or start_day) and (not to_date or end_day):
+            paginator.count = stats.count(
+                kind=transaction_type.upper() or None, status=status or None,
+                start=start_day, end=end_day,
+            )
     page_number = request.GET.get('page', 1)
     page_obj = paginator.get_page(page_number)
     
     context = {
         'transactions': page_obj,
-        'total_credits': total_credits,
-        'total_debits': total_debits,
-        'pending_amount': pending_amount,
-        'total_balance': total_balance,
-        'credit_change': round(credit_change, 1),
-        'debit_change': round(debit_change, 1),
+        'total_credits': totals['total_credits'],
+        'total_debits': totals['total_debits'],
+        'pending_amount': totals['pending_amount'],
+        'total_balance': totals['total_balance'],
+        'credit_change': round(totals['credit_change'], 1),
+        'debit_change': round(totals['debit_change'], 1),
         'filter_type': transaction_type,
         'filter_status': status,
         'filter_from_date': from_date,
@@ -223,15 +189,45 @@ def wallet_transactions(request):
     return render(request, 'admin/wallet_transactions.html', context)
 
 
+WALLET_EXPORT_HEADERS = [
+    'Transaction ID', 'User', 'Email', 'Type', 'Amount', 'Balance After',
+    'Status', 'Reference', 'Description', 'Date & Time',
+]
+
+
+def _wallet_export_rows(transactions):
+    """CSV cells per transaction, read as plain tuples from a server-side cursor."""
+    rows = transactions.values_list(
+        'id', 'transaction_id', 'account__user__first_name', 'account__user__last_name',
+        'account__user__username', 'account__user__email', 'kind', 'amount',
+        'balance_after', 'status', 'reference', 'description', 'created_at',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for (pk, transaction_id, first_name, last_name, username, email, kind, amount,
+         balance_after, txn_status, reference, description, created_at) in rows:
+        yield [
+            transaction_id or f"TXN{pk}",
+            f"{first_name} {last_name}".strip() or username,
+            email,
+            kind.title(),
+            f"₹{amount}",
+            f"₹{balance_after}",
+            txn_status.title(),
+            reference or '-',
+            description or '-',
+            created_at.strftime('%b %d, %Y %I:%M %p'),
+        ]
+
+
 @staff_member_required
+@use_replica()
 def export_wallet_transactions(request):
-    """Export wallet transactions to CSV"""
+    """Stream wallet transactions as CSV (?gzip=1 for .csv.gz)"""
     transaction_type = request.GET.get('type', '')
     status = request.GET.get('status', '')
     from_date = request.GET.get('from_date', '')
     to_date = request.GET.get('to_date', '')
     
-    transactions = WalletTransaction.objects.select_related('account__user').all()
+    transactions = WalletTransaction.objects.all()
     
     # Apply filters
     if transaction_type:
@@ -247,25 +243,9 @@ def export_wallet_transactions(request):
         except ValueError:
             pass
     
-    # Create CSV response
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="wallet_transactions.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Transaction ID', 'User', 'Email', 'Type', 'Amount', 'Balance After', 'Status', 'Reference', 'Description', 'Date & Time'])
-    
-    for txn in transactions:
-        writer.writerow([
-            txn.transaction_id or f"TXN{txn.id}",
-            txn.account.user.get_full_name() or txn.account.user.username,
-            txn.account.user.email,
-            txn.kind.title(),
-            f"₹{txn.amount}",
-            f"₹{txn.balance_after}",
-            txn.status.title(),
-            txn.reference or '-',
-            txn.description or '-',
-            txn.created_at.strftime('%b %d, %Y %I:%M %p')
-        ])
-    
-    return response
+    return csv_response(
+        WALLET_EXPORT_HEADERS,
+        _wallet_export_rows(transactions),
+        "wallet_transactions.csv",
+        compress=wants_gzip(request),
+    )
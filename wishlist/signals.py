@@ -0,0 +1,18 @@
+# wishlist/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ecomerce.context_processors import invalidate_wishlist_count
+from .models import Wishlist, WishlistItem
+
+
+@receiver([post_save, post_delete], sender=WishlistItem)
+def refresh_header_wishlist_count(sender, instance, **kwargs):
+    user_id = Wishlist.objects.filter(pk=instance.wishlist_id).values_list("user_id", flat=True).first()
+    if user_id:
+        invalidate_wishlist_count(user_id)
+
+
+@receiver(post_delete, sender=Wishlist)
+def refresh_header_wishlist_count_on_wishlist_delete(sender, instance, **kwargs):
+    invalidate_wishlist_count(instance.user_id)